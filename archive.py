@@ -0,0 +1,36 @@
+"""
+Archival entry-point.
+
+``python archive.py`` moves finished events older than ``RETENTION_DAYS``
+from the database to gzipped JSON Lines files in ``ARCHIVE_DIRECTORY``. Run
+it periodically, e.g. daily. Archived events can still be replayed with
+``python replay.py --archive``. Records of webhook deliveries older than
+``DELIVERY_RETENTION_DAYS`` are deleted.
+"""
+
+import argparse
+
+from sync.factory import create_app
+from sync.archive import archive_events, prune_deliveries
+
+
+__flask_app__ = create_app()
+
+
+if __name__ == '__main__':
+    config = __flask_app__.config
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--days', type=int, default=config['RETENTION_DAYS'],
+                        help='archive events older than this many days')
+    parser.add_argument('--delivery-days', type=int,
+                        default=config['DELIVERY_RETENTION_DAYS'],
+                        help='delete deliveries older than this many days')
+    parser.add_argument('--directory', default=config['ARCHIVE_DIRECTORY'],
+                        help='where to write the archive files')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='events deleted per transaction')
+    args = parser.parse_args()
+    with __flask_app__.app_context():
+        archived = archive_events(args.directory, args.days, args.batch_size)
+        pruned = prune_deliveries(args.delivery_days, args.batch_size)
+    print(f'Archived {archived} events; deleted {pruned} deliveries')
@@ -0,0 +1,18 @@
+"""
+Asynchronous Server Gateway Interface entry-point.
+
+Run with e.g. ``uvicorn asgi:application --port 8000``; see
+:mod:`sync.asgi`. ``SIGHUP`` reloads the configuration.
+"""
+
+from sync.factory import create_app
+from sync.asgi import create_asgi_app
+from sync.services import vault
+from sync import metrics, reload
+
+
+metrics.reset_multiprocess_directory()
+__flask_app__ = create_app()
+reload.install_signal_handler(__flask_app__)
+vault.start(__flask_app__)
+application = create_asgi_app(__flask_app__)
@@ -0,0 +1,40 @@
+"""
+Backfill entry-point.
+
+``python backfill.py owner/name`` mirrors the repository's existing issues
+and comments into Jira. Progress is checkpointed after each batch, so an
+interrupted import can be resumed by running the same command again; issues
+that failed are retried. Pages fetched from GitHub are stored with their
+ETags, so that unchanged pages cost no API quota on the next run.
+"""
+
+import argparse
+
+from sync.factory import create_app
+from sync.backfill import backfill, JIRA_BULK_LIMIT
+from sync.services import database, jira
+from sync.services.github import GithubService
+
+
+__flask_app__ = create_app()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('repository', help='repository, as owner/name')
+    parser.add_argument('--batch-size', type=int, default=JIRA_BULK_LIMIT,
+                        help='issues per bulk-create request'
+                             f' (at most {JIRA_BULK_LIMIT})')
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='issues whose comments are imported at once')
+    args = parser.parse_args()
+    with __flask_app__.app_context():
+        database.create_all()
+        github = GithubService(__flask_app__.config['GITHUB_TOKEN'],
+                               __flask_app__.config['GITHUB_ENDPOINT'],
+                               etags=database.load_github_etags())
+        counts = backfill(args.repository, github, jira.get_service(),
+                          batch_size=args.batch_size,
+                          concurrency=args.concurrency)
+    for name, count in sorted(counts.items()):
+        print(f'{name}: {count}')
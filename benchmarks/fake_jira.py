@@ -0,0 +1,181 @@
+"""
+A local stand-in for the parts of the Jira REST API that we use.
+
+Responses are canned, so the server only measures our side of the round
+trip, plus any latency and faults that it is asked to inject.
+"""
+
+import json
+import random
+import re
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+from typing import Any, Optional, Tuple
+
+API = '/rest/api/2'
+
+
+class FakeJira:
+    """
+    Serves the Jira REST API on localhost, in a background thread.
+
+    Parameters
+    ----------
+    latency : float
+        Seconds added to every response.
+    throttle_every : int
+        If non-zero, every ``throttle_every``-th request gets a 429 with
+        ``Retry-After: 0``.
+    error_rate : float
+        Share of requests that fail with a 500, at random.
+
+    """
+
+    def __init__(self, latency: float = 0., throttle_every: int = 0,
+                 error_rate: float = 0., seed: int = 0) -> None:
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.error_rate = error_rate
+        self.calls: 'Counter[str]' = Counter()
+        self._random = random.Random(seed)
+        self._lock = Lock()
+        self._issues = 0
+        self._comments = 0
+        self._server = _Server(('127.0.0.1', 0), _handler(self))
+        self._thread = Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def endpoint(self) -> str:
+        return f'http://127.0.0.1:{self._server.server_address[1]}'
+
+    @property
+    def total_calls(self) -> int:
+        """All requests received, including those that were failed."""
+        return self.calls['requests']
+
+    def __enter__(self) -> 'FakeJira':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def respond(self, method: str, path: str, body: Optional[dict]) \
+            -> Tuple[int, Any]:
+        """Get the status code and body of the response to a request."""
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls['requests'] += 1
+            if self.throttle_every \
+                    and self.calls['requests'] % self.throttle_every == 0:
+                self.calls['throttled'] += 1
+                return 429, {'errorMessages': ['Rate limit exceeded']}
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.calls['error'] += 1
+                return 500, {'errorMessages': ['Injected failure']}
+        path = path.split('?', 1)[0][len(API):]
+        for pattern, route_method, name, handler in _ROUTES:
+            if method == route_method and re.fullmatch(pattern, path):
+                with self._lock:
+                    self.calls[name] += 1
+                return handler(self, path, body or {})
+        return 404, {'errorMessages': [f'No route for {method} {path}']}
+
+    def _create_issue(self, path: str, body: dict) -> Tuple[int, Any]:
+        with self._lock:
+            self._issues += 1
+            number = self._issues
+        key = f'{body["fields"]["project"]["key"]}-{number}'
+        return 201, {'id': str(number), 'key': key,
+                     'self': f'{self.endpoint}{API}/issue/{key}'}
+
+    def _create_issues(self, path: str, body: dict) -> Tuple[int, Any]:
+        issues = [self._create_issue(path, update)[1]
+                  for update in body['issueUpdates']]
+        return 201, {'issues': issues, 'errors': []}
+
+    def _get_issue(self, path: str, body: dict) -> Tuple[int, Any]:
+        key = path.rsplit('/', 1)[1]
+        return 200, {'id': key.rsplit('-', 1)[1], 'key': key,
+                     'self': f'{self.endpoint}{API}/issue/{key}',
+                     'fields': {}}
+
+    def _create_comment(self, path: str, body: dict) -> Tuple[int, Any]:
+        with self._lock:
+            self._comments += 1
+            number = self._comments
+        return 201, {'id': str(number), 'body': body.get('body'),
+                     'self': f'{self.endpoint}{API}{path}/{number}'}
+
+    def _transitions(self, path: str, body: dict) -> Tuple[int, Any]:
+        return 200, {'transitions': [
+            {'id': '151', 'name': 'Close', 'to': {'name': 'Closed'}},
+            {'id': '161', 'name': 'Reopen', 'to': {'name': 'Open'}}
+        ]}
+
+    def _issue_types(self, path: str, body: dict) -> Tuple[int, Any]:
+        return 200, [{'id': '3', 'name': 'Task',
+                      'self': f'{self.endpoint}{API}/issuetype/3'}]
+
+    def _components(self, path: str, body: dict) -> Tuple[int, Any]:
+        return 200, []
+
+    def _no_content(self, path: str, body: dict) -> Tuple[int, Any]:
+        return 204, None
+
+
+_ROUTES = [
+    (r'/issue', 'POST', 'create_issue', FakeJira._create_issue),
+    (r'/issue/bulk', 'POST', 'create_issues', FakeJira._create_issues),
+    (r'/issue/[^/]+', 'GET', 'get_issue', FakeJira._get_issue),
+    (r'/issue/[^/]+', 'PUT', 'update_issue', FakeJira._no_content),
+    (r'/issue/[^/]+/transitions', 'GET', 'get_transitions',
+     FakeJira._transitions),
+    (r'/issue/[^/]+/transitions', 'POST', 'transition', FakeJira._no_content),
+    (r'/issue/[^/]+/comment', 'POST', 'create_comment',
+     FakeJira._create_comment),
+    (r'/issue/[^/]+/comment/[^/]+', 'PUT', 'update_comment',
+     FakeJira._no_content),
+    (r'/issue/[^/]+/comment/[^/]+', 'DELETE', 'delete_comment',
+     FakeJira._no_content),
+    (r'/issuetype', 'GET', 'issue_types', FakeJira._issue_types),
+    (r'/project/[^/]+/components', 'GET', 'components', FakeJira._components),
+]
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def _handler(jira: FakeJira) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'    # Keep connections alive.
+        # Send each response in one segment, without waiting for ACKs.
+        disable_nagle_algorithm = True
+        wbufsize = -1
+
+        def _respond(self) -> None:
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            body = json.loads(raw) if raw else None
+            status, payload = jira.respond(self.command, self.path, body)
+            data = json.dumps(payload).encode() if payload is not None else b''
+            self.send_response(status)
+            if status == 429:
+                self.send_header('Retry-After', '0')
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PUT = do_DELETE = _respond
+
+        def log_message(self, *args: Any) -> None:
+            pass
+
+    return Handler
@@ -0,0 +1,63 @@
+"""
+Compare the stored size and encode/decode speed of event bodies.
+
+``python -m benchmarks.storage`` measures the full JSON payload stored as
+TEXT (:class:`.FriendlyJSONType`) against the projected, compressed payload
+(:class:`.CompressedJSONType`), using the example webhook payloads in
+``tests/data``.
+"""
+
+import argparse
+import glob
+import json
+import time
+from typing import Callable, List
+
+from sync import domain
+from sync.parse import parse_github_event
+from sync.services.database import CompressedJSONType, FriendlyJSONType
+
+EXAMPLES = 'tests/data/github/issuesevent/*.json'
+
+
+def _load_examples() -> List[dict]:
+    events = []
+    for path in sorted(glob.glob(EXAMPLES)):
+        with open(path) as f:
+            events.append(parse_github_event(
+                domain.GithubEventType.IssuesEvent, json.load(f)
+            ))
+    return events
+
+
+def _rate(func: Callable[[], object], iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return iterations / (time.perf_counter() - start)
+
+
+def main(iterations: int) -> None:
+    events = _load_examples()
+    text, compressed = FriendlyJSONType(), CompressedJSONType()
+    formats = [
+        ('text', text, lambda event: event),
+        ('compressed', compressed, domain.project_github_event)
+    ]
+    print(f'{"format":<12}{"bytes/event":>14}{"encode/s":>12}{"decode/s":>12}')
+    for name, column_type, prepare in formats:
+        stored = [column_type.process_bind_param(prepare(event), None)
+                  for event in events]
+        size = sum(len(value) for value in stored) / len(stored)
+        encode = _rate(lambda: [column_type.process_bind_param(
+            prepare(event), None) for event in events], iterations)
+        decode = _rate(lambda: [column_type.process_result_value(value, None)
+                                for value in stored], iterations)
+        print(f'{name:<12}{size:>14.0f}{encode * len(events):>12.0f}'
+              f'{decode * len(events):>12.0f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=2000)
+    main(parser.parse_args().iterations)
@@ -0,0 +1,126 @@
+"""Synthetic webhook streams, built from the payloads in ``tests/data``."""
+
+import copy
+import json
+import random
+from datetime import datetime, timedelta
+from typing import Iterator, List, NamedTuple
+
+EXAMPLE = 'tests/data/github/issuesevent/edited.json'
+
+
+class Webhook(NamedTuple):
+    """A webhook delivery, as GitHub would send it."""
+
+    path: str
+    """``/issuesevent`` or ``/issuecommentevent``."""
+    payload: dict
+    delivery_id: str
+    issue_id: int
+
+
+class _Builder:
+    def __init__(self, seed: int) -> None:
+        with open(EXAMPLE) as f:
+            self._template = json.load(f)
+        self._random = random.Random(seed)
+        self._time = datetime(2019, 6, 1)
+        self._deliveries = 0
+        self._comments = 0
+
+    def _tick(self) -> str:
+        self._time += timedelta(seconds=self._random.randint(1, 120))
+        return self._time.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    def _webhook(self, path: str, payload: dict) -> Webhook:
+        self._deliveries += 1
+        return Webhook(path, payload, f'delivery-{self._deliveries}',
+                       payload['issue']['id'])
+
+    def issue(self, issue_id: int, repository: str, action: str) -> Webhook:
+        payload = copy.deepcopy(self._template)
+        payload['action'] = action
+        payload['repository']['name'] = repository
+        issue = payload['issue']
+        issue.update(id=issue_id, number=issue_id, title=f'Issue {issue_id}',
+                     body=f'Something is wrong ({self._random.random()})',
+                     updated_at=self._tick())
+        return self._webhook('/issuesevent', payload)
+
+    def comment(self, issue_id: int, repository: str, action: str,
+                comment_id: int = 0) -> Webhook:
+        webhook = self.issue(issue_id, repository, action)
+        if not comment_id:
+            self._comments += 1
+            comment_id = self._comments
+        now = webhook.payload['issue']['updated_at']
+        webhook.payload['comment'] = {
+            'id': comment_id,
+            'body': f'Me too ({self._random.random()})',
+            'created_at': now,
+            'updated_at': now,
+            'html_url': f'https://github.com/{repository}/issues/{issue_id}',
+            'user': webhook.payload['issue']['user']
+        }
+        return webhook._replace(path='/issuecommentevent')
+
+
+def mixed(issues: int, seed: int = 0) -> List[Webhook]:
+    """Each issue is opened, commented on twice, edited and closed."""
+    build = _Builder(seed)
+    stream: List[Webhook] = []
+    for issue_id in range(1, issues + 1):
+        stream.append(build.issue(issue_id, 'Hello-World', 'opened'))
+        stream.append(build.comment(issue_id, 'Hello-World', 'created'))
+        stream.append(build.comment(issue_id, 'Hello-World', 'created'))
+        stream.append(build.issue(issue_id, 'Hello-World', 'edited'))
+        stream.append(build.issue(issue_id, 'Hello-World', 'closed'))
+    return stream
+
+
+def hot(issues: int, seed: int = 0, hot_issues: int = 5) -> List[Webhook]:
+    """A few issues get most of the comments and edits."""
+    build = _Builder(seed)
+    stream = [build.issue(issue_id, 'Hello-World', 'opened')
+              for issue_id in range(1, hot_issues + 1)]
+    comments: List[int] = []
+    for _ in range(issues * 5 - hot_issues):
+        issue_id = build._random.randint(1, hot_issues)
+        roll = build._random.random()
+        if roll < 0.5:
+            stream.append(build.comment(issue_id, 'Hello-World', 'created'))
+            comments.append(stream[-1].payload['comment']['id'])
+        elif roll < 0.7 and comments:
+            comment_id = build._random.choice(comments)
+            stream.append(build.comment(issue_id, 'Hello-World', 'edited',
+                                        comment_id))
+        else:
+            stream.append(build.issue(issue_id, 'Hello-World', 'edited'))
+    return stream
+
+
+def repos(issues: int, seed: int = 0, repositories: int = 50) \
+        -> List[Webhook]:
+    """Issues are spread over many repositories, interleaved."""
+    build = _Builder(seed)
+    stream: List[Webhook] = []
+    for issue_id in range(1, issues + 1):
+        repository = f'repo-{issue_id % repositories}'
+        stream.append(build.issue(issue_id, repository, 'opened'))
+        stream.append(build.comment(issue_id, repository, 'created'))
+    for issue_id in range(1, issues + 1):
+        repository = f'repo-{issue_id % repositories}'
+        stream.append(build.issue(issue_id, repository, 'edited'))
+        stream.append(build.comment(issue_id, repository, 'created'))
+        stream.append(build.issue(issue_id, repository, 'closed'))
+    return stream
+
+
+SCENARIOS = {'mixed': mixed, 'hot': hot, 'repos': repos}
+
+
+def partition(stream: List[Webhook], parts: int) -> Iterator[List[Webhook]]:
+    """Split a stream by issue, keeping the order of each issue's events."""
+    for part in range(parts):
+        yield [webhook for webhook in stream
+               if webhook.issue_id % parts == part]
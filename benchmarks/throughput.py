@@ -0,0 +1,245 @@
+"""
+End-to-end throughput benchmark.
+
+``python -m benchmarks.throughput`` posts synthetic webhook streams (see
+:mod:`benchmarks.streams`) to the app from :func:`sync.factory.create_app`,
+in synchronous ingest mode, with Jira replaced by :class:`.FakeJira` and a
+SQLite database (or ``--database-uri``, e.g. a local MySQL). For each
+scenario it reports events per second, p50/p99 webhook latency, Jira calls
+per event and database queries per event.
+
+Results are compared with the stored baselines in ``baselines.json``, and
+the command fails if any scenario has regressed by more than
+``--tolerance``. Baselines are stored with the parameters of their run
+(issues, concurrency, Jira latency and so on), and a result is only
+compared with a baseline of the same scenario and parameters. Run with
+``--save-baseline`` to record new baselines, e.g. after an intended change.
+Throughput and latency depend on the machine; calls and queries per event,
+and the share of webhooks answered with a 200, do not.
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import event
+
+from .fake_jira import FakeJira
+from .streams import SCENARIOS, Webhook, partition
+
+BASELINES = os.path.join(os.path.dirname(__file__), 'baselines.json')
+TOKEN = 'benchmark'
+
+LOWER_IS_BETTER = ('p50_ms', 'p99_ms')
+PER_EVENT = ('jira_calls_per_event', 'db_queries_per_event')
+"""Machine-independent measures, which must not grow by more than 0.05."""
+SHARES = ('ok_share',)
+"""Machine-independent shares, which must not drop by more than 0.01."""
+
+Params = Dict[str, Any]
+
+
+def run_params(issues: int = 100, concurrency: int = 4,
+               database_uri: Optional[str] = None, latency: float = 0.,
+               throttle_every: int = 0, error_rate: float = 0.,
+               rate_limit: float = 0.) -> Params:
+    """Describe a run, to match it with its baseline."""
+    return {
+        'issues': issues,
+        'concurrency': concurrency,
+        # Only the kind of database, since the URI may hold credentials.
+        'database': (database_uri or 'sqlite').split(':', 1)[0],
+        'latency': latency,
+        'throttle_every': throttle_every,
+        'error_rate': error_rate,
+        'rate_limit': rate_limit
+    }
+
+
+def find_baseline(baselines: Dict[str, List[dict]], scenario: str,
+                  params: Params) -> Optional[Dict[str, float]]:
+    """Get the baseline of ``scenario`` run with ``params``, if any."""
+    for baseline in baselines.get(scenario, []):
+        if baseline['params'] == params:
+            result: Dict[str, float] = baseline['result']
+            return result
+    return None
+
+
+def set_baseline(baselines: Dict[str, List[dict]], scenario: str,
+                 params: Params, result: Dict[str, float]) -> None:
+    """Record ``result`` as the baseline of ``scenario`` with ``params``."""
+    runs = [baseline for baseline in baselines.get(scenario, [])
+            if baseline['params'] != params]
+    runs.append({'params': params, 'result': result})
+    baselines[scenario] = runs
+
+
+def run_scenario(scenario: str, issues: int = 100, concurrency: int = 4,
+                 database_uri: Optional[str] = None, latency: float = 0.,
+                 throttle_every: int = 0, error_rate: float = 0.,
+                 rate_limit: float = 0.) -> Dict[str, float]:
+    """Post a scenario's webhooks to a fresh app, and measure."""
+    stream = SCENARIOS[scenario](issues)
+    with tempfile.TemporaryDirectory() as directory, \
+            FakeJira(latency, throttle_every, error_rate) as jira:
+        overrides = {
+            'SQLALCHEMY_DATABASE_URI': database_uri
+            or f'sqlite:///{os.path.join(directory, "sync.db")}',
+            'JIRA_ENDPOINT': jira.endpoint,
+            'JIRA_USERNAME': 'benchmark',
+            'JIRA_TOKEN': 'benchmark',
+            'JIRA_RATE_LIMIT': str(rate_limit),
+            'WEBHOOK_TOKEN': TOKEN,
+            'INGEST_MODE': 'sync',
+            'LOGLEVEL': '50'
+        }
+        saved = {key: os.environ.get(key) for key in overrides}
+        os.environ.update(overrides)
+        try:
+            # Imported here, so that the config above is picked up.
+            from sync.factory import create_app
+            from sync.services import database
+            app = create_app()
+        finally:
+            for key, value in saved.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        with app.app_context():
+            database.create_all()
+            engine = database.db.engine
+        queries = [0]
+        lock = Lock()
+
+        @event.listens_for(engine, 'before_cursor_execute')
+        def count(*args: object) -> None:
+            with lock:
+                queries[0] += 1
+
+        latencies: List[float] = []
+        statuses: Dict[int, int] = {}
+
+        def post(webhooks: List[Webhook]) -> None:
+            client = app.test_client()
+            for webhook in webhooks:
+                start = time.perf_counter()
+                response = client.post(
+                    f'{webhook.path}?token={TOKEN}', json=webhook.payload,
+                    headers={'X-GitHub-Delivery': webhook.delivery_id}
+                )
+                elapsed = time.perf_counter() - start
+                with lock:
+                    latencies.append(elapsed)
+                    statuses[response.status_code] \
+                        = statuses.get(response.status_code, 0) + 1
+
+        setup_queries = queries[0]
+        threads = [Thread(target=post, args=(part,))
+                   for part in partition(stream, concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+        with app.app_context():
+            database.db.drop_all()
+
+    latencies.sort()
+    return {
+        'events': len(stream),
+        'events_per_second': round(len(stream) / wall, 1),
+        'p50_ms': round(latencies[len(latencies) // 2] * 1000, 2),
+        'p99_ms': round(latencies[int(len(latencies) * .99)] * 1000, 2),
+        'jira_calls_per_event': round(jira.total_calls / len(stream), 3),
+        'db_queries_per_event': round((queries[0] - setup_queries)
+                                      / len(stream), 3),
+        'ok_share': round(statuses.get(200, 0) / len(stream), 3)
+    }
+
+
+def regressions(result: Dict[str, float], baseline: Dict[str, float],
+                tolerance: float) -> List[str]:
+    """Describe how ``result`` is worse than ``baseline``, if it is."""
+    found = []
+    for name, expected in baseline.items():
+        actual = result.get(name)
+        if actual is None or name == 'events':
+            continue
+        if name in PER_EVENT:
+            worse = actual > expected + 0.05
+        elif name in SHARES:
+            worse = actual < expected - 0.01
+        elif name in LOWER_IS_BETTER:
+            worse = actual > expected * (1 + tolerance)
+        else:
+            worse = actual < expected * (1 - tolerance)
+        if worse:
+            found.append(f'{name}: {actual} (baseline {expected})')
+    return found
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help='scenario to run (may be repeated; default all)')
+    parser.add_argument('--issues', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=4,
+                        help='webhooks posted at once')
+    parser.add_argument('--database-uri', help='default: a SQLite file')
+    parser.add_argument('--latency', type=float, default=0.,
+                        help='seconds added to each Jira response')
+    parser.add_argument('--throttle-every', type=int, default=0,
+                        help='Jira answers every Nth request with a 429')
+    parser.add_argument('--error-rate', type=float, default=0.,
+                        help='share of Jira requests that fail with a 500')
+    parser.add_argument('--rate-limit', type=float, default=0.,
+                        help='JIRA_RATE_LIMIT for the app (default off)')
+    parser.add_argument('--baseline', default=BASELINES)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative regression')
+    args = parser.parse_args()
+
+    try:
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+    failed = False
+    run = (args.issues, args.concurrency, args.database_uri, args.latency,
+           args.throttle_every, args.error_rate, args.rate_limit)
+    params = run_params(*run)
+    for scenario in args.scenario or list(SCENARIOS):
+        # A process per scenario, so that no state carries over.
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(run_scenario, scenario, *run).result()
+        print(scenario, json.dumps(result))
+        baseline = find_baseline(baselines, scenario, params)
+        if args.save_baseline:
+            set_baseline(baselines, scenario, params, result)
+        elif baseline is None:
+            print('  No baseline for these parameters')
+        else:
+            for regression in regressions(result, baseline, args.tolerance):
+                print(f'  REGRESSION {regression}')
+                failed = True
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
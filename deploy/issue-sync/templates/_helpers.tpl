@@ -0,0 +1,29 @@
+{{/*
+Environment shared by the web and worker containers.
+*/}}
+{{- define "issue-sync.env" -}}
+- name: LOGLEVEL
+  value: "{{ default "40" .Values.loglevel }}"
+- name: VAULT_ENABLED
+  value: "1"
+- name: VAULT_HOST
+  value: "{{ .Values.vault.host }}"
+- name: VAULT_PORT
+  value: "{{ .Values.vault.port }}"
+- name: VAULT_CERT
+  value: /etc/vault-certificate/vaulttls.cert.pem
+- name: VAULT_ROLE
+  value: "{{ .Values.vault.role }}-{{ .Values.namespace }}"
+- name: KUBE_TOKEN
+  value: /var/run/secrets/kubernetes.io/serviceaccount/token
+- name: SQLALCHEMY_DATABASE_HOST
+  value: "{{ .Values.database.host }}"
+- name: JIRA_ENDPOINT
+  value: "{{ .Values.jira.endpoint }}"
+- name: APPLICATION_ROOT
+  value: "{{ .Values.ingress.path }}"
+- name: NAMESPACE
+  value: "{{ .Values.namespace }}"
+- name: INGEST_MODE
+  value: "{{ default "sync" .Values.ingest_mode }}"
+{{- end -}}
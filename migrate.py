@@ -0,0 +1,63 @@
+"""
+Database upgrade entry-point.
+
+``python migrate.py`` creates missing tables, adds columns and indexes that
+are missing from existing tables, and converts events stored as full
+uncompressed JSON to the compressed, projected format. It can be run again
+safely, and while the service is running.
+
+On MySQL, ``--partition-by-month 2019-06`` partitions ``github_event`` by
+month from June 2019, and ``--add-partitions 2020-01`` adds monthly
+partitions from January 2020 to an already-partitioned table.
+"""
+
+import argparse
+from datetime import datetime
+
+from sync.factory import create_app
+from sync.services import database
+
+
+__flask_app__ = create_app()
+
+
+def _month(value: str) -> datetime:
+    return datetime.strptime(value, '%Y-%m')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--batch-size', type=int, default=500,
+                        help='events converted per transaction')
+    parser.add_argument('--partition-by-month', type=_month, metavar='YYYY-MM',
+                        help='partition github_event by month (MySQL)')
+    parser.add_argument('--add-partitions', type=_month, metavar='YYYY-MM',
+                        help='add monthly partitions from this month (MySQL)')
+    parser.add_argument('--months', type=int, default=24,
+                        help='number of monthly partitions to create')
+    args = parser.parse_args()
+    with __flask_app__.app_context():
+        database.create_all()
+        for column in database.add_missing_columns():
+            print(f'Added {column}')
+        for index in database.add_missing_indexes():
+            print(f'Added index {index}')
+        if args.partition_by_month or args.add_partitions:
+            if database.db.engine.dialect.name != 'mysql':
+                parser.error('Partitioning is only supported on MySQL')
+            if args.partition_by_month:
+                ddl = database.monthly_partitions_ddl(args.partition_by_month,
+                                                      args.months)
+            else:
+                ddl = database.add_monthly_partitions_ddl(args.add_partitions,
+                                                          args.months)
+            print(ddl)
+            database.db.session.execute(ddl)
+        converted = 0
+        while True:
+            count = database.compress_event_bodies(args.batch_size)
+            if count == 0:
+                break
+            converted += count
+            print(f'Converted {converted} events', end='\r', flush=True)
+        print(f'Converted {converted} events')
@@ -0,0 +1,70 @@
+"""
+Replay entry-point.
+
+``python replay.py --since 2019-06-01`` propagates the events stored since
+June 1st to Jira again, e.g. after an outage or a fix to event translation.
+``--dry-run`` prints the Jira call each event would make instead, as JSON
+lines. With ``--archive``, events are read from archive files (see
+``archive.py``) instead of the database.
+"""
+
+import argparse
+import json
+from datetime import datetime
+
+from pytz import UTC
+
+from sync.factory import create_app
+from sync import replay
+from sync.archive import iter_archive
+from sync.scheduler import LaneScheduler
+from sync.services import database
+
+
+__flask_app__ = create_app()
+
+
+def _date(value: str) -> datetime:
+    moment = datetime.fromisoformat(value)
+    return moment if moment.tzinfo else moment.replace(tzinfo=UTC)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--start-id', type=int, help='first event ID')
+    parser.add_argument('--end-id', type=int, help='last event ID')
+    parser.add_argument('--since', type=_date,
+                        help='replay events stored at or after this time')
+    parser.add_argument('--until', type=_date,
+                        help='replay events stored before this time')
+    parser.add_argument('--status', action='append', dest='statuses',
+                        help='only replay events with this status'
+                             ' (may be repeated)')
+    parser.add_argument('--page-size', type=int, default=500,
+                        help='events read from the database at a time')
+    parser.add_argument('--lanes', type=int,
+                        default=__flask_app__.config['PROPAGATION_LANES'],
+                        help='issues replayed in parallel')
+    parser.add_argument('--archive', nargs='+', metavar='PATH',
+                        help='replay from these archive files, in order')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='report the Jira calls without making them')
+    args = parser.parse_args()
+    with __flask_app__.app_context():
+        if args.archive:
+            events = iter_archive(args.archive, args.start_id, args.end_id,
+                                  args.since, args.until)
+        else:
+            events = database.iter_github_events(args.start_id, args.end_id,
+                                                 args.since, args.until,
+                                                 args.statuses,
+                                                 args.page_size)
+        if args.dry_run:
+            for step in replay.plan(events):
+                print(json.dumps(step))
+        else:
+            scheduler = LaneScheduler(args.lanes, __flask_app__)
+            counts = replay.replay(events, scheduler, args.page_size)
+            scheduler.shutdown()
+            for name, count in sorted(counts.items()):
+                print(f'{name}: {count}')
@@ -0,0 +1,115 @@
+"""Move old events out of ``github_event`` into compressed archive files."""
+
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from itertools import groupby
+from typing import Iterable, Iterator, Optional, Tuple
+
+from pytz import UTC
+
+from arxiv.util.serialize import ISO8601JSONDecoder
+from .domain import GithubEvent
+from .serialize import EnumJSONEncoder
+from .services import database
+
+
+def archive_events(directory: str, days: int,
+                   batch_size: int = 1000) -> int:
+    """
+    Archive finished events stored more than ``days`` days ago.
+
+    Events are written to one gzipped JSON Lines file per month, e.g.
+    ``github_event-2019-06.jsonl.gz``, and then deleted a batch at a time so
+    that no transaction holds locks for long. Each batch is appended to the
+    archive as a separate gzip member and flushed to disk before the batch is
+    deleted, so an interruption can leave an event in both places, but never
+    in neither. Events that are still queued, retrying or dead-lettered are
+    kept, as are failed events not yet scheduled for a retry.
+
+    Returns
+    -------
+    int
+        The number of events archived.
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    before = datetime.now(UTC) - timedelta(days=days)
+    archived = 0
+    while True:
+        rows = database.get_finished_events(before, batch_size)
+        if not rows:
+            return archived
+        for month, month_rows in groupby(rows, key=_month):
+            _append(os.path.join(directory, f'github_event-{month}.jsonl.gz'),
+                    month_rows)
+        archived += database.delete_events([row[0] for row in rows])
+
+
+def prune_deliveries(days: int, batch_size: int = 1000) -> int:
+    """
+    Delete the records of webhook deliveries received over ``days`` ago.
+
+    GitHub does not redeliver webhooks that old, so they are not archived.
+    """
+    before = datetime.now(UTC) - timedelta(days=days)
+    pruned = 0
+    while True:
+        deleted = database.delete_deliveries(before, batch_size)
+        pruned += deleted
+        if deleted < batch_size:
+            return pruned
+
+
+def _month(row: Tuple) -> str:
+    created: datetime = row[3]
+    return created.strftime('%Y-%m')
+
+
+def _append(path: str, rows: Iterable[Tuple]) -> None:
+    with open(path, 'ab') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            for event_id, event_type, event_action, created, status, body \
+                    in rows:
+                line = json.dumps({'event_id': event_id,
+                                   'event_type': event_type,
+                                   'event_action': event_action,
+                                   'created': created,
+                                   'status': status,
+                                   'body': body},
+                                  cls=EnumJSONEncoder,
+                                  separators=(',', ':'))
+                f.write(line.encode('utf-8') + b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+
+
+def iter_archive(paths: Iterable[str], start_id: Optional[int] = None,
+                 end_id: Optional[int] = None,
+                 since: Optional[datetime] = None,
+                 until: Optional[datetime] = None) \
+        -> Iterator[Tuple[int, GithubEvent]]:
+    """
+    Stream archived events, in the same form as
+    :func:`.database.iter_github_events`, e.g. to replay them.
+
+    Files are read in the order given, one line at a time.
+    """
+    for path in paths:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                record = json.loads(line, cls=ISO8601JSONDecoder)
+                event_id = record['event_id']
+                created = record['created']
+                if created is not None and created.tzinfo is None:
+                    created = created.replace(tzinfo=UTC)
+                if start_id is not None and event_id < start_id \
+                        or end_id is not None and event_id > end_id \
+                        or since is not None and created < since \
+                        or until is not None and created >= until:
+                    continue
+                yield event_id, database.load_github_event(
+                    record['event_type'], record['event_action'],
+                    record['body']
+                )
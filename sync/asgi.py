@@ -0,0 +1,303 @@
+"""
+Asyncio serving mode.
+
+Serves the webhook endpoints from a single event loop, so that one process
+can have hundreds of webhooks in flight while they wait on Jira. Events are
+parsed, translated and stored by the same code as in the WSGI app; only the
+call to Jira differs, going through :mod:`.services.async_jira`.
+
+SQLAlchemy (1.3) and Flask-SQLAlchemy have no asyncio support, so database
+access runs on a small thread pool (``ASGI_DB_THREADS``), each call inside an
+app context. Other endpoints, e.g. ``/deadletter``, are passed through to the
+Flask app on the same pool.
+"""
+
+import asyncio
+import io
+import json
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, \
+    Tuple, TypeVar
+from urllib.parse import parse_qs
+
+from flask import Flask
+from werkzeug.exceptions import BadRequest, Forbidden, HTTPException
+
+from . import controllers, domain, metrics
+from .serialize import EnumJSONEncoder
+from .services import async_jira, database, jira
+from .services.ratelimit import TokenBucket
+
+Scope = Dict[str, Any]
+Message = Dict[str, Any]
+Receive = Callable[[], Awaitable[Message]]
+Send = Callable[[Message], Awaitable[None]]
+T = TypeVar('T')
+
+WEBHOOKS = {
+    '/issuesevent': domain.GithubEventType.IssuesEvent,
+    '/issuecommentevent': domain.GithubEventType.IssueCommentEvent,
+}
+
+
+class AsyncApp:
+    """ASGI application wrapping a Flask app."""
+
+    def __init__(self, app: Flask) -> None:
+        self.app = app
+        self._executor = ThreadPoolExecutor(app.config['ASGI_DB_THREADS'],
+                                            thread_name_prefix='asgi-db')
+        self._jira: Optional[async_jira.AsyncJiraService] = None
+        self._closing: Set[asyncio.Future] = set()
+        """Replaced Jira clients, closing once their requests finish."""
+        self._rate_limit: Optional[TokenBucket] = None
+        self._issue_locks: Dict[int, asyncio.Lock] = {}
+        self._issue_lock_users: 'Counter[int]' = Counter()
+        with app.app_context():
+            self._breaker = jira.get_breaker()
+
+    async def __call__(self, scope: Scope, receive: Receive,
+                       send: Send) -> None:
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise NotImplementedError(f'Unsupported scope {scope["type"]}')
+
+    async def run_db(self, func: Callable[..., T], *args: Any) -> T:
+        """Call ``func`` on the database thread pool, in an app context."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self._executor,
+                                          partial(self._in_context, func,
+                                                  *args))
+
+    def _in_context(self, func: Callable[..., T], *args: Any) -> T:
+        with self.app.app_context():
+            return func(*args)
+
+    def get_jira(self) -> async_jira.AsyncJiraService:
+        """
+        Get the Jira client, creating it on first use.
+
+        As with :func:`.jira.get_service`, the client is rebuilt if the
+        endpoint or credentials in the app config have changed.
+        """
+        config = self.app.config
+        credentials = (config['JIRA_ENDPOINT'], config['JIRA_USERNAME'],
+                       config['JIRA_TOKEN'])
+        if self._jira is not None and self._jira.credentials == credentials:
+            return self._jira
+        if self._jira is not None:
+            closing = asyncio.ensure_future(self._jira.aclose())
+            self._closing.add(closing)
+            closing.add_done_callback(self._closing.discard)
+        if self._rate_limit is None and config['JIRA_RATE_LIMIT'] > 0:
+            self._rate_limit = TokenBucket(config['JIRA_RATE_LIMIT'],
+                                           config['JIRA_RATE_LIMIT_BURST'])
+        self._jira = async_jira.AsyncJiraService(
+            *credentials,
+            pool_size=config['ASGI_JIRA_POOL_SIZE'],
+            timeout=(config['JIRA_CONNECT_TIMEOUT'],
+                     config['JIRA_READ_TIMEOUT']),
+            metadata_ttl=config['JIRA_METADATA_TTL'],
+            rate_limit=self._rate_limit,
+            rate_limit_wait=config['JIRA_RATE_LIMIT_MAX_WAIT']
+        )
+        return self._jira
+
+    async def handle_webhook(self, event_type: domain.GithubEventType,
+                             raw: dict, delivery_id: Optional[str]) \
+            -> controllers.Response:
+        """Handle a webhook, as :func:`.controllers._handle_webhook` does."""
+        with metrics.timed('webhook'):
+            accepted = await self.run_db(controllers.accept_payload,
+                                         event_type, raw)
+            if isinstance(accepted, tuple):
+                return accepted
+            if delivery_id is None:
+                return await self._handle_event(accepted)
+            previous = await self.run_db(controllers.claim_delivery,
+                                         delivery_id)
+            if previous is not None:
+                return previous
+            try:
+                response = await self._handle_event(accepted, delivery_id)
+            except Exception:
+                await self.run_db(database.release_delivery, delivery_id)
+                raise
+            if response[1] != HTTPStatus.OK:
+                await self.run_db(controllers.complete_delivery, delivery_id,
+                                  response)
+            return response
+
+    async def _handle_event(self, gh_event: domain.GithubEvent,
+                            delivery_id: Optional[str] = None) \
+            -> controllers.Response:
+        if self.app.config['INGEST_MODE'] == 'async':
+            return await self.run_db(controllers.enqueue_event, gh_event)
+        # Events on an issue are propagated one at a time, in the order
+        # received, as the WSGI app does within a worker.
+        issue_id = gh_event['issue']['id']
+        lock = self._issue_locks.setdefault(issue_id, asyncio.Lock())
+        self._issue_lock_users[issue_id] += 1
+        try:
+            async with lock:
+                return await self._propagate_event(gh_event, delivery_id)
+        finally:
+            self._issue_lock_users[issue_id] -= 1
+            if not self._issue_lock_users[issue_id]:
+                del self._issue_lock_users[issue_id]
+                del self._issue_locks[issue_id]
+
+    async def _propagate_event(self, gh_event: domain.GithubEvent,
+                               delivery_id: Optional[str]) \
+            -> controllers.Response:
+        event_id: Optional[int] = None
+        try:
+            j_event, digest, unchanged = \
+                await self.run_db(controllers.prepare_event, gh_event)
+            event_id = await self.run_db(controllers.start_event, gh_event)
+            if event_id is None:
+                return controllers.queued_response()
+            propagated = j_event is not None and not unchanged
+            if propagated:
+                with self.get_jira().in_use() as service:
+                    j_event = await async_jira.propagate(
+                        service, self._breaker, j_event
+                    )
+            response = await self.run_db(controllers.finish_event, event_id,
+                                         gh_event, j_event, digest,
+                                         propagated, delivery_id)
+        except (KeyError, jira.PropagationFailed) as e:
+            return await self.run_db(controllers.handle_failure, gh_event, e,
+                                     event_id)
+        except Exception:
+            if event_id is not None:
+                await self.run_db(controllers.abandon_event, event_id)
+            raise
+        controllers.counters['propagated'] += 1
+        return response
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self._jira is not None:
+                    await self._jira.aclose()
+                await asyncio.gather(*self._closing)
+                self._executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope: Scope, receive: Receive, send: Send) -> None:
+        body = await _read_body(receive)
+        event_type = WEBHOOKS.get(scope['path'])
+        if event_type is None or scope['method'] != 'POST':
+            status, headers, content = \
+                await self.run_db(self._call_wsgi, scope, body)
+            await _respond(send, status, headers, content)
+            return
+        try:
+            data, code, extra = await self._webhook(scope, event_type, body)
+        except HTTPException as e:
+            data, code, extra = {'reason': e.description}, e.code, {}
+        except Exception:
+            self.app.logger.exception('Failed to handle webhook')
+            data, code, extra = {'reason': 'internal error'}, 500, {}
+        headers = [(b'content-type', b'application/json')]
+        headers += [(k.lower().encode('latin-1'), str(v).encode('latin-1'))
+                    for k, v in extra.items()]
+        await _respond(send, int(code), headers,
+                       json.dumps(data, cls=EnumJSONEncoder).encode('utf-8'))
+
+    async def _webhook(self, scope: Scope,
+                       event_type: domain.GithubEventType,
+                       body: bytes) -> controllers.Response:
+        query = parse_qs(scope['query_string'].decode('latin-1'))
+        token = query.get('token', [None])[0]
+        if token is None or token != self.app.config['WEBHOOK_TOKEN']:
+            raise Forbidden('Missing or invalid token')
+        try:
+            raw = json.loads(body)
+        except ValueError as e:
+            raise BadRequest('Malformed payload') from e
+        if raw is None:
+            raise BadRequest('No request payload')
+        headers = dict(scope['headers'])
+        delivery_id = headers.get(b'x-github-delivery')
+        return await self.handle_webhook(
+            event_type, raw,
+            delivery_id.decode('latin-1') if delivery_id else None
+        )
+
+    def _call_wsgi(self, scope: Scope, body: bytes) \
+            -> Tuple[int, List[Tuple[bytes, bytes]], bytes]:
+        """Call the Flask app with an ASGI request."""
+        server = scope.get('server') or ('localhost', 80)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': scope['query_string'].decode('latin-1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            key = name.decode('latin-1').upper().replace('-', '_')
+            if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                key = f'HTTP_{key}'
+            environ[key] = value.decode('latin-1')
+        started: List[Any] = []
+
+        def start_response(status: str, headers: List[Tuple[str, str]],
+                           exc_info: Any = None) -> None:
+            started[:] = [status, headers]
+
+        chunks = self.app(environ, start_response)
+        try:
+            content = b''.join(chunks)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        status, headers = started
+        return (int(status.split(' ', 1)[0]),
+                [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                 for k, v in headers],
+                content)
+
+
+async def _read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def _respond(send: Send, status: int, headers: List[Tuple[bytes, bytes]],
+                   content: bytes) -> None:
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': headers})
+    await send({'type': 'http.response.body', 'body': content})
+
+
+def create_asgi_app(app: Flask) -> AsyncApp:
+    """Serve ``app`` with the asyncio serving mode."""
+    return AsyncApp(app)
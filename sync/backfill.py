@@ -0,0 +1,215 @@
+"""Mirror a repository's existing GitHub issues and comments into Jira."""
+
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import takewhile
+from queue import Queue
+from typing import Callable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from flask import current_app
+from jira import JIRAError
+
+from .domain import GithubAction, GithubEvent, GithubEventActionType, \
+    JiraEvent
+from .parse import parse_time
+from .process import translate, content_hash
+from .services import database
+from .services.github import GithubService
+from .services.jira import JiraService, PropagationFailed
+
+JIRA_BULK_LIMIT = 50
+"""Maximum number of issues Jira accepts in one bulk-create request."""
+
+CommentMapping = Tuple[int, str, Optional[str]]
+
+
+def backfill(repository: str, github: GithubService, service: JiraService,
+             batch_size: int = JIRA_BULK_LIMIT,
+             concurrency: int = 4) -> 'Counter[str]':
+    """
+    Import the issues and comments of ``repository`` (``owner/name``).
+
+    Issues are created in Jira in batches using the bulk-create endpoint;
+    their comments (and, for closed issues, the close transition) are then
+    propagated with up to ``concurrency`` requests in flight. Each mapping
+    is stored as soon as its ticket or comment is created, and after each
+    batch the checkpoint is moved up to the first issue that failed, so an
+    interrupted import resumes without creating anything twice. Issues after
+    the checkpoint that are already mapped, e.g. because the webhook saw them
+    or an earlier run created them, get only their missing comments; they
+    are not transitioned again.
+
+    Returns
+    -------
+    :class:`.Counter`
+        Number of issues and comments imported, skipped and failed.
+
+    """
+    counts: 'Counter[str]' = Counter()
+    batch_size = min(batch_size, JIRA_BULK_LIMIT)
+    meta = github.get_repository(repository)
+    checkpoint = database.get_backfill_checkpoint(repository)
+    held = False    # Whether an issue has failed, holding the checkpoint.
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for batch in _batches(github.list_issues(repository), checkpoint,
+                              batch_size, counts):
+            failed = _import_batch(repository, meta, batch, github, service,
+                                   pool, counts)
+            database.store_github_etags(github.pop_updated())
+            done = list(takewhile(lambda issue: issue['number'] not in failed,
+                                  batch))
+            if done and not held:
+                database.set_backfill_checkpoint(repository,
+                                                 done[-1]['number'])
+                current_app.logger.info('Imported %s up to issue #%i',
+                                        repository, done[-1]['number'])
+            held = held or bool(failed)
+    return counts
+
+
+def _batches(issues: Iterable[dict], checkpoint: int, batch_size: int,
+             counts: 'Counter[str]') -> Iterator[List[dict]]:
+    """Group the issues after the checkpoint into batches."""
+    batch: List[dict] = []
+    for issue in issues:
+        if issue['number'] <= checkpoint:
+            counts['issues_skipped'] += 1
+            continue
+        batch.append(issue)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _import_batch(repository: str, meta: dict, issues: List[dict],
+                  github: GithubService, service: JiraService,
+                  pool: ThreadPoolExecutor, counts: 'Counter[str]') \
+        -> Set[int]:
+    """Import a batch of issues, and get the numbers of any that failed."""
+    failed: Set[int] = set()
+    gh_events = []
+    resumed = []
+    for issue in issues:
+        issue_key = database.get_jira_issue_key(issue['id'])
+        if issue_key is None:
+            gh_events.append(_event(meta, GithubAction.opened, issue))
+            continue
+        counts['issues_skipped'] += 1
+        comments = [comment for comment
+                    in github.list_comments(repository, issue['number'])
+                    if database.get_jira_comment_id(comment['id']) is None]
+        resumed.append((issue, issue_key, None, comments))
+    j_events = service.create_tickets([translate(e) for e in gh_events]) \
+        if gh_events else []
+
+    created = []
+    for gh_event, j_event in zip(gh_events, j_events):
+        if j_event['issue'].get('key'):
+            created.append((gh_event, j_event))
+        else:
+            failed.add(gh_event['issue']['number'])
+    counts['issues_created'] += len(created)
+    counts['issues_failed'] += len(gh_events) - len(created)
+    database.store_issue_mappings([
+        (gh_event['issue']['id'], j_event['issue']['key'],
+         content_hash(j_event))
+        for gh_event, j_event in created
+    ])
+
+    # Transitions are translated here, since translating needs the app.
+    jobs = resumed + [
+        (gh_event['issue'], j_event['issue']['key'],
+         translate(_event(meta, GithubAction.closed, gh_event['issue']),
+                   issue_key=j_event['issue']['key'])
+         if gh_event['issue'].get('state') == 'closed' else None,
+         None)
+        for gh_event, j_event in created
+    ]
+    # The database is only used from this thread; the comment mappings are
+    # handed back as they are created, and None when an issue is finished.
+    mappings: 'Queue[Optional[CommentMapping]]' = Queue()
+    futures = {
+        pool.submit(_import_comments, repository, meta, issue, issue_key,
+                    close, comments, github, service, mappings.put):
+        issue['number']
+        for issue, issue_key, close, comments in jobs
+    }
+    unfinished = len(futures)
+    while unfinished:
+        mapping = mappings.get()
+        if mapping is None:
+            unfinished -= 1
+        else:
+            database.store_comment_mapping(*mapping)
+    for future, number in futures.items():
+        issue_counts = future.result()
+        counts.update(issue_counts)
+        if any(key.endswith('_failed') for key in issue_counts):
+            failed.add(number)
+    return failed
+
+
+def _import_comments(repository: str, meta: dict, issue: dict,
+                     issue_key: str, close: Optional[JiraEvent],
+                     comments: Optional[Iterable[dict]],
+                     github: GithubService, service: JiraService,
+                     store: Callable[[Optional[CommentMapping]], None]) \
+        -> 'Counter[str]':
+    """
+    Propagate the comments on one issue, in order, then close it.
+
+    Unless ``comments`` are given, all of the issue's comments are listed.
+    Each new mapping is passed to ``store``, and then ``None`` at the end.
+    """
+    counts: 'Counter[str]' = Counter()
+    try:
+        if comments is None:
+            comments = github.list_comments(repository, issue['number'])
+        for comment in comments:
+            gh_comment = _event(meta, GithubAction.created, issue, comment)
+            j_comment = translate(gh_comment, issue_key=issue_key)
+            try:
+                j_comment = service.create_comment(j_comment)
+            except (PropagationFailed, JIRAError):
+                counts['comments_failed'] += 1
+                continue
+            store((comment['id'], j_comment['comment']['id'],
+                   content_hash(j_comment)))
+            counts['comments_created'] += 1
+        if close is not None:
+            try:
+                service.transition_ticket(close)
+            except (PropagationFailed, JIRAError):
+                counts['transitions_failed'] += 1
+    finally:
+        store(None)
+    return counts
+
+
+def _event(meta: dict, action: GithubAction, issue: dict,
+           comment: Optional[dict] = None) -> GithubEvent:
+    """Dress up an issue or comment from the API as a webhook event."""
+    event_type = GithubEventActionType((
+        GithubEventActionType.comment_created.value[0] if comment
+        else GithubEventActionType.issue_opened.value[0],
+        action
+    ))
+    gh_event: GithubEvent = {
+        'action': action.value,
+        'event_type': event_type,
+        'repository': {'id': meta['id'], 'name': meta['name']},
+        'issue': _with_times(issue)
+    }
+    if comment is not None:
+        gh_event['comment'] = _with_times(comment)
+    return gh_event
+
+
+def _with_times(resource: dict) -> dict:
+    resource = dict(resource, body=resource.get('body') or '')
+    for field in ('created_at', 'updated_at'):
+        if isinstance(resource.get(field), str):
+            resource[field] = parse_time(resource[field])
+    return resource
@@ -0,0 +1,86 @@
+"""A small thread-safe LRU cache with TTLs and negative entries."""
+
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Hashable, Optional, Tuple
+
+from . import metrics
+
+MISSING = object()
+"""Returned by :meth:`LRUCache.get` when there is no usable entry."""
+
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache.
+
+    Entries expire after ``ttl`` seconds. Negative entries, recorded with
+    :meth:`set_missing`, cache the fact that a key has no value and expire
+    after the (usually much shorter) ``negative_ttl``. A ``maxsize`` of zero
+    disables the cache. If the cache has a ``name``, hits and misses are
+    exported as metrics.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.,
+                 negative_ttl: float = 5., name: Optional[str] = None) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Get the cached value for ``key``.
+
+        Returns ``None`` for a live negative entry, and :data:`MISSING` if
+        the key is not cached or has expired.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                if self.name is not None:
+                    metrics.child(metrics.cache_requests, self.name,
+                                  'miss').inc()
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            if self.name is not None:
+                metrics.child(metrics.cache_requests, self.name, 'hit').inc()
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Cache ``value`` for ``key``."""
+        self._put(key, value, self.ttl)
+
+    def set_missing(self, key: Hashable) -> None:
+        """Record that ``key`` currently has no value."""
+        self._put(key, None, self.negative_ttl)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop the entry for ``key``, if any."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def _put(self, key: Hashable, value: Any, ttl: float) -> None:
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
@@ -0,0 +1,93 @@
+"""Collapse bursts of queued edits into the latest state."""
+
+from datetime import datetime
+from typing import Dict, Hashable, List, Optional, Sequence, Set, Tuple
+
+from pytz import UTC
+from typing_extensions import Protocol
+
+COALESCED_ACTIONS = ('edited', 'deleted')
+"""Actions that replace the state written by earlier edits."""
+
+
+class QueuedEvent(Protocol):
+    """The columns of a queued event that coalescing depends on."""
+
+    event_id: int
+    event_type: str
+    event_action: str
+    issue_id: Optional[int]
+    comment_id: Optional[int]
+    created: datetime
+
+
+def edit_key(event: QueuedEvent) -> Optional[Hashable]:
+    """
+    Get the key of the resource changed by an edit or delete.
+
+    Returns ``None`` for events that are never coalesced.
+    """
+    if event.event_action not in COALESCED_ACTIONS:
+        return None
+    if event.event_type == 'IssueCommentEvent':
+        return ('comment', event.comment_id)
+    return ('issue', event.issue_id)
+
+
+def coalesce(events: Sequence[QueuedEvent],
+             latest: Dict[Hashable, QueuedEvent],
+             cutoff: datetime,
+             held_issues: Optional[Set[int]] = None) \
+        -> Tuple[List[QueuedEvent], List[QueuedEvent], List[QueuedEvent]]:
+    """
+    Decide which queued events to propagate now.
+
+    Once an edit is held, every later event on the same issue is held too,
+    so that events on an issue are still propagated in the order received.
+
+    Parameters
+    ----------
+    events : sequence
+        Pending events, oldest first.
+    latest : dict
+        The most recent pending edit or delete for each :func:`edit_key` in
+        ``events``, which may not itself be in ``events``.
+    cutoff : datetime
+        Edits received after this time are still inside the debounce window.
+    held_issues : set
+        Issues with a held event. Issues held in this call are added, so that
+        the set can be passed on to a call with the events that follow.
+
+    Returns
+    -------
+    tuple
+        Events to propagate, events to leave pending because their resource
+        is still being edited, and edits superseded by a later edit or delete.
+
+    """
+    ready: List[QueuedEvent] = []
+    held: List[QueuedEvent] = []
+    superseded: List[QueuedEvent] = []
+    if held_issues is None:
+        held_issues = set()
+    for event in events:
+        key = edit_key(event)
+        newest = latest.get(key) if key is not None else None
+        if newest is not None and event.event_id != newest.event_id \
+                and event.event_action == 'edited':
+            superseded.append(event)
+        elif event.issue_id in held_issues:
+            held.append(event)
+        elif newest is not None and event.event_action == 'edited' \
+                and _utc(newest.created) > cutoff:
+            held.append(event)
+            held_issues.add(event.issue_id)
+        else:
+            ready.append(event)
+    return ready, held, superseded
+
+
+def _utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value
@@ -2,6 +2,16 @@ from os import environ
 
 LOGLEVEL = int(environ.get('LOGLEVEL', '40'))
 
+CONFIG_FILE = environ.get('CONFIG_FILE')
+"""
+Optional Python file of settings that override these.
+
+Read at startup and again when the configuration is reloaded (see
+:mod:`sync.reload`), e.g. from a mounted ConfigMap. This is the only source
+of settings that can be reloaded: the environment of a running process
+does not change, and Vault secrets are refreshed separately.
+"""
+
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 SQLALCHEMY_DATABASE_URI = environ.get('SQLALCHEMY_DATABASE_URI',
                                       'sqlite:///:memory:')
@@ -9,6 +19,90 @@ SQLALCHEMY_DATABASE_URI = environ.get('SQLALCHEMY_DATABASE_URI',
 JIRA_ENDPOINT = environ.get('JIRA_ENDPOINT')
 JIRA_USERNAME = environ.get('JIRA_USERNAME')
 JIRA_TOKEN = environ.get('JIRA_TOKEN')
+JIRA_POOL_SIZE = int(environ.get('JIRA_POOL_SIZE', '10'))
+"""Maximum number of keep-alive connections to Jira per process."""
+
+JIRA_CONNECT_TIMEOUT = float(environ.get('JIRA_CONNECT_TIMEOUT', '5'))
+"""Seconds to wait when connecting to Jira."""
+
+JIRA_READ_TIMEOUT = float(environ.get('JIRA_READ_TIMEOUT', '30'))
+"""Seconds to wait for a response from Jira."""
+
+JIRA_MAX_RETRIES = int(environ.get('JIRA_MAX_RETRIES', '0'))
+"""
+Retries performed by the Jira client on connection errors.
+
+Off by default: the circuit breaker and the retry queue already retry
+failed events, without blocking a request. The client sleeps between its
+own retries, about 10 seconds doubling each time (at most 60), so a single
+call to an unreachable Jira can block for over a minute with 3 retries.
+"""
+
+JIRA_RATE_LIMIT = float(environ.get('JIRA_RATE_LIMIT', '10'))
+"""
+Maximum sustained requests per second to Jira from each process; 0 disables.
+
+The actual rate adapts downward when Jira responds with 429s.
+"""
+
+JIRA_RATE_LIMIT_BURST = float(environ.get('JIRA_RATE_LIMIT_BURST', '20'))
+"""Number of requests that may be sent to Jira in a burst."""
+
+JIRA_RATE_LIMIT_MAX_WAIT = float(environ.get('JIRA_RATE_LIMIT_MAX_WAIT', '30'))
+"""Maximum seconds a request waits for the Jira rate limit."""
+
+JIRA_BREAKER_FAILURE_RATE = float(environ.get('JIRA_BREAKER_FAILURE_RATE',
+                                              '0.5'))
+"""Share of recent Jira calls that must fail for the circuit to open."""
+
+JIRA_BREAKER_WINDOW = int(environ.get('JIRA_BREAKER_WINDOW', '20'))
+"""Number of recent Jira calls considered by the circuit breaker."""
+
+JIRA_BREAKER_MIN_CALLS = int(environ.get('JIRA_BREAKER_MIN_CALLS', '5'))
+"""Minimum number of recent calls before the circuit can open."""
+
+JIRA_BREAKER_RESET_TIMEOUT = float(environ.get('JIRA_BREAKER_RESET_TIMEOUT',
+                                               '30'))
+"""Seconds the circuit stays open before a probe call is allowed."""
+
+JIRA_METADATA_TTL = float(environ.get('JIRA_METADATA_TTL', '3600'))
+"""Seconds to cache Jira components, issue types and transitions."""
+
+JIRA_CLOSED_TRANSITION = environ.get('JIRA_CLOSED_TRANSITION', '151')
+"""
+Transition used to close an issue; an ID, or a transition or target status
+name.
+
+IDs are sent as they are, and differ between Jira instances. Names (e.g.
+``Done``) are resolved to IDs from the transitions Jira offers for each
+project, so they work across projects with different workflows.
+"""
+
+JIRA_OPEN_TRANSITION = environ.get('JIRA_OPEN_TRANSITION', '161')
+"""Transition used to reopen an issue; see ``JIRA_CLOSED_TRANSITION``."""
+
+JIRA_PROJECT = environ.get('JIRA_PROJECT', 'ARXIVNG')
+"""Key of the Jira project used unless a routing rule says otherwise."""
+
+JIRA_ISSUETYPE = environ.get('JIRA_ISSUETYPE', 'Task')
+"""Jira issue type (name or ID) used unless a routing rule says otherwise."""
+
+JIRA_ASSIGNEE_FIELD = environ.get('JIRA_ASSIGNEE_FIELD', 'name')
+"""
+How routing rules identify assignees: ``name`` (Jira Server) or
+``accountId`` (Jira Cloud, which does not accept user names).
+"""
+
+ROUTING_RULES = environ.get('ROUTING_RULES')
+"""
+Path to a JSON file of rules for routing GitHub issues in Jira.
+
+The file contains ``{"defaults": {...}, "rules": [...]}``. Each rule may
+match on ``repository``, ``label`` and ``action`` (as named in
+:class:`.domain.GithubEventActionType`), and sets any of ``project``,
+``issuetype``, ``component`` and ``assignee``. See :mod:`sync.rules`.
+"""
+
 JIRA_COMPONENTS = {
     'arxiv-auth': '16109',    # Authentication
     'arxiv-references': '15800',    # References
@@ -30,9 +124,134 @@ JIRA_COMPONENTS = {
     'arxiv-external-links': '16105',
     'arxiv-authors': '16014',
 }
+"""Jira component for each repository; an ID or a component name."""
+
+MAPPING_CACHE_SIZE = int(environ.get('MAPPING_CACHE_SIZE', '10000'))
+"""Max GitHub->Jira issue (and comment) mappings cached; 0 disables."""
+
+MAPPING_CACHE_TTL = float(environ.get('MAPPING_CACHE_TTL', '3600'))
+"""Seconds for which a known mapping is cached."""
+
+MAPPING_CACHE_NEGATIVE_TTL = float(environ.get('MAPPING_CACHE_NEGATIVE_TTL',
+                                               '5'))
+"""Seconds for which the absence of a mapping is cached."""
 
 WEBHOOK_TOKEN = environ.get('WEBHOOK_TOKEN')
 
+GITHUB_TOKEN = environ.get('GITHUB_TOKEN')
+"""Token for the GitHub API, used to import existing issues."""
+
+GITHUB_ENDPOINT = environ.get('GITHUB_ENDPOINT', 'https://api.github.com')
+"""Base URL of the GitHub API."""
+
+EVENT_ALLOW = environ.get('EVENT_ALLOW', '')
+"""
+Comma-separated ``repository:event`` rules for events to handle.
+
+E.g. ``arxiv-search:*,*:issue_opened``. Either part may be ``*``; events are
+named as in :class:`.domain.GithubEventActionType`. If empty, all events
+that can be translated are handled.
+"""
+
+EVENT_DENY = environ.get('EVENT_DENY', '')
+"""Comma-separated ``repository:event`` rules for events to ignore."""
+
+AUDIT_ALL_EVENTS = bool(int(environ.get('AUDIT_ALL_EVENTS', '0')))
+"""Store ignored events in ``github_event`` (with status ``ignored``)."""
+
+INGEST_MODE = environ.get('INGEST_MODE', 'sync')
+"""
+Either ``sync`` or ``async``.
+
+In ``sync`` mode events are propagated to Jira inside the webhook request. In
+``async`` mode the webhook only enqueues the event in the ``github_event``
+table and returns 202; ``worker.py`` propagates it.
+
+``worker.py`` must run in ``sync`` mode too: events queued while Jira is
+unavailable, or released once the issue they wait for is mapped, are left
+for it to propagate.
+"""
+
+ASGI_DB_THREADS = int(environ.get('ASGI_DB_THREADS', '10'))
+"""
+Threads for database access when serving with ``asgi.py``.
+
+Bounds the number of concurrent database operations in the process; keep it
+at or below the SQLAlchemy pool size.
+"""
+
+ASGI_JIRA_POOL_SIZE = int(environ.get('ASGI_JIRA_POOL_SIZE', '100'))
+"""Maximum concurrent connections to Jira when serving with ``asgi.py``."""
+
+WORKER_BATCH_SIZE = int(environ.get('WORKER_BATCH_SIZE', '20'))
+"""Maximum number of queued events claimed by the worker at once."""
+
+WORKER_CLAIM_TIMEOUT = float(environ.get('WORKER_CLAIM_TIMEOUT', '600'))
+"""
+Seconds after which an event claimed by a worker is retried if not done.
+
+Covers workers that die mid-batch; keep it well above the time a batch takes.
+"""
+
+WORKER_POLL_INTERVAL = float(environ.get('WORKER_POLL_INTERVAL', '1.0'))
+"""Seconds the worker sleeps when the queue is empty."""
+
+WORKER_METRICS_PORT = int(environ.get('WORKER_METRICS_PORT', '0'))
+"""Port on which ``worker.py`` serves Prometheus metrics; 0 to not serve."""
+
+COALESCE_WINDOW = float(environ.get('COALESCE_WINDOW', '10'))
+"""
+Debounce window for queued edits, in seconds; 0 disables coalescing.
+
+Edits to an issue or comment are only propagated once it has not been edited
+for this long, and only the latest edit is sent to Jira.
+"""
+
+RETRY_MAX_ATTEMPTS = int(environ.get('RETRY_MAX_ATTEMPTS', '8'))
+"""Attempts made to propagate an event before it is dead-lettered."""
+
+RETRY_BASE_DELAY = float(environ.get('RETRY_BASE_DELAY', '30'))
+"""Seconds before the first retry; doubles with each further attempt."""
+
+RETRY_MAX_DELAY = float(environ.get('RETRY_MAX_DELAY', '3600'))
+"""Upper bound on the delay between retries, in seconds."""
+
+RETENTION_DAYS = int(environ.get('RETENTION_DAYS', '90'))
+"""Days after which finished events are moved to the archive."""
+
+ARCHIVE_DIRECTORY = environ.get('ARCHIVE_DIRECTORY', 'archive')
+"""Local directory or mounted volume to which old events are archived."""
+
+DELIVERY_CLAIM_TTL = float(environ.get('DELIVERY_CLAIM_TTL', '300'))
+"""
+Seconds after which an unfinished claim on a webhook delivery lapses.
+
+A redelivery after this is handled again, in case the process that claimed
+the original delivery died. Keep it above the longest time a webhook may
+take.
+"""
+
+DELIVERY_RETENTION_DAYS = int(environ.get('DELIVERY_RETENTION_DAYS', '7'))
+"""Days for which delivery IDs are kept to detect redeliveries."""
+
+WAITING_MAX_EVENTS = int(environ.get('WAITING_MAX_EVENTS', '1000'))
+"""
+Most comment events held at once until their issue is mapped.
+
+Beyond this, such events are retried with backoff instead.
+"""
+
+WAITING_TIMEOUT = float(environ.get('WAITING_TIMEOUT', '300'))
+"""Seconds a comment event waits for its issue before it is retried."""
+
+PROPAGATION_LANES = int(environ.get('PROPAGATION_LANES', '4'))
+"""
+Number of parallel lanes used by the worker to propagate events.
+
+Events are assigned to lanes by GitHub issue ID, so that events for the same
+issue reach Jira in order.
+"""
+
 NAMESPACE = environ.get('NAMESPACE')
 """Namespace in which this service is deployed; to qualify keys for secrets."""
 
@@ -59,6 +278,12 @@ VAULT_CERT = environ.get('VAULT_CERT')
 VAULT_SCHEME = environ.get('VAULT_SCHEME', 'https')
 """Default is ``https``."""
 
+VAULT_REFRESH_INTERVAL = float(environ.get('VAULT_REFRESH_INTERVAL', '10'))
+"""Seconds between checks for secrets that are due for renewal."""
+
+VAULT_RENEW_MARGIN = int(environ.get('VAULT_RENEW_MARGIN', '300'))
+"""Renew leases on secrets this many seconds before they expire."""
+
 VAULT_REQUESTS = [
     {'type': 'generic',
      'name': 'WEBHOOK_TOKEN',
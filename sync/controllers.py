@@ -1,72 +1,420 @@
-from typing import Optional
+from collections import Counter
+from typing import Optional, Tuple, Union
 from pprint import pprint
 from http import HTTPStatus
 
 from flask import current_app
-from werkzeug.exceptions import BadRequest, InternalServerError
+from werkzeug.exceptions import BadRequest, NotFound, HTTPException
 
-from . import domain
+from . import domain, metrics, reload, retry
+from .cache import LRUCache, MISSING
 from .parse import parse_github_event, ParseFailed
 from .services import database, jira
-from .process import translate
+from .process import translate, content_hash
 
+Response = Tuple[dict, HTTPStatus, dict]
 
-def handle_issuesevent(raw: Optional[dict]) -> None:
+
+class MissingParent(jira.PropagationFailed):
+    """A comment event arrived before its issue was mapped to Jira."""
+
+
+counters: 'Counter[str]' = metrics.Counts(metrics.outcomes)
+"""Counts of notable outcomes, e.g. ``jira_writes_avoided``."""
+
+recent_deliveries = LRUCache(maxsize=1024, ttl=3600, name='deliveries')
+"""Responses to recently completed deliveries, keyed by delivery ID."""
+
+
+def handle_issuesevent(raw: Optional[dict],
+                       delivery_id: Optional[str] = None) -> Response:
     """Handle an IssuesEvent from GitHub."""
     if raw is None:
         raise BadRequest('No request payload')
-    return _handle_event(domain.GithubEventType.IssuesEvent, raw)
+    return _handle_webhook(domain.GithubEventType.IssuesEvent, raw,
+                           delivery_id)
 
 
-def handle_issuecommentevent(raw: dict) -> None:
+def handle_issuecommentevent(raw: dict,
+                             delivery_id: Optional[str] = None) -> Response:
     """Handle an IssueCommentEvent from GitHub."""
     current_app.logger.debug('Got IssueCommentEvent with action %s',
                              raw['action'])
-    return _handle_event(domain.GithubEventType.IssueCommentEvent, raw)
+    return _handle_webhook(domain.GithubEventType.IssueCommentEvent, raw,
+                           delivery_id)
 
 
-def _handle_event(event_type: domain.GithubEventType, raw: dict) -> None:
-    issue_key: Optional[str] = None
-    comment_id: Optional[str] = None
+def _handle_webhook(event_type: domain.GithubEventType, raw: dict,
+                    delivery_id: Optional[str]) -> Response:
+    with metrics.timed('webhook'):
+        return _handle_payload(event_type, raw, delivery_id)
+
+
+def _handle_payload(event_type: domain.GithubEventType, raw: dict,
+                    delivery_id: Optional[str]) -> Response:
+    accepted = accept_payload(event_type, raw)
+    if isinstance(accepted, tuple):
+        return accepted
+    return _handle_delivery(delivery_id, accepted)
 
+
+def accept_payload(event_type: domain.GithubEventType, raw: dict) \
+        -> Union[domain.GithubEvent, Response]:
+    """
+    Parse a webhook payload, and decide whether it should be propagated.
+
+    Returns the parsed event if so, or else the response to the webhook.
+    Shared by the WSGI and ASGI request paths.
+
+    Raises
+    ------
+    :class:`BadRequest`
+        If the payload is malformed.
+
+    """
     try:
-        gh_event = parse_github_event(event_type, raw)
+        with metrics.timed('parse'):
+            gh_event = parse_github_event(event_type, raw)
     except ValueError as e:
         current_app.logger.error('Bad payload: %s', e)
         raise BadRequest('Malformed payload') from e
     except ParseFailed as e:
         current_app.logger.error('Could not parse payload: %s', raw)
         return {'reason': 'could not parse payload'}, HTTPStatus.ACCEPTED, {}
+    metrics.child(metrics.events, event_type.value, raw['action']).inc()
 
-    database.store_github_event(gh_event)
+    # Drop events that we would not propagate before doing any I/O.
+    if not current_app.extensions['event_router'].accepts(gh_event):
+        current_app.logger.debug('Ignoring %s event',
+                                 gh_event['event_type'].name)
+        counters['ignored_events'] += 1
+        if current_app.config['AUDIT_ALL_EVENTS']:
+            database.store_github_event(gh_event, status=database.IGNORED)
+        return {'result': 'ignored'}, HTTPStatus.ACCEPTED, {}
+    return gh_event
 
-    # Load the Jira issue key/comment ID if this is related to an existing
-    # resource.
+
+def _handle_delivery(delivery_id: Optional[str],
+                     gh_event: domain.GithubEvent) -> Response:
+    """
+    Handle a webhook delivery at most once.
+
+    GitHub redelivers webhooks that time out, identifying each delivery with
+    the ``X-GitHub-Delivery`` header. A delivery is claimed before any other
+    work is done; a redelivery gets the response to the original delivery
+    (or a 202 if it is still in progress) instead of being processed again.
+    Deliveries that fail with an error are released, so that they can be
+    redelivered.
+    """
+    if delivery_id is None:
+        return _handle_event(gh_event)
+    previous = claim_delivery(delivery_id)
+    if previous is not None:
+        return previous
     try:
-        if 'id' in gh_event['issue']:
-            issue_key = database.get_jira_issue_key(gh_event['issue']['id'])
-            current_app.logger.debug('Loaded issue key %s', issue_key)
-        if 'comment' in gh_event and 'id' in gh_event['comment']:
-            comment_id = database.get_jira_comment_id(gh_event['comment']['id'])
-            current_app.logger.debug('Loaded comment id %s', comment_id)
-    except KeyError as e:
-        raise BadRequest('Malformed request payload') from e
+        response = _handle_event(gh_event, delivery_id)
+    except Exception:
+        database.release_delivery(delivery_id)
+        raise
+    if response[1] != HTTPStatus.OK:
+        # Propagated events are recorded with their delivery by finish_event.
+        complete_delivery(delivery_id, response)
+    return response
 
-    # Action!
+
+def claim_delivery(delivery_id: str) -> Optional[Response]:
+    """Claim a delivery, or get the response to an earlier one."""
+    previous = recent_deliveries.get(delivery_id)
+    if previous is MISSING:
+        previous = database.claim_delivery(
+            delivery_id,
+            current_app.config['DELIVERY_CLAIM_TTL']
+        )
+    if previous is None:
+        return None
+    current_app.logger.info('Duplicate delivery %s', delivery_id)
+    counters['duplicate_deliveries'] += 1
+    data, code = previous
+    return data, code, {}
+
+
+def complete_delivery(delivery_id: str, response: Response) -> None:
+    """Record the response to a claimed delivery, for redeliveries."""
+    data, code, _ = response
+    database.record_delivery(delivery_id, data, code)
+    recent_deliveries.set(delivery_id, (data, code))
+
+
+def _handle_event(gh_event: domain.GithubEvent,
+                  delivery_id: Optional[str] = None) -> Response:
+    if current_app.config['INGEST_MODE'] == 'async':
+        return enqueue_event(gh_event)
+
+    # No transaction is open while Jira is called: the event is stored first,
+    # and its outcome recorded in a second, short transaction.
+    event_id: Optional[int] = None
     try:
-        j_event = jira.propagate(translate(gh_event, issue_key, comment_id))
-    except jira.PropagationFailed as e:
-        current_app.logger.error('Failed to propagate event: %s', e)
-        raise InternalServerError('Failed to propagate event') from e
+        j_event, digest, unchanged = prepare_event(gh_event)
+        event_id = start_event(gh_event)
+        if event_id is None:
+            return queued_response()
+        propagated = j_event is not None and not unchanged
+        if propagated:
+            j_event = jira.propagate(j_event)
+        response = finish_event(event_id, gh_event, j_event, digest,
+                                propagated, delivery_id)
+    except (KeyError, jira.PropagationFailed) as e:
+        return handle_failure(gh_event, e, event_id)
+    except Exception:
+        if event_id is not None:
+            abandon_event(event_id)
+        raise
+    counters['propagated'] += 1
+    return response
+
+
+def start_event(gh_event: domain.GithubEvent) -> Optional[int]:
+    """
+    Store an event as being propagated, before calling Jira.
+
+    If the process dies before :func:`finish_event`, the claim on the event
+    lapses after ``WORKER_CLAIM_TIMEOUT`` seconds and the worker retries it.
+
+    If an earlier event on the same issue is not yet done, e.g. it is to be
+    retried, the event is queued behind it for the worker instead, and
+    ``None`` is returned.
+    """
+    event_id = database.store_github_event(
+        gh_event, status=database.PROCESSING, attempts=1,
+        claim_timeout=current_app.config['WORKER_CLAIM_TIMEOUT']
+    )
+    if database.has_earlier_events(event_id, gh_event['issue']['id']):
+        current_app.logger.info('Queued event %s behind earlier events on'
+                                ' its issue', event_id)
+        database.release_event(event_id)
+        return None
+    return event_id
+
+
+def queued_response() -> Response:
+    """Respond to a webhook whose event was queued for the worker."""
+    counters['queued'] += 1
+    return {'result': 'queued'}, HTTPStatus.ACCEPTED, {}
+
+
+def finish_event(event_id: int, gh_event: domain.GithubEvent,
+                 j_event: Optional[domain.JiraEvent], digest: Optional[str],
+                 propagated: bool, delivery_id: Optional[str] = None) \
+        -> Response:
+    """
+    Store the outcome of a propagated event in a single transaction.
+
+    If the event came with a claimed ``delivery_id``, the response to the
+    webhook is recorded in the same transaction, so that a redelivery never
+    propagates an event that is already done.
+    """
+    response = {'result': j_event}, HTTPStatus.OK, {}
+    with database.unit_of_work():
+        if propagated:
+            record_propagation(gh_event, j_event, digest)
+        elif j_event is not None:
+            current_app.logger.debug('Content unchanged; skipping Jira write')
+            counters['jira_writes_avoided'] += 1
+        database.set_event_status(event_id, database.DONE)
+        if delivery_id is not None:
+            database.record_delivery(delivery_id, response[0], response[1])
+    if delivery_id is not None:
+        recent_deliveries.set(delivery_id, (response[0], response[1]))
+    return response
+
+
+def enqueue_event(gh_event: domain.GithubEvent) -> Response:
+    """Queue an event for the worker."""
+    database.enqueue_github_event(gh_event)
+    return queued_response()
+
+
+def abandon_event(event_id: int) -> None:
+    """
+    Forget an event stored by :func:`start_event` that failed unexpectedly.
 
-    # Store any new mappings.
+    The delivery is released, so a redelivery is handled afresh.
+    """
+    database.db.session.rollback()
+    database.delete_events([event_id])
+
+
+def handle_failure(gh_event: domain.GithubEvent, error: Exception,
+                   event_id: Optional[int] = None) -> Response:
+    """
+    Store an event that could not be propagated, and decide what happens next.
+
+    Shared by the WSGI and ASGI request paths. If the event was stored by
+    :func:`start_event`, pass its ``event_id``.
+
+    Raises
+    ------
+    :class:`BadRequest`
+        If the event is missing required data.
+
+    """
+    if isinstance(error, jira.JiraUnavailable):
+        # Park the event for the worker rather than losing it.
+        current_app.logger.error('Jira unavailable; queued event: %s', error)
+        if event_id is None:
+            return enqueue_event(gh_event)
+        database.release_event(event_id)
+        return queued_response()
+    if isinstance(error, KeyError):
+        _store_failed(gh_event, event_id)
+        counters['malformed'] += 1
+        raise BadRequest('Malformed request payload') from error
+    if isinstance(error, MissingParent):
+        current_app.logger.info('Holding event until issue is mapped: %s',
+                                error)
+        event_id = _store_failed(gh_event, event_id)
+        if retry.park(event_id, gh_event['issue']['id']):
+            counters['waiting'] += 1
+            return {'result': 'waiting for issue'}, HTTPStatus.ACCEPTED, {}
+        retry.record_failure(event_id, str(error))
+        counters['retry_scheduled'] += 1
+        return {'result': 'retry scheduled'}, HTTPStatus.ACCEPTED, {}
+    current_app.logger.error('Failed to propagate event: %s', error)
+    with database.unit_of_work():
+        event_id = _store_failed(gh_event, event_id)
+        retry.record_failure(event_id, str(error))
+    counters['retry_scheduled'] += 1
+    return {'result': 'retry scheduled'}, HTTPStatus.ACCEPTED, {}
+
+
+def _store_failed(gh_event: domain.GithubEvent,
+                  event_id: Optional[int]) -> int:
+    if event_id is None:
+        return database.store_github_event(gh_event, status=database.FAILED,
+                                           attempts=1)
+    database.set_event_status(event_id, database.FAILED)
+    return event_id
+
+
+def list_dead_letters() -> Response:
+    """List events that exhausted their retries."""
+    return {'results': database.list_dead_letters()}, HTTPStatus.OK, {}
+
+
+def requeue_dead_letter(event_id: int) -> Response:
+    """Put a dead-lettered event back on the queue."""
+    if not database.requeue_dead_letter(event_id):
+        raise NotFound(f'No dead letter for event {event_id}')
+    return {'result': 'queued'}, HTTPStatus.ACCEPTED, {}
+
+
+def reload_config() -> Response:
+    """Apply any changes to the configuration of every worker."""
+    changed = reload.request_reload(current_app._get_current_object())
+    if changed is None:
+        return {'result': 'reloading all workers'}, HTTPStatus.ACCEPTED, {}
+    return {'changed': changed}, HTTPStatus.OK, {}
+
+
+def propagate_event(gh_event: domain.GithubEvent) -> domain.JiraEvent:
+    """
+    Translate a parsed GitHub event and propagate it to Jira.
+
+    Used by the background worker and replay, within a unit of work.
+
+    Raises
+    ------
+    :class:`KeyError`
+        If the event is missing the issue or comment ID.
+    :class:`.jira.PropagationFailed`
+        If the event could not be propagated to Jira.
+
+    """
+    j_event, digest, unchanged = prepare_event(gh_event)
+
+    # Skip updates that would write what Jira already has, e.g. redelivered
+    # events.
+    if unchanged:
+        current_app.logger.debug('Content unchanged; skipping Jira write')
+        counters['jira_writes_avoided'] += 1
+        return j_event
+
+    # Action!
+    j_event = jira.propagate(j_event)
+
+    record_propagation(gh_event, j_event, digest)
+    return j_event
+
+
+def prepare_event(gh_event: domain.GithubEvent) \
+        -> Tuple[Optional[domain.JiraEvent], Optional[str], bool]:
+    """
+    Translate a parsed GitHub event, without writing anything to Jira.
+
+    Raises
+    ------
+    :class:`MissingParent`
+        If this is a comment event and its issue has not been mapped yet.
+
+    Returns
+    -------
+    tuple
+        The Jira event (``None`` if the GitHub event is not translated), the
+        hash of the content it writes, and whether that content is the same
+        as was last written for the resource.
+
+    """
+    issue_key: Optional[str] = None
+    comment_id: Optional[str] = None
+
+    # Load the Jira issue key/comment ID if this is related to an existing
+    # resource.
+    if 'id' in gh_event['issue']:
+        issue_key = database.get_jira_issue_key(gh_event['issue']['id'])
+        current_app.logger.debug('Loaded issue key %s', issue_key)
+    if domain.is_gh_comment_event(gh_event) and issue_key is None:
+        # The issue may have been mapped since we cached its absence.
+        database.issue_keys.invalidate(gh_event['issue']['id'])
+        issue_key = database.get_jira_issue_key(gh_event['issue']['id'])
+        if issue_key is None:
+            raise MissingParent(f'Issue {gh_event["issue"]["id"]} not mapped')
+    if 'comment' in gh_event and 'id' in gh_event['comment']:
+        comment_id = database.get_jira_comment_id(gh_event['comment']['id'])
+        current_app.logger.debug('Loaded comment id %s', comment_id)
+
+    with metrics.timed('translate'):
+        j_event = translate(gh_event, issue_key, comment_id)
+    digest = content_hash(j_event) if j_event is not None else None
+    unchanged = digest is not None and domain.is_update_event(j_event) \
+        and digest == _last_content_hash(gh_event, j_event)
+    return j_event, digest, unchanged
+
+
+def record_propagation(gh_event: domain.GithubEvent,
+                       j_event: domain.JiraEvent,
+                       digest: Optional[str]) -> None:
+    """Store any new mappings, or the hash of the content just written."""
     if domain.is_creation_event(j_event) \
             and domain.is_gh_creation_event(gh_event):
         if domain.is_comment_event(j_event) \
                 and domain.is_gh_comment_event(gh_event):
             database.store_comment_mapping(gh_event['comment']['id'],
-                                           j_event['comment']['id'])
+                                           j_event['comment']['id'],
+                                           content_hash=digest)
         else:
             database.store_issue_mapping(gh_event['issue']['id'],
-                                         j_event['issue']['key'])
-    return {'result': j_event}, HTTPStatus.OK, {}
\ No newline at end of file
+                                         j_event['issue']['key'],
+                                         content_hash=digest)
+    elif digest is not None:
+        if domain.is_comment_event(j_event):
+            database.set_comment_content_hash(gh_event['comment']['id'],
+                                              digest)
+        else:
+            database.set_issue_content_hash(gh_event['issue']['id'], digest)
+
+
+def _last_content_hash(gh_event: domain.GithubEvent,
+                       j_event: domain.JiraEvent) -> Optional[str]:
+    if domain.is_comment_event(j_event):
+        return database.get_comment_content_hash(gh_event['comment']['id'])
+    return database.get_issue_content_hash(gh_event['issue']['id'])
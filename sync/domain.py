@@ -2,7 +2,7 @@
 
 from datetime import datetime
 from enum import Enum
-from typing import Optional
+from typing import Any, List, Optional
 from typing_extensions import TypedDict
 
 
@@ -65,8 +65,15 @@ class GithubUser(TypedDict):
     html_url: str
 
 
+class GithubLabel(TypedDict):
+    name: str
+
+
 class GithubIssue(TypedDict):
     id: int
+    number: int
+    state: str
+    labels: List[GithubLabel]
     title: str
     body: str
     created_at: datetime
@@ -86,6 +93,7 @@ class GithubComment(TypedDict):
 
 class GithubEvent(TypedDict):
     id: int
+    action: str
     event_type: GithubEventActionType
     repository: GithubRepository
     issue: GithubIssue
@@ -159,4 +167,39 @@ def is_gh_creation_event(gh_event) -> bool:
 
 
 def is_update_event(jira_event) -> bool:
-    return bool(not jira_event['event_type'].value.endswith('_create'))
\ No newline at end of file
+    return bool(not jira_event['event_type'].value.endswith('_create'))
+
+
+def project_github_event(gh_event: dict) -> dict:
+    """
+    Keep only the parts of a GitHub payload that are described above.
+
+    The rest of the webhook payload (e.g. the full ``repository``, ``sender``
+    and ``organization`` objects) is not used here, so is not worth storing.
+    ``event_type`` is dropped too, since it is stored alongside the body.
+    """
+    projected = _project(gh_event, GithubEvent)
+    projected.pop('event_type', None)
+    return projected
+
+
+def _project(value: dict, kind: type) -> dict:
+    projected = {}
+    for name, hint in kind.__annotations__.items():
+        if name not in value:
+            continue
+        projected[name] = _project_value(value[name], hint)
+    return projected
+
+
+def _project_value(value: Any, hint: Any) -> Any:
+    # Unwrap Optional[...] and List[...] to find the described type.
+    args = [arg for arg in getattr(hint, '__args__', None) or ()
+            if arg is not type(None)]
+    if args:
+        hint = args[0]
+    if isinstance(value, list):
+        return [_project_value(item, hint) for item in value]
+    if isinstance(value, dict) and hasattr(hint, '__annotations__'):
+        return _project(value, hint)
+    return value
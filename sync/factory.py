@@ -3,27 +3,27 @@ from flask import Flask, jsonify, Response
 from werkzeug.exceptions import BadRequest, InternalServerError, NotFound, \
     MethodNotAllowed, Forbidden, HTTPException
 
-from arxiv import vault
-from arxiv.base.middleware import wrap
+from . import routing, rules
 from .routes import api
-from .services import database, jira
+from .services import database, jira, vault
 from .serialize import EnumJSONEncoder
 
 
 def create_app() -> Flask:
     app = Flask(__name__)
     app.config.from_pyfile('config.py')
+    if app.config['CONFIG_FILE']:
+        app.config.from_pyfile(app.config['CONFIG_FILE'])
+    vault.init_app(app)
     app.json_encoder = EnumJSONEncoder
     database.init_app(app)
     jira.init_app(app)
+    routing.init_app(app)
+    rules.init_app(app)
     app.register_blueprint(api)
     app.logger.setLevel(app.config['LOGLEVEL'])
     register_error_handlers(app)
 
-    if app.config['VAULT_ENABLED']:
-        wrap(app, [vault.middleware.VaultMiddleware])
-        app.middlewares['VaultMiddleware'].update_secrets({})
-
     return app
 
 
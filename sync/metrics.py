@@ -0,0 +1,151 @@
+"""
+Prometheus metrics for the path from webhook to Jira.
+
+If the ``PROMETHEUS_MULTIPROC_DIR`` environment variable is set when this
+module is first imported, metrics are kept in memory-mapped files in that
+directory, so that ``/metrics`` reports the sum over all uWSGI workers. The
+directory is created on import, since every entry-point (the worker, and
+command-line tools such as ``migrate.py``) records database timings.
+Labelled metrics are resolved once and cached, so recording a value costs
+about a microsecond.
+"""
+
+import os
+import shutil
+import time
+from collections import Counter as _Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Iterator, Tuple
+
+from prometheus_client import CollectorRegistry, Counter, Gauge, \
+    Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest, multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+MULTIPROCESS_DIRECTORY = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROCESS_DIRECTORY:
+    os.makedirs(MULTIPROCESS_DIRECTORY, exist_ok=True)
+
+stage_seconds = Histogram(
+    'sync_stage_seconds',
+    'Time spent in each stage of handling an event',
+    ['stage']
+)
+events = Counter(
+    'sync_events_total',
+    'GitHub events received, by type and action',
+    ['event_type', 'action']
+)
+jira_seconds = Histogram(
+    'sync_jira_request_seconds',
+    'Time spent on each Jira operation',
+    ['operation']
+)
+jira_requests = Counter(
+    'sync_jira_requests_total',
+    'Jira operations, by outcome',
+    ['operation', 'outcome']
+)
+outcomes = Counter(
+    'sync_outcomes_total',
+    'Notable outcomes of handling events',
+    ['outcome']
+)
+waiting_events = Counter(
+    'sync_waiting_events_total',
+    'Events held until their issue is mapped, by what happened to them',
+    ['transition']
+)
+lane_depth = Gauge(
+    'sync_lane_depth',
+    'Propagations queued or running in each worker lane',
+    ['lane'],
+    multiprocess_mode='livesum'
+)
+cache_requests = Counter(
+    'sync_cache_requests_total',
+    'Cache lookups, by result',
+    ['cache', 'result']
+)
+
+_children: Dict[Tuple[Any, Tuple[str, ...]], Any] = {}
+
+
+def child(metric: Any, *labels: str) -> Any:
+    """Get the labelled child of ``metric``, resolving the labels once."""
+    key = (metric, labels)
+    found = _children.get(key)
+    if found is None:
+        found = _children[key] = metric.labels(*labels)
+    return found
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record the time spent in the block as ``stage``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        child(stage_seconds, stage).observe(time.perf_counter() - start)
+
+
+class Counts(_Counter):
+    """
+    A :class:`collections.Counter` that also increments a Prometheus counter.
+
+    Used for the ad-hoc counts kept by other modules, so that they are
+    exported without changing the places that increment them. Decreases
+    (e.g. :meth:`clear`) are not exported, since Prometheus counters only go
+    up.
+    """
+
+    def __init__(self, metric: Counter) -> None:
+        super(Counts, self).__init__()
+        self._metric = metric
+
+    def __setitem__(self, key: Hashable, value: int) -> None:
+        increase = value - self.get(key, 0)
+        super(Counts, self).__setitem__(key, value)
+        if increase > 0:
+            child(self._metric, str(key)).inc(increase)
+
+
+def exposition() -> Tuple[bytes, str]:
+    """Render all metrics in the Prometheus text format."""
+    if MULTIPROCESS_DIRECTORY:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def reset_multiprocess_directory() -> None:
+    """
+    Empty the metrics directory.
+
+    Call once, before workers are started (e.g. in the uWSGI master), so
+    that values left by a previous run are not reported.
+    """
+    if MULTIPROCESS_DIRECTORY:
+        shutil.rmtree(MULTIPROCESS_DIRECTORY, ignore_errors=True)
+        os.makedirs(MULTIPROCESS_DIRECTORY, exist_ok=True)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_execute(conn: Any, *args: Any) -> None:
+    conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_execute(conn: Any, *args: Any) -> None:
+    start = conn.info['query_start'].pop()
+    child(stage_seconds, 'database').observe(time.perf_counter() - start)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _execute_failed(context: Any) -> None:
+    starts = context.connection.info.get('query_start') \
+        if context.connection is not None else None
+    if starts:
+        starts.pop()
@@ -1,21 +1,20 @@
+import json
+import re
+from hashlib import sha256
 from typing import Mapping, Callable, Optional, List, Dict
 
 from flask import current_app
 
+from . import rules
 from .domain import GithubEventActionType, GithubEvent, JiraEvent, \
     JiraEventType, JiraIssue, is_comment_event, is_update_event, \
     is_creation_event
 
-
-# TODO: move to main app config.
-DEFAULT_JIRA_ISSUETYPE = {'name': 'Task'}
-DEFAULT_JIRA_PROJECT = {'key': 'ARXIVNG'}
-DEFAULT_JIRA_ASSIGNEE = None
-DEFAULT_JIRA_CLOSED_STATUS = {'id': '151'}
-DEFAULT_JIRA_OPEN_STATUS = {'id': '161'}
-
 GithubEventHandler = Callable[[GithubEvent], JiraEvent]
 
+EDITED_MARKER = re.compile(r'\n\n \*\(edited at [^\n]*\)\*\Z')
+"""The note appended to edited content by :func:`_mark_edited`."""
+
 
 def translate(gh_event: GithubEvent, issue_key: Optional[str] = None,
                     comment_id: Optional[str] = None) -> Optional[JiraEvent]:
@@ -33,6 +32,31 @@ def translate(gh_event: GithubEvent, issue_key: Optional[str] = None,
     return None
 
 
+def content_hash(j_event: JiraEvent) -> Optional[str]:
+    """
+    Hash the Jira fields written by an issue or comment create/update.
+
+    Returns ``None`` for events that do not write content (transitions and
+    deletions). The Jira issue key and comment ID are not included, so the
+    hash of a creation can be compared with that of later updates. Nor is
+    the note on edited content, which changes with every edit, so that an
+    edit that leaves the content as it was is recognized.
+    """
+    if j_event['event_type'] in (JiraEventType.issue_create,
+                                 JiraEventType.issue_update):
+        fields = {k: v for k, v in j_event['issue'].items() if k != 'key'}
+    elif j_event['event_type'] in (JiraEventType.comment_create,
+                                   JiraEventType.comment_edit):
+        fields = {k: v for k, v in j_event['comment'].items() if k != 'id'}
+    else:
+        return None
+    for key in ('description', 'body'):
+        if isinstance(fields.get(key), str):
+            fields[key] = EDITED_MARKER.sub('', fields[key])
+    content = json.dumps(fields, sort_keys=True, default=str)
+    return sha256(content.encode('utf-8')).hexdigest()
+
+
 def _make_description(gh_event: GithubEvent) -> str:
     return (f'GitHub user {gh_event["issue"]["user"]["login"]} writes'
             f' via {gh_event["issue"]["html_url"]} :'
@@ -44,45 +68,70 @@ def _make_comment_body(gh_event: GithubEvent) -> str:
             f' via {gh_event["comment"]["html_url"]} :'
             f'\n\n"{gh_event["comment"]["body"]}"')
 
+
 def _mark_edited(gh_event: GithubEvent, value: str) -> str:
     return (f'{value}\n\n'
             f' *(edited at {gh_event["issue"]["updated_at"].isoformat()}'
             f' by {gh_event["issue"]["user"]["login"]})*')
 
 
-def _get_components(gh_event: GithubEvent) -> List[Dict[str, int]]:
-    components_lookup = current_app.config['JIRA_COMPONENTS']
-    component = components_lookup.get(gh_event['repository']['name'], None)
-    if component is not None:
-        return [{'id': component}]
+def _by_id_or_name(value: str) -> Dict[str, str]:
+    """Refer to a Jira resource by ID if ``value`` is numeric, else by name."""
+    if value.isdigit():
+        return {'id': value}
+    return {'name': value}
+
+
+def _get_components(route: rules.Route) -> List[Dict[str, str]]:
+    if route['component'] is not None:
+        return [_by_id_or_name(route['component'])]
     return []
 
 
+def _get_assignee(route: rules.Route) -> Optional[Dict[str, str]]:
+    if route['assignee'] is not None:
+        return {current_app.config['JIRA_ASSIGNEE_FIELD']: route['assignee']}
+    return None
+
+
+def _closed_status() -> Dict[str, str]:
+    return _by_id_or_name(current_app.config['JIRA_CLOSED_TRANSITION'])
+
+
+def _open_status() -> Dict[str, str]:
+    return _by_id_or_name(current_app.config['JIRA_OPEN_TRANSITION'])
+
+
 def translate_issue_opened(gh_event: GithubEvent) -> JiraEvent:
     """Create a new Jira issue."""
+    route = rules.routes.lookup(gh_event)
     return {
         'event_type': JiraEventType.issue_create,
         'issue': {
-            'project': DEFAULT_JIRA_PROJECT,
+            'project': {'key': route['project']},
             'summary': gh_event["issue"]["title"],
             'description': _make_description(gh_event),
-            'issuetype': DEFAULT_JIRA_ISSUETYPE,
-            'assignee': DEFAULT_JIRA_ASSIGNEE,
-            'components': _get_components(gh_event)
+            'issuetype': _by_id_or_name(route['issuetype']),
+            'assignee': _get_assignee(route),
+            'components': _get_components(route)
         }
     }
 
 
 def translate_issue_edited(gh_event: GithubEvent) -> JiraEvent:
-    """Edit an existing Jira issue."""
+    """
+    Edit an existing Jira issue.
+
+    Only the content is updated. The project, issue type and assignee were
+    chosen by the routing rules when the issue was created, and may have
+    been changed in Jira since; Jira cannot move an issue between projects
+    with an update anyway.
+    """
     return {
         'event_type': JiraEventType.issue_update,
         'issue': {
-            'project': DEFAULT_JIRA_PROJECT,
             'summary': gh_event["issue"]["title"],
-            'description': _mark_edited(gh_event, _make_description(gh_event)),
-            'issuetype': DEFAULT_JIRA_ISSUETYPE,
-            'assignee': DEFAULT_JIRA_ASSIGNEE
+            'description': _mark_edited(gh_event, _make_description(gh_event))
         }
     }
 
@@ -92,7 +141,7 @@ def translate_issue_closed(gh_event: GithubEvent) -> JiraEvent:
     return {
         'event_type': JiraEventType.issue_transition,
         'issue': {
-            'status': DEFAULT_JIRA_CLOSED_STATUS
+            'status': _closed_status()
         }
     }
 
@@ -102,7 +151,7 @@ def translate_issue_reopened(gh_event: GithubEvent) -> JiraEvent:
     return {
         'event_type': JiraEventType.issue_transition,
         'issue': {
-            'status': DEFAULT_JIRA_OPEN_STATUS
+            'status': _open_status()
         }
     }
 
@@ -111,7 +160,7 @@ def translate_issue_deleted(gh_event: GithubEvent) -> JiraEvent:
     return {
         'event_type': JiraEventType.issue_transition,
         'issue': {
-            'status': DEFAULT_JIRA_CLOSED_STATUS
+            'status': _closed_status()
         }
     }
 
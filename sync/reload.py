@@ -0,0 +1,149 @@
+"""
+Reload configuration without restarting the process.
+
+Configuration is resolved once, when the app is created, from ``config.py``
+(i.e. the process environment) and the optional ``CONFIG_FILE``; nothing on
+the request path writes to it. :func:`reload_config` resolves it again, and
+applies only the settings that have changed. It runs on ``SIGHUP`` (see
+:func:`install_signal_handler`) or ``POST /admin/reload``; under uWSGI the
+endpoint fans out to every worker with a uWSGI signal (see
+:func:`register_uwsgi_signal`). Secrets from Vault are kept as they are;
+:mod:`.services.vault` refreshes them.
+
+The environment of a running process does not change, so in practice
+``CONFIG_FILE`` is the only source of settings that can be reloaded.
+
+Changed database or Jira settings take effect on the next request: the
+database engine is replaced (see :func:`.database.use_database`), and
+:func:`.jira.get_service` rebuilds the client when its credentials change.
+Other connection settings, e.g. pool sizes, only take effect on restart.
+"""
+
+import signal
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, \
+    Optional, Tuple
+
+from flask import Config, Flask
+
+from . import routing, rules
+from .cache import MISSING
+from .services import database
+
+try:
+    import uwsgi
+except ImportError:     # Not running under uWSGI.
+    uwsgi = None
+
+config_lock = Lock()
+"""Serializes changes to the app config; shared with the Vault refresher."""
+
+RELOAD_SIGNAL = 17
+"""The uWSGI signal that reloads the configuration of every worker."""
+
+Applier = Callable[[Flask], None]
+
+
+def _set_log_level(app: Flask) -> None:
+    app.logger.setLevel(app.config['LOGLEVEL'])
+
+
+APPLIERS: List[Tuple[FrozenSet[str], Applier]] = [
+    (frozenset({'LOGLEVEL'}), _set_log_level),
+    (frozenset({'EVENT_ALLOW', 'EVENT_DENY'}), routing.init_app),
+]
+"""Settings that are read once, and how to apply them when they change."""
+
+
+def load_config(app: Flask) -> Dict[str, Any]:
+    """Resolve the configuration of ``app`` afresh."""
+    config = Config(app.root_path)
+    config.from_pyfile('config.py')
+    if config.get('CONFIG_FILE'):
+        config.from_pyfile(config['CONFIG_FILE'])
+    refresher = app.extensions.get('vault')
+    if refresher is not None:
+        config.update(refresher.secrets)
+    return dict(config)
+
+
+def changed_settings(current: Mapping[str, Any],
+                     fresh: Mapping[str, Any]) -> Dict[str, Any]:
+    """Get the settings in ``fresh`` that differ from ``current``."""
+    return {key: value for key, value in fresh.items()
+            if key.isupper() and current.get(key, MISSING) != value}
+
+
+def reload_config(app: Flask) -> List[str]:
+    """
+    Apply any changes to the configuration of ``app``.
+
+    Routing rules are always recompiled, since the ``ROUTING_RULES`` file
+    may have changed without its name changing.
+
+    Returns
+    -------
+    list
+        The names of the settings that changed. Values are not returned or
+        logged, as they may be secrets.
+
+    """
+    with config_lock:
+        changes = changed_settings(app.config, load_config(app))
+        app.config.update({key: value for key, value in changes.items()
+                           if key != 'SQLALCHEMY_DATABASE_URI'})
+        if 'SQLALCHEMY_DATABASE_URI' in changes:
+            database.use_database(app, changes['SQLALCHEMY_DATABASE_URI'])
+        for keys, apply in APPLIERS:
+            if keys & changes.keys():
+                apply(app)
+        rules.init_app(app)
+    if changes:
+        app.logger.info('Reloaded settings: %s', ', '.join(sorted(changes)))
+    return sorted(changes)
+
+
+def install_signal_handler(app: Flask,
+                           signum: signal.Signals = signal.SIGHUP) -> None:
+    """
+    Reload the configuration of ``app`` when the process gets ``signum``.
+
+    Not for use under uWSGI, where ``SIGHUP`` to the master gracefully
+    reloads the workers instead.
+    """
+    def handle(signum: int, frame: Any) -> None:
+        # Reload on another thread, as the main thread may hold the lock.
+        Thread(target=reload_config, args=(app,), daemon=True).start()
+
+    signal.signal(signum, handle)
+
+
+def register_uwsgi_signal(app: Flask) -> bool:
+    """
+    Reload the configuration of ``app`` in every worker on ``RELOAD_SIGNAL``.
+
+    Call this in the uWSGI master, before the workers are forked. Returns
+    ``False`` if not running under uWSGI.
+    """
+    if uwsgi is None:
+        return False
+    uwsgi.register_signal(RELOAD_SIGNAL, 'workers',
+                          lambda signum: reload_config(app))
+    app.extensions['uwsgi_reload_signal'] = RELOAD_SIGNAL
+    return True
+
+
+def request_reload(app: Flask) -> Optional[List[str]]:
+    """
+    Reload the configuration of every process serving ``app``.
+
+    Under uWSGI the signal is raised for all workers and ``None`` is
+    returned, as they reload asynchronously. Otherwise this process is
+    reloaded, and the names of the settings that changed are returned.
+    """
+    signum = app.extensions.get('uwsgi_reload_signal')
+    if signum is not None:
+        uwsgi.signal(signum)
+        return None
+    return reload_config(app)
+
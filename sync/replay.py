@@ -0,0 +1,119 @@
+"""Reprocess events from the stored ``github_event`` log."""
+
+from collections import Counter
+from concurrent.futures import Future
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from flask import current_app
+from jira import JIRAError
+
+from . import domain
+from .controllers import MissingParent, prepare_event, propagate_event
+from .domain import GithubEvent
+from .scheduler import LaneScheduler
+from .services import database, jira
+
+StoredEvent = Tuple[int, GithubEvent]
+
+APPLIED = 'applied'
+ALREADY_MAPPED = 'already_mapped'
+UNCHANGED = 'unchanged'
+NOT_TRANSLATED = 'not_translated'
+MISSING_PARENT = 'missing_parent'
+FAILED = 'failed'
+UNAVAILABLE = 'unavailable'
+
+
+def replay(events: Iterable[StoredEvent], scheduler: LaneScheduler,
+           batch_size: int = 500) -> 'Counter[str]':
+    """
+    Propagate stored events to Jira again.
+
+    Events are propagated on the ``scheduler``'s lanes keyed by GitHub issue
+    ID, so events for an issue are applied in the order they were stored
+    while different issues are replayed in parallel. At most ``batch_size``
+    events are in flight at once. Events that create an issue or comment
+    that is already mapped are skipped, so that replaying a range does not
+    duplicate tickets; events that succeed are marked ``done``.
+
+    Returns
+    -------
+    :class:`.Counter`
+        The number of events with each outcome.
+
+    """
+    counts: 'Counter[str]' = Counter()
+    futures: List[Future] = []
+    for event_id, gh_event in events:
+        futures.append(scheduler.submit(gh_event['issue'].get('id'),
+                                        _replay_one, event_id, gh_event))
+        if len(futures) >= batch_size:
+            counts.update(future.result() for future in futures)
+            futures = []
+    counts.update(future.result() for future in futures)
+    return counts
+
+
+def plan(events: Iterable[StoredEvent]) -> Iterator[dict]:
+    """
+    Describe the Jira call that replaying each event would make.
+
+    Nothing is written to Jira or to the database. Since nothing is created,
+    comments on an issue created in the same range are reported as
+    ``missing_parent``, and other events that follow a creation are reported
+    without its Jira key or ID.
+    """
+    for event_id, gh_event in events:
+        outcome, j_event = _check(gh_event)
+        step = {'event_id': event_id,
+                'event_type': gh_event['event_type'].name,
+                'issue_id': gh_event['issue'].get('id'),
+                'outcome': outcome}
+        if outcome is None:
+            step.update({
+                'outcome': 'would_propagate',
+                'call': jira.handlers[j_event['event_type']].__name__,
+                'issue_key': j_event.get('issue', {}).get('key'),
+                'comment_id': (j_event.get('comment') or {}).get('id')
+            })
+        yield step
+
+
+def _check(gh_event: GithubEvent) \
+        -> Tuple[Optional[str], Optional[domain.JiraEvent]]:
+    """Get the reason not to propagate an event, if any."""
+    try:
+        j_event, _, unchanged = prepare_event(gh_event)
+    except MissingParent:
+        return MISSING_PARENT, None
+    if j_event is None or j_event['event_type'] not in jira.handlers:
+        return NOT_TRANSLATED, j_event
+    if unchanged:
+        return UNCHANGED, j_event
+    if domain.is_creation_event(j_event) and _is_mapped(gh_event, j_event):
+        return ALREADY_MAPPED, j_event
+    return None, j_event
+
+
+def _is_mapped(gh_event: GithubEvent, j_event: domain.JiraEvent) -> bool:
+    if domain.is_comment_event(j_event):
+        return (j_event.get('comment') or {}).get('id') is not None
+    return j_event['issue'].get('key') is not None
+
+
+def _replay_one(event_id: int, gh_event: GithubEvent) -> str:
+    try:
+        outcome, _ = _check(gh_event)
+        if outcome is not None:
+            return outcome
+        with database.unit_of_work():
+            propagate_event(gh_event)
+            database.set_event_status(event_id, database.DONE)
+    except jira.JiraUnavailable as e:
+        current_app.logger.error('Jira unavailable; event %s not replayed: %s',
+                                 event_id, e)
+        return UNAVAILABLE
+    except (KeyError, jira.PropagationFailed, JIRAError) as e:
+        current_app.logger.error('Failed to replay event %s: %s', event_id, e)
+        return FAILED
+    return APPLIED
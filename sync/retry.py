@@ -0,0 +1,78 @@
+"""Retry policy for events that could not be propagated to Jira."""
+
+import random
+
+from flask import current_app
+
+from .services import database
+
+
+def backoff(attempts: int, base: float, cap: float) -> float:
+    """
+    Get the delay before the next attempt, in seconds.
+
+    The delay doubles with each attempt up to ``cap``; half of it is random
+    jitter, so that events that failed together are not retried together.
+    """
+    delay = min(cap, base * 2 ** max(attempts - 1, 0))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def record_failure(event_id: int, error: str) -> None:
+    """Schedule another attempt, or dead-letter the event if out of tries."""
+    config = current_app.config
+    attempts = database.get_attempts(event_id)
+    if attempts >= config['RETRY_MAX_ATTEMPTS']:
+        current_app.logger.error('Giving up on event %s after %i attempts',
+                                 event_id, attempts)
+        database.dead_letter(event_id, error)
+    else:
+        database.schedule_retry(event_id, error,
+                                backoff(attempts, config['RETRY_BASE_DELAY'],
+                                        config['RETRY_MAX_DELAY']))
+
+
+def release(event_id: int) -> None:
+    """
+    Put off a retry without counting the attempt, e.g. while Jira is down.
+
+    The event is retried after the same delay as its last attempt.
+    """
+    config = current_app.config
+    attempts = max(database.get_attempts(event_id) - 1, 1)
+    database.release_event(event_id, backoff(attempts,
+                                             config['RETRY_BASE_DELAY'],
+                                             config['RETRY_MAX_DELAY']))
+
+
+def park(event_id: int, issue_id: int) -> bool:
+    """
+    Hold an event until its issue is mapped, if there is room.
+
+    Returns ``False`` if too many events are already waiting, in which case
+    the caller should fall back to :func:`record_failure`.
+    """
+    config = current_app.config
+    if database.count_waiting_events() >= config['WAITING_MAX_EVENTS']:
+        database.waiting_counts['overflowed'] += 1
+        return False
+    database.park_event(event_id, issue_id, config['WAITING_TIMEOUT'])
+    return True
+
+
+def expire_waiting(limit: int) -> int:
+    """Retry events that have waited too long for their issue."""
+    event_ids = database.claim_expired_waiting_events(limit)
+    for event_id in event_ids:
+        database.waiting_counts['expired'] += 1
+        record_failure(event_id, 'Timed out waiting for the issue')
+    return len(event_ids)
+
+
+def expire_claims(limit: int) -> int:
+    """Retry events whose claim lapsed, e.g. because the worker died."""
+    event_ids = database.claim_stale_events(limit)
+    for event_id in event_ids:
+        current_app.logger.error('Claim on event %s lapsed', event_id)
+        record_failure(event_id, 'Claim lapsed before the event was done')
+    return len(event_ids)
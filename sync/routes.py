@@ -1,14 +1,28 @@
 from flask import Blueprint, Response, request, make_response, current_app
 from werkzeug.exceptions import Forbidden
 
-from .controllers import handle_issuesevent, handle_issuecommentevent
+from .controllers import handle_issuesevent, handle_issuecommentevent, \
+    list_dead_letters, requeue_dead_letter, reload_config
+from . import metrics
+from .services import database, jira
 
 api = Blueprint('api', __name__, url_prefix='')
 
 
 @api.route('/status', methods=['GET'])
 def status() -> Response:
-    return make_response({})
+    return make_response({
+        'jira': jira.get_breaker().status(),
+        # Counted in memory: this is polled by probes, so it must not
+        # query the database.
+        'waiting': dict(database.waiting_counts)
+    })
+
+
+@api.route('/metrics', methods=['GET'])
+def prometheus_metrics() -> Response:
+    body, content_type = metrics.exposition()
+    return make_response(body, 200, {'Content-Type': content_type})
 
 
 @api.route('/issuesevent', methods=['POST'])
@@ -17,7 +31,10 @@ def issuesevent() -> Response:
     current_app.logger.error('%s:%s', token, current_app.config['WEBHOOK_TOKEN'])
     if token is None or token != current_app.config['WEBHOOK_TOKEN']:
         raise Forbidden('Missing or invalid token')
-    return make_response(*handle_issuesevent(request.get_json()))
+    return make_response(*handle_issuesevent(
+        request.get_json(),
+        request.headers.get('X-GitHub-Delivery')
+    ))
 
 
 @api.route('/issuecommentevent', methods=['POST'])
@@ -26,5 +43,31 @@ def issuecommentevent() -> Response:
     current_app.logger.error('%s:%s', token, current_app.config['WEBHOOK_TOKEN'])
     if token is None or token != current_app.config['WEBHOOK_TOKEN']:
         raise Forbidden('Missing or invalid token')
-    return make_response(*handle_issuecommentevent(request.get_json()))
+    return make_response(*handle_issuecommentevent(
+        request.get_json(),
+        request.headers.get('X-GitHub-Delivery')
+    ))
+
+
+@api.route('/deadletter', methods=['GET'])
+def deadletter() -> Response:
+    _check_token()
+    return make_response(*list_dead_letters())
+
+
+@api.route('/deadletter/<int:event_id>/requeue', methods=['POST'])
+def requeue_deadletter(event_id: int) -> Response:
+    _check_token()
+    return make_response(*requeue_dead_letter(event_id))
 
+
+@api.route('/admin/reload', methods=['POST'])
+def admin_reload() -> Response:
+    _check_token()
+    return make_response(*reload_config())
+
+
+def _check_token() -> None:
+    token = request.args.get('token')
+    if token is None or token != current_app.config['WEBHOOK_TOKEN']:
+        raise Forbidden('Missing or invalid token')
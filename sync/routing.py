@@ -0,0 +1,84 @@
+"""Decide which GitHub events are worth handling, before any I/O."""
+
+from typing import Dict, FrozenSet, Iterable, Optional, Set, Tuple
+
+from flask import Flask
+
+from .domain import GithubEvent, GithubEventActionType
+from .process import event_translators
+
+WILDCARD = '*'
+
+Rule = Tuple[str, str]
+"""A ``(repository name, event action type name)`` pair; either may be ``*``."""
+
+
+def parse_rules(value: Optional[str]) -> FrozenSet[Rule]:
+    """
+    Parse a comma-separated list of ``repository:event`` rules.
+
+    Events are named as in :class:`.GithubEventActionType`, e.g.
+    ``arxiv-docs:issue_edited`` or ``*:comment_deleted``.
+    """
+    rules: Set[Rule] = set()
+    for rule in (value or '').split(','):
+        if not rule.strip():
+            continue
+        repository, _, event = rule.strip().partition(':')
+        if event != WILDCARD and event not in GithubEventActionType.__members__:
+            raise ValueError(f'Unknown event in routing rule: {rule}')
+        rules.add((repository or WILDCARD, event))
+    return frozenset(rules)
+
+
+class EventRouter:
+    """
+    Precompiled table of the events that should be handled.
+
+    Only events that have a translator are accepted. If ``allow`` rules are
+    given, only events matching one of them are accepted; events matching
+    a ``deny`` rule are never accepted. The accepted events are computed
+    once for repositories named in the rules and once for all others, so
+    that :meth:`accepts` is a pair of dict/set lookups.
+    """
+
+    def __init__(self, translatable: Iterable[GithubEventActionType],
+                 allow: FrozenSet[Rule] = frozenset(),
+                 deny: FrozenSet[Rule] = frozenset()) -> None:
+        self._translatable = frozenset(translatable)
+        self._allow = allow
+        self._deny = deny
+        self._default = self._compile(WILDCARD)
+        self._by_repository: Dict[str, FrozenSet[GithubEventActionType]] = {
+            repository: self._compile(repository)
+            for repository, _ in allow | deny if repository != WILDCARD
+        }
+
+    def accepts(self, gh_event: GithubEvent) -> bool:
+        repository = (gh_event.get('repository') or {}).get('name')
+        accepted = self._by_repository.get(repository, self._default)
+        return gh_event['event_type'] in accepted
+
+    def _compile(self, repository: str) -> FrozenSet[GithubEventActionType]:
+        return frozenset(
+            event_type for event_type in self._translatable
+            if (not self._allow
+                or self._matches(self._allow, repository, event_type))
+            and not self._matches(self._deny, repository, event_type)
+        )
+
+    @staticmethod
+    def _matches(rules: FrozenSet[Rule], repository: str,
+                 event_type: GithubEventActionType) -> bool:
+        return any((r, e) in rules
+                   for r in (repository, WILDCARD)
+                   for e in (event_type.name, WILDCARD))
+
+
+def init_app(app: Flask) -> None:
+    """Compile the event routing table for ``app``."""
+    app.extensions['event_router'] = EventRouter(
+        event_translators,
+        allow=parse_rules(app.config['EVENT_ALLOW']),
+        deny=parse_rules(app.config['EVENT_DENY'])
+    )
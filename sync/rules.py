@@ -0,0 +1,138 @@
+"""Rules that decide where in Jira a GitHub issue is mirrored."""
+
+import json
+from itertools import product
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from flask import Flask
+from typing_extensions import TypedDict
+
+from .domain import GithubEvent, GithubEventActionType
+
+WILDCARD = '*'
+
+ROUTE_FIELDS = ('project', 'issuetype', 'component', 'assignee')
+MATCH_FIELDS = ('repository', 'label', 'action')
+
+
+class Route(TypedDict):
+    project: str
+    issuetype: str
+    component: Optional[str]
+    assignee: Optional[str]
+
+
+RuleKey = Tuple[str, Optional[str], str]
+"""``(repository, label, action)``; ``*`` and ``None`` match anything."""
+
+
+class InvalidRules(ValueError):
+    """The routing rules are malformed."""
+
+
+class RouteTable:
+    """
+    Routing rules compiled into a dispatch table.
+
+    Each rule matches on ``repository``, ``label`` and ``action`` (any of
+    which may be omitted) and sets some of ``project``, ``issuetype``,
+    ``component`` and ``assignee``. Rules with the same match are merged
+    when the table is compiled. A lookup merges the defaults with every
+    matching entry, from least to most specific (an exact repository beats
+    a label, which beats an action), so its cost depends on the number of
+    labels on the issue but not on the number of rules.
+    """
+
+    def __init__(self, defaults: Route,
+                 rules: Iterable[Mapping[str, Any]] = ()) -> None:
+        self.defaults = defaults
+        self._table: Dict[RuleKey, Dict[str, Optional[str]]] = {}
+        for rule in rules:
+            key, fields = _validate(rule)
+            self._table.setdefault(key, {}).update(fields)
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def lookup(self, gh_event: GithubEvent) -> Route:
+        repository = (gh_event.get('repository') or {}).get('name')
+        labels: List[Optional[str]] = [None]
+        labels += [label['name'] for label
+                   in gh_event.get('issue', {}).get('labels') or []]
+        action = gh_event['event_type'].name
+        candidates = product((WILDCARD, repository), labels,
+                             (WILDCARD, action))
+        route = dict(self.defaults)
+        for key in sorted(candidates, key=_specificity):
+            route.update(self._table.get(key, {}))
+        return route    # type: ignore
+
+
+def _specificity(key: RuleKey) -> int:
+    repository, label, action = key
+    return (4 * (repository != WILDCARD) + 2 * (label is not None)
+            + (action != WILDCARD))
+
+
+def _validate(rule: Mapping[str, Any]) \
+        -> Tuple[RuleKey, Dict[str, Optional[str]]]:
+    if not isinstance(rule, Mapping):
+        raise InvalidRules(f'Rule must be an object: {rule!r}')
+    unknown = set(rule) - set(ROUTE_FIELDS) - set(MATCH_FIELDS)
+    if unknown:
+        raise InvalidRules(f'Unknown fields {sorted(unknown)} in {rule!r}')
+    action = rule.get('action', WILDCARD)
+    if action != WILDCARD and action not in GithubEventActionType.__members__:
+        raise InvalidRules(f'Unknown action {action!r} in {rule!r}')
+    fields = {k: v for k, v in rule.items() if k in ROUTE_FIELDS}
+    if not fields:
+        raise InvalidRules(f'Rule sets no fields: {rule!r}')
+    for field, value in fields.items():
+        if value is not None and not isinstance(value, str):
+            raise InvalidRules(f'{field} must be a string in {rule!r}')
+    key = (rule.get('repository', WILDCARD), rule.get('label'), action)
+    return key, fields
+
+
+def compile_rules(config: Mapping[str, Any]) -> RouteTable:
+    """
+    Compile the routing rules for an app config.
+
+    ``JIRA_COMPONENTS`` is treated as a set of per-repository component
+    rules, followed by the rules in the ``ROUTING_RULES`` JSON file, if any.
+    The file contains an object with optional ``defaults`` and ``rules``.
+    """
+    defaults: Route = {'project': config['JIRA_PROJECT'],
+                       'issuetype': config['JIRA_ISSUETYPE'],
+                       'component': None,
+                       'assignee': None}
+    rules: List[Mapping[str, Any]] = [
+        {'repository': repository, 'component': component}
+        for repository, component in config['JIRA_COMPONENTS'].items()
+    ]
+    if config.get('ROUTING_RULES'):
+        with open(config['ROUTING_RULES']) as f:
+            try:
+                content = json.load(f)
+            except ValueError as e:
+                raise InvalidRules(f'Could not read routing rules: {e}') from e
+        unknown = set(content) - {'defaults', 'rules'}
+        if unknown:
+            raise InvalidRules(f'Unknown keys {sorted(unknown)} in rules')
+        for field, value in content.get('defaults', {}).items():
+            if field not in ROUTE_FIELDS:
+                raise InvalidRules(f'Unknown default {field}')
+            defaults[field] = value    # type: ignore
+        rules += content.get('rules', [])
+    return RouteTable(defaults, rules)
+
+
+routes = RouteTable({'project': 'ARXIVNG', 'issuetype': 'Task',
+                     'component': None, 'assignee': None})
+"""The compiled routing rules in use."""
+
+
+def init_app(app: Flask) -> None:
+    """Compile the routing rules; call again to reload them."""
+    global routes
+    routes = compile_rules(app.config)
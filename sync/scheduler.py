@@ -0,0 +1,68 @@
+"""Per-key ordered, cross-key parallel execution of propagation work."""
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Hashable, List, Optional
+
+from flask import Flask
+
+from . import metrics
+
+
+class LaneScheduler:
+    """
+    Runs work on a fixed number of single-threaded lanes.
+
+    Work is assigned to a lane by hashing its key (e.g. the GitHub issue ID),
+    so that work with the same key is executed strictly in submission order
+    while work with different keys can run in parallel. If ``app`` is given,
+    each task runs inside its own app context. Lane depths are exported as
+    the ``sync_lane_depth`` gauge.
+    """
+
+    def __init__(self, lanes: int, app: Optional[Flask] = None) -> None:
+        if lanes < 1:
+            raise ValueError('At least one lane is required')
+        self._app = app
+        self._lanes = [ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix=f'lane-{i}')
+                       for i in range(lanes)]
+        self._depths = [0] * lanes
+        self._lock = Lock()
+
+    @property
+    def lanes(self) -> int:
+        return len(self._lanes)
+
+    def lane_for(self, key: Hashable) -> int:
+        return hash(key) % len(self._lanes)
+
+    def depths(self) -> List[int]:
+        """Number of queued or running tasks in each lane."""
+        with self._lock:
+            return list(self._depths)
+
+    def submit(self, key: Hashable, func: Callable, *args: Any) -> Future:
+        """Schedule ``func(*args)`` on the lane for ``key``."""
+        lane = self.lane_for(key)
+        with self._lock:
+            self._depths[lane] += 1
+            metrics.child(metrics.lane_depth, str(lane)).inc()
+        future = self._lanes[lane].submit(self._run, func, *args)
+        future.add_done_callback(lambda _: self._done(lane))
+        return future
+
+    def shutdown(self, wait: bool = True) -> None:
+        for executor in self._lanes:
+            executor.shutdown(wait=wait)
+
+    def _run(self, func: Callable, *args: Any) -> Any:
+        if self._app is None:
+            return func(*args)
+        with self._app.app_context():
+            return func(*args)
+
+    def _done(self, lane: int) -> None:
+        with self._lock:
+            self._depths[lane] -= 1
+            metrics.child(metrics.lane_depth, str(lane)).dec()
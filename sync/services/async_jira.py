@@ -0,0 +1,261 @@
+"""
+Non-blocking Jira client, for the asyncio serving mode (see :mod:`.asgi`).
+
+Mirrors the operations of :class:`.jira.JiraService`, speaking to the Jira
+REST API directly over a pooled :class:`httpx.AsyncClient`. Failures are
+reported with the exceptions of :mod:`.jira`, so that callers handle both
+clients the same way.
+"""
+
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional, Tuple
+
+import httpx
+
+from .. import metrics
+from ..cache import LRUCache, MISSING
+from ..domain import JiraEvent, JiraEventType
+from .breaker import CircuitBreaker
+from .jira import JiraUnavailable, PropagationFailed
+from .ratelimit import TokenBucket, _retry_after
+
+
+class _Rejected(PropagationFailed):
+    """Jira rejected a request as invalid (400), e.g. with a stale ID."""
+
+
+class AsyncJiraService:
+    """
+    Makes changes in Jira without blocking the event loop.
+
+    Up to ``pool_size`` requests are in flight at once over keep-alive
+    connections; further requests wait for a free connection. Component and
+    issue type names are sent to Jira as they are, since the REST API
+    accepts names, so no metadata needs to be loaded. If ``rate_limit`` is
+    given, each request waits (asynchronously) for a token from it.
+    """
+
+    def __init__(self, endpoint: str, username: str, token: str,
+                 pool_size: int = 100,
+                 timeout: Tuple[float, float] = (5., 30.),
+                 metadata_ttl: float = 3600.,
+                 rate_limit: Optional[TokenBucket] = None,
+                 rate_limit_wait: float = 30.,
+                 transport: Optional[httpx.AsyncBaseTransport] = None) \
+            -> None:
+        self.credentials = (endpoint, username, token)
+        self._client = httpx.AsyncClient(
+            base_url=f'{endpoint.rstrip("/")}/rest/api/2/',
+            auth=(username, token),
+            limits=httpx.Limits(max_connections=pool_size,
+                                max_keepalive_connections=pool_size),
+            timeout=httpx.Timeout(timeout[1], connect=timeout[0]),
+            transport=transport
+        )
+        self._transitions = LRUCache(maxsize=256, ttl=metadata_ttl,
+                                     name='async_jira_transitions')
+        self._rate_limit = rate_limit
+        self._rate_limit_wait = rate_limit_wait
+        self._users = 0
+        self._idle: Optional[asyncio.Event] = None
+
+    @contextmanager
+    def in_use(self) -> Iterator['AsyncJiraService']:
+        """Use the client for a propagation; :meth:`aclose` waits for it."""
+        self._users += 1
+        try:
+            yield self
+        finally:
+            self._users -= 1
+            if not self._users and self._idle is not None:
+                self._idle.set()
+
+    async def aclose(self) -> None:
+        """Close the connection pool, once the propagations using it end."""
+        if self._users:
+            self._idle = asyncio.Event()
+            await self._idle.wait()
+        await self._client.aclose()
+
+    async def create_ticket(self, event: JiraEvent) -> JiraEvent:
+        fields = {k: v for k, v in event['issue'].items() if k != 'key'}
+        ticket = await self._request('POST', 'issue', {'fields': fields})
+        event['issue']['key'] = ticket['key']
+        return event
+
+    async def update_ticket(self, event: JiraEvent) -> JiraEvent:
+        issue_key = _issue_key(event)
+        fields = {k: v for k, v in event['issue'].items() if k != 'key'}
+        await self._request('PUT', f'issue/{issue_key}', {'fields': fields})
+        return event
+
+    async def transition_ticket(self, event: JiraEvent) -> JiraEvent:
+        issue_key = _issue_key(event)
+        status = event['issue']['status']
+        if 'id' in status:
+            await self._transition(issue_key, status['id'])
+            return event
+        try:
+            await self._transition(
+                issue_key, await self._transition_id(issue_key, status['name'])
+            )
+        except _Rejected:
+            # The cached ID may be stale; reload and try once more.
+            self._transitions.invalidate(issue_key.rsplit('-', 1)[0])
+            await self._transition(
+                issue_key, await self._transition_id(issue_key, status['name'])
+            )
+        return event
+
+    async def _transition(self, issue_key: str, transition_id: str) -> None:
+        await self._request('POST', f'issue/{issue_key}/transitions',
+                            {'transition': {'id': transition_id}})
+
+    async def create_comment(self, event: JiraEvent) -> JiraEvent:
+        issue_key = _issue_key(event)
+        comment = await self._request('POST', f'issue/{issue_key}/comment',
+                                      {'body': event['comment']['body']})
+        event['comment']['id'] = comment['id']
+        return event
+
+    async def update_comment(self, event: JiraEvent) -> JiraEvent:
+        issue_key = _issue_key(event)
+        await self._request('PUT',
+                            f'issue/{issue_key}/comment/{_comment_id(event)}',
+                            {'body': event['comment']['body']})
+        return event
+
+    async def delete_comment(self, event: JiraEvent) -> JiraEvent:
+        issue_key = _issue_key(event)
+        await self._request('DELETE',
+                            f'issue/{issue_key}/comment/{_comment_id(event)}')
+        return event
+
+    async def _transition_id(self, issue_key: str, name: str) -> str:
+        """Get the ID of a transition by its name or target status name."""
+        project = issue_key.rsplit('-', 1)[0]
+        known = self._transitions.get(project)
+        if known is MISSING or name not in known:
+            loaded = {} if known is MISSING else dict(known)
+            response = await self._request('GET',
+                                           f'issue/{issue_key}/transitions')
+            for transition in response['transitions']:
+                loaded.setdefault(transition['to']['name'], transition['id'])
+                loaded.setdefault(transition['name'], transition['id'])
+            self._transitions.set(project, loaded)
+            known = loaded
+        if name not in known:
+            raise PropagationFailed(f'No transition named {name} is'
+                                    f' available for {issue_key}')
+        transition_id: str = known[name]
+        return transition_id
+
+    async def _request(self, method: str, path: str,
+                       payload: Optional[dict] = None) -> Any:
+        await self._take_token()
+        try:
+            response = await self._client.request(method, path, json=payload)
+        except httpx.TransportError as e:
+            raise JiraUnavailable('Could not reach Jira') from e
+        if response.status_code == 429:
+            if self._rate_limit is not None:
+                self._rate_limit.slow_down()
+                delay = _retry_after(response.headers)
+                self._rate_limit.pause(1. if delay is None else delay)
+            raise JiraUnavailable('Rate limited by Jira')
+        if response.status_code >= 500:
+            raise JiraUnavailable(f'Jira error: {response.status_code}')
+        if response.status_code == 404:
+            raise PropagationFailed(f'No such resource: {path}')
+        if response.status_code == 400:
+            raise _Rejected(f'Jira rejected the request:'
+                            f' {response.text[:200]}')
+        if response.status_code >= 400:
+            raise PropagationFailed(f'Jira error: {response.status_code}:'
+                                    f' {response.text[:200]}')
+        if self._rate_limit is not None:
+            self._rate_limit.speed_up()
+        return response.json() if response.content else None
+
+    async def _take_token(self) -> None:
+        if self._rate_limit is None:
+            return
+        deadline = time.monotonic() + self._rate_limit_wait
+        while not self._rate_limit.acquire(timeout=0):
+            if time.monotonic() >= deadline:
+                raise JiraUnavailable('Rate limited by Jira')
+            await asyncio.sleep(1 / self._rate_limit.rate)
+
+
+def _issue_key(event: JiraEvent) -> str:
+    issue_key: Optional[str] = event['issue'].get('key')
+    if issue_key is None:
+        raise PropagationFailed('Missing issue key')
+    return issue_key
+
+
+def _comment_id(event: JiraEvent) -> str:
+    comment_id: Optional[str] = event['comment'].get('id')
+    if comment_id is None:
+        raise PropagationFailed('Missing comment id')
+    return comment_id
+
+
+handlers = {
+    JiraEventType.issue_create: AsyncJiraService.create_ticket,
+    JiraEventType.issue_update: AsyncJiraService.update_ticket,
+    JiraEventType.issue_transition: AsyncJiraService.transition_ticket,
+    JiraEventType.comment_create: AsyncJiraService.create_comment,
+    JiraEventType.comment_edit: AsyncJiraService.update_comment,
+    JiraEventType.comment_delete: AsyncJiraService.delete_comment,
+}
+
+
+async def propagate(service: AsyncJiraService, breaker: CircuitBreaker,
+                    jira_event: JiraEvent) -> JiraEvent:
+    """Propagate an event to Jira, guarded by the circuit ``breaker``."""
+    handler = handlers.get(jira_event['event_type'])
+    if handler is None:
+        return jira_event    # Nothing to do.
+    operation = handler.__name__
+    if not breaker.allow():
+        metrics.child(metrics.jira_requests, operation, 'rejected').inc()
+        raise JiraUnavailable('Jira circuit breaker is open')
+    outcome = 'ok'
+    start = time.perf_counter()
+    try:
+        return await _call(service, operation, jira_event, breaker)
+    except JiraUnavailable:
+        outcome = 'unavailable'
+        raise
+    except Exception:
+        outcome = 'failed'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.child(metrics.stage_seconds, 'jira').observe(elapsed)
+        metrics.child(metrics.jira_seconds, operation).observe(elapsed)
+        metrics.child(metrics.jira_requests, operation, outcome).inc()
+
+
+async def _call(service: AsyncJiraService, operation: str,
+                jira_event: JiraEvent, breaker: CircuitBreaker) -> JiraEvent:
+    """Call ``service``, recording the outcome with the ``breaker``."""
+    try:
+        result: JiraEvent = await getattr(service, operation)(jira_event)
+    except KeyError as e:
+        breaker.record_success()    # Our fault, not Jira's.
+        raise PropagationFailed('Missing data') from e
+    except JiraUnavailable:
+        breaker.record_failure()
+        raise
+    except PropagationFailed:
+        breaker.record_success()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return result
@@ -0,0 +1,82 @@
+"""Circuit breaker for calls to Jira."""
+
+import time
+from collections import deque
+from threading import Lock
+from typing import Deque, Dict, Union
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing dependency until it has had time to recover.
+
+    The breaker opens when at least ``min_calls`` of the last ``window``
+    calls were made and the share of failures among them reaches
+    ``failure_rate``. While open, :meth:`allow` returns ``False`` so callers
+    can fail fast. After ``reset_timeout`` seconds a single probe call is
+    allowed (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_rate: float = 0.5, window: int = 20,
+                 min_calls: int = 5, reset_timeout: float = 30.) -> None:
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.reset_timeout = reset_timeout
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._state = CLOSED
+        self._opened_at = 0.
+        self._probing = False
+        self._lock = Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and self._reset_elapsed():
+                return HALF_OPEN
+            return self._state
+
+    def allow(self) -> bool:
+        """Whether a call may be attempted now."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and self._reset_elapsed():
+                self._state = HALF_OPEN
+            if self._state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._probing = False
+            if self._state != CLOSED:
+                self._state = CLOSED
+                self._outcomes.clear()
+            self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._probing = False
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if self._state == HALF_OPEN or (
+                    len(self._outcomes) >= self.min_calls
+                    and failures / len(self._outcomes) >= self.failure_rate):
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+
+    def status(self) -> Dict[str, Union[str, int, float]]:
+        """Summary of the breaker's state, for the status endpoint."""
+        with self._lock:
+            calls = len(self._outcomes)
+            failures = self._outcomes.count(False)
+        return {'state': self.state, 'calls': calls, 'failures': failures,
+                'failure_rate': failures / calls if calls else 0.}
+
+    def _reset_elapsed(self) -> bool:
+        return time.monotonic() - self._opened_at >= self.reset_timeout
@@ -1,20 +1,62 @@
-from typing import Optional
+from collections import Counter
+from typing import Any, Optional, List, Tuple, Iterable, Iterator, \
+    Callable, Dict, Mapping, Set
+from contextlib import contextmanager
 from json import dumps, loads
-from datetime import datetime
+import hashlib
+import zlib
+from datetime import datetime, timedelta
+from threading import local
 
 from pytz import UTC
 from flask import Flask
 import sqlalchemy.types as types
-from sqlalchemy import Column, DateTime, Integer, String, Text, JSON
+from sqlalchemy import Column, DateTime, Integer, BigInteger, String, Text, \
+    JSON, Index, or_, and_, func, inspect
+from sqlalchemy.dialects import mysql
+from sqlalchemy.orm import deferred, undefer
 from flask_sqlalchemy import SQLAlchemy, Model
 from sqlalchemy.orm.exc import NoResultFound
+from sqlalchemy.exc import IntegrityError
 
 from arxiv.util.serialize import ISO8601JSONDecoder
+from .. import metrics
+from ..cache import LRUCache, MISSING
+from ..coalesce import COALESCED_ACTIONS, coalesce, edit_key
 from ..serialize import EnumJSONEncoder
-from ..domain import GithubEvent, JiraEvent
+from ..domain import GithubEvent, JiraEvent, GithubEventType, GithubAction, \
+    GithubEventActionType, project_github_event
 
 db: SQLAlchemy = SQLAlchemy()
 
+PENDING = 'pending'
+PROCESSING = 'processing'
+DONE = 'done'
+FAILED = 'failed'
+SUPERSEDED = 'superseded'
+RETRY = 'retry'
+DEAD = 'dead'
+IGNORED = 'ignored'
+WAITING = 'waiting'
+
+FINISHED = (DONE, SUPERSEDED, IGNORED)
+"""
+Statuses of events that will not be touched again, and can be archived.
+
+Events that lapsed while claimed or waiting are also ``failed``, until they
+are scheduled for a retry or dead-lettered; only ``failed`` events with no
+``next_attempt_at`` (e.g. malformed ones) are finished.
+"""
+
+issue_keys = LRUCache(name='issue_keys')
+"""Cache of GitHub issue ID -> Jira issue key."""
+
+comment_ids = LRUCache(name='comment_ids')
+"""Cache of GitHub comment ID -> Jira comment ID."""
+
+waiting_counts: 'Counter[str]' = metrics.Counts(metrics.waiting_events)
+"""Counts of events ``parked``/``released`` while waiting for their issue."""
+
 
 class Nada(Exception):
     """Zilch."""
@@ -41,6 +83,42 @@ class FriendlyJSONType(types.TypeDecorator):
         return None
 
 
+class CompressedJSONType(types.TypeDecorator):
+    """
+    JSON, compressed with zlib and stored as a blob.
+
+    Timestamps are read back as datetimes unless ``parse_dates`` is false.
+    """
+
+    impl = types.LargeBinary
+
+    def __init__(self, *args: Any, parse_dates: bool = True,
+                 **kwargs: Any) -> None:
+        super(CompressedJSONType, self).__init__(*args, **kwargs)
+        self.parse_dates = parse_dates
+
+    def load_dialect_impl(self, dialect: Any) -> Any:
+        if dialect.name == 'mysql':
+            return dialect.type_descriptor(mysql.MEDIUMBLOB())
+        return dialect.type_descriptor(types.LargeBinary())
+
+    def process_bind_param(self, obj: Optional[dict], dialect: Any) \
+            -> Optional[bytes]:
+        if obj is not None:
+            return zlib.compress(dumps(obj, cls=EnumJSONEncoder,
+                                       separators=(',', ':')).encode('utf-8'))
+        return None
+
+    def process_result_value(self, value: Optional[bytes], dialect: Any) \
+            -> Optional[dict]:
+        if value is not None:
+            obj: dict = loads(zlib.decompress(value).decode('utf-8'),
+                              cls=ISO8601JSONDecoder if self.parse_dates
+                              else None)
+            return obj
+        return None
+
+
 # FriendlyJSON = JSON().with_variant(FriendlyJSONType, 'sqlite') \
 #     .with_variant(FriendlyJSONType, 'mysql')
 
@@ -49,12 +127,70 @@ class DBGithubEvent(db.Model):
     """Model for GitHub events."""
 
     __tablename__ = 'github_event'
+    __table_args__ = (
+        Index('ix_github_event_type_action', 'event_type', 'event_action'),
+    )
 
     event_id = Column(Integer, primary_key=True)
     event_type = Column(String(50))
     event_action = Column(String(50))
-    created = Column(DateTime)
-    body = Column(FriendlyJSONType)
+    created = Column(DateTime, index=True)
+    body = deferred(Column(FriendlyJSONType))
+    """The full payload, as stored before ``payload`` was introduced."""
+    payload = deferred(Column(CompressedJSONType))
+    """The parts of the payload that we use; loaded only when accessed."""
+    status = Column(String(20), default=DONE, index=True)
+    issue_id = Column(BigInteger, index=True)
+    comment_id = Column(BigInteger, index=True)
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, index=True)
+    last_error = Column(Text)
+
+
+class DBDeadLetter(db.Model):
+    """A queued event that exhausted its retries."""
+
+    __tablename__ = 'dead_letter'
+
+    event_id = Column(Integer, primary_key=True)
+    """The ``event_id`` of the :class:`.DBGithubEvent`."""
+    attempts = Column(Integer)
+    last_error = Column(Text)
+    dead_at = Column(DateTime)
+
+
+class DBDelivery(db.Model):
+    """A webhook delivery, identified by its ``X-GitHub-Delivery`` header."""
+
+    __tablename__ = 'delivery'
+
+    delivery_id = Column(String(64), primary_key=True)
+    created = Column(DateTime, index=True)
+    status_code = Column(Integer)
+    """``None`` while the delivery is being handled."""
+    result = Column(FriendlyJSONType)
+
+
+class BackfillCheckpoint(db.Model):
+    """How far the import of a repository's existing issues has got."""
+
+    __tablename__ = 'backfill_checkpoint'
+
+    repository = Column(String(255), primary_key=True)
+    last_issue_number = Column(Integer)
+    updated = Column(DateTime)
+
+
+class GithubETag(db.Model):
+    """A page from the GitHub API, kept for conditional requests."""
+
+    __tablename__ = 'github_etag'
+
+    url_hash = Column(String(64), primary_key=True)
+    """SHA-256 of the URL, which may be too long for a key."""
+    url = Column(Text)
+    etag = Column(String(255))
+    body = Column(CompressedJSONType(parse_dates=False))
 
 
 class IssueMap(db.Model):
@@ -63,6 +199,7 @@ class IssueMap(db.Model):
 
     github_issue_id = Column(Integer, primary_key=True)
     jira_issue_key = Column(String(50), primary_key=True)
+    content_hash = Column(String(64))
 
 
 class CommentMap(db.Model):
@@ -71,53 +208,886 @@ class CommentMap(db.Model):
 
     github_comment_id = Column(Integer, primary_key=True)
     jira_comment_id = Column(String(50), primary_key=True)
+    content_hash = Column(String(64))
 
 
 
+_local = local()
+
+
+def _pending_callbacks() -> List[Callable[[], None]]:
+    if not hasattr(_local, 'callbacks'):
+        _local.callbacks = []
+    callbacks: List[Callable[[], None]] = _local.callbacks
+    return callbacks
+
+
+@contextmanager
+def unit_of_work() -> Iterator[None]:
+    """
+    Group the writes made inside the block into a single transaction.
+
+    The store/update functions in this module only flush while a unit of work
+    is active; the transaction is committed once when the outermost block
+    exits, or rolled back if it raises. Cache updates are deferred until the
+    commit succeeds.
+    """
+    depth = getattr(_local, 'depth', 0)
+    _local.depth = depth + 1
+    try:
+        yield
+    except Exception:
+        _local.depth = depth
+        if depth == 0:
+            db.session.rollback()
+            _pending_callbacks().clear()
+        raise
+    _local.depth = depth
+    if depth == 0:
+        _commit()
+
+
+def _commit(on_commit: Optional[Callable[[], None]] = None) -> None:
+    """Commit, or just flush if a unit of work is active."""
+    callbacks = _pending_callbacks()
+    if on_commit is not None:
+        callbacks.append(on_commit)
+    if getattr(_local, 'depth', 0) > 0:
+        db.session.flush()
+        return
+    try:
+        db.session.commit()
+    except Exception:
+        callbacks.clear()
+        raise
+    while callbacks:
+        callbacks.pop(0)()
+
+
 def init_app(app: Flask) -> None:
+    global issue_keys, comment_ids
     db.init_app(app)
+    issue_keys = LRUCache(app.config['MAPPING_CACHE_SIZE'],
+                          app.config['MAPPING_CACHE_TTL'],
+                          app.config['MAPPING_CACHE_NEGATIVE_TTL'],
+                          name='issue_keys')
+    comment_ids = LRUCache(app.config['MAPPING_CACHE_SIZE'],
+                           app.config['MAPPING_CACHE_TTL'],
+                           app.config['MAPPING_CACHE_NEGATIVE_TTL'],
+                           name='comment_ids')
+
+
+def use_database(app: Flask, uri: str) -> None:
+    """
+    Connect ``app`` to the database at ``uri``, e.g. with new credentials.
+
+    New transactions use a new engine. Idle connections of the old engine
+    are closed; connections in use finish their transactions first.
+    """
+    old = db.get_engine(app)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    if db.get_engine(app) is not old:
+        old.dispose()
 
 
 def create_all() -> None:
     db.create_all()
 
 
+def add_missing_columns() -> List[str]:
+    """
+    Add model columns that are missing from existing tables.
+
+    :func:`create_all` creates missing tables but does not alter existing
+    ones. New columns are all nullable, so they can simply be added.
+    Returns the columns that were added, as ``table.column``.
+    """
+    inspector = inspect(db.engine)
+    existing_tables = inspector.get_table_names()
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name']
+                    for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            db.session.execute(f'ALTER TABLE {table.name}'
+                               f' ADD COLUMN {column.name} {column_type}')
+            added.append(f'{table.name}.{column.name}')
+    db.session.commit()
+    return added
+
+
+def add_missing_indexes() -> List[str]:
+    """Create model indexes that are missing from existing tables."""
+    inspector = inspect(db.engine)
+    existing_tables = inspector.get_table_names()
+    added = []
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(db.engine)
+                added.append(index.name)
+    return added
+
+
+def compress_event_bodies(batch_size: int = 500) -> int:
+    """
+    Move a batch of events from ``body`` to the projected ``payload``.
+
+    Returns the number of events converted; call until it returns 0.
+    """
+    rows = db.session.query(DBGithubEvent) \
+        .options(undefer('body')) \
+        .filter(DBGithubEvent.payload.is_(None)) \
+        .filter(DBGithubEvent.body.isnot(None)) \
+        .order_by(DBGithubEvent.event_id) \
+        .limit(batch_size) \
+        .all()
+    for row in rows:
+        row.payload = project_github_event(row.body)
+        row.body = None
+    db.session.commit()
+    return len(rows)
+
+
 def get_jira_issue_key(github_issue_id: str) -> Optional[str]:
+    cached = issue_keys.get(github_issue_id)
+    if cached is not MISSING:
+        return cached
     result = db.session.query(IssueMap.jira_issue_key) \
         .filter(IssueMap.github_issue_id==github_issue_id) \
         .first()
     if isinstance(result, tuple):
+        issue_keys.set(github_issue_id, result[0])
         return result[0]
+    issue_keys.set_missing(github_issue_id)
     return None
 
 
 def get_jira_comment_id(github_comment_id: str) -> Optional[str]:
+    cached = comment_ids.get(github_comment_id)
+    if cached is not MISSING:
+        return cached
     result = db.session.query(CommentMap.jira_comment_id) \
         .filter(CommentMap.github_comment_id==github_comment_id) \
         .first()
     if isinstance(result, tuple):
+        comment_ids.set(github_comment_id, result[0])
         return result[0]
+    comment_ids.set_missing(github_comment_id)
     return None
 
 
-def store_github_event(gh_event: GithubEvent) -> GithubEvent:
-    db.session.add(DBGithubEvent(
-        event_type=gh_event['event_type'].value[0].value,
-        event_action=gh_event['action'],
-        created=datetime.now(UTC),
-        body=gh_event
-    ))
+def _github_event_row(gh_event: GithubEvent, status: str,
+                      attempts: int = 0) -> dict:
+    return {
+        'event_type': gh_event['event_type'].value[0].value,
+        'event_action': gh_event['action'],
+        'created': datetime.now(UTC),
+        'payload': project_github_event(gh_event),
+        'status': status,
+        'attempts': attempts,
+        'issue_id': gh_event['issue'].get('id'),
+        'comment_id': (gh_event.get('comment') or {}).get('id')
+    }
+
+
+def store_github_event(gh_event: GithubEvent, status: str = DONE,
+                       attempts: int = 0,
+                       claim_timeout: Optional[float] = None) -> int:
+    """
+    Store a GitHub event, returning its ``event_id``.
+
+    An event stored as ``processing`` should have a ``claim_timeout``, after
+    which :func:`claim_stale_events` takes it over.
+    """
+    db_event = DBGithubEvent(**_github_event_row(gh_event, status, attempts))
+    if claim_timeout is not None:
+        db_event.next_attempt_at = datetime.now(UTC) \
+            + timedelta(seconds=claim_timeout)
+    db.session.add(db_event)
+    _commit()
+    event_id: int = db_event.event_id
+    return event_id
+
+
+def store_github_events(gh_events: Iterable[GithubEvent],
+                        status: str = DONE) -> int:
+    """
+    Store many GitHub events with a single multi-row insert.
+
+    Intended for replay and backfill. Returns the number of events stored.
+    """
+    rows = [_github_event_row(gh_event, status) for gh_event in gh_events]
+    if rows:
+        db.session.execute(DBGithubEvent.__table__.insert(), rows)
+        _commit()
+    return len(rows)
+
+
+def enqueue_github_event(gh_event: GithubEvent) -> int:
+    """Store a GitHub event for later propagation by the worker."""
+    return store_github_event(gh_event, status=PENDING)
+
+
+def has_earlier_events(event_id: int, issue_id: int) -> bool:
+    """
+    Check whether an event stored before ``event_id`` on the same issue is
+    still queued, being propagated, waiting or to be retried.
+
+    Such an event would overwrite a later one if the later one were
+    propagated first.
+    """
+    earlier = db.session.query(DBGithubEvent.event_id) \
+        .filter(DBGithubEvent.issue_id == issue_id) \
+        .filter(DBGithubEvent.event_id < event_id) \
+        .filter(DBGithubEvent.status.in_((PENDING, PROCESSING, RETRY,
+                                          WAITING))) \
+        .first()
+    return earlier is not None
+
+
+def set_event_status(event_id: int, status: str) -> None:
+    """Set the status of an event, releasing any claim on it."""
+    db.session.query(DBGithubEvent) \
+        .filter(DBGithubEvent.event_id == event_id) \
+        .update({DBGithubEvent.status: status,
+                 DBGithubEvent.next_attempt_at: None},
+                synchronize_session=False)
+    _commit()
+
+
+def release_event(event_id: int, retry_in: Optional[float] = None) -> None:
+    """
+    Return a claimed event to the queue without counting the attempt.
+
+    If ``retry_in`` is given, the event was claimed for a retry, and is
+    returned to be retried after that many seconds.
+    """
+    if retry_in is None:
+        changes = {DBGithubEvent.status: PENDING,
+                   DBGithubEvent.next_attempt_at: None}
+    else:
+        changes = {DBGithubEvent.status: RETRY,
+                   DBGithubEvent.next_attempt_at:
+                       datetime.now(UTC) + timedelta(seconds=retry_in)}
+    changes[DBGithubEvent.attempts] = DBGithubEvent.attempts - 1
+    db.session.query(DBGithubEvent) \
+        .filter(DBGithubEvent.event_id == event_id) \
+        .update(changes, synchronize_session=False)
+    _commit()
+
+
+def claim_pending_events(limit: int, coalesce_window: float = 0.,
+                         timeout: float = 600., max_pages: int = 10) \
+        -> List[Tuple[int, GithubEvent]]:
+    """
+    Claim up to ``limit`` pending events, oldest first.
+
+    Claimed rows are moved to ``processing`` and their attempt count is
+    incremented in the same transaction. On MySQL the rows are locked with
+    ``SKIP LOCKED`` so that several workers can drain the queue at once. A
+    claim that is not finished within ``timeout`` seconds can be taken over
+    with :func:`claim_stale_events`.
+
+    If ``coalesce_window`` is set, edits are debounced: an edit is left
+    pending until its issue or comment has not been edited for that many
+    seconds, and edits followed by a later pending edit or delete of the
+    same resource are marked ``superseded`` without being propagated. Later
+    events on an issue with a held edit are held with it.
+
+    Events are also held while an earlier event on the same issue is being
+    retried or propagated, so that they do not overtake it. So that held
+    events do not use up the batch, up to ``max_pages`` pages of ``limit``
+    events are read to fill it.
+    """
+    def read_page(after: int) -> List[DBGithubEvent]:
+        rows: List[DBGithubEvent] = db.session.query(DBGithubEvent) \
+            .options(undefer('payload'), undefer('body')) \
+            .filter(DBGithubEvent.status == PENDING) \
+            .filter(DBGithubEvent.event_id > after) \
+            .order_by(DBGithubEvent.event_id) \
+            .limit(limit) \
+            .with_for_update(skip_locked=True) \
+            .all()
+        return rows
+
+    cutoff = datetime.now(UTC) - timedelta(seconds=coalesce_window)
+    held_issues: Set[int] = set()
+    ready: List[DBGithubEvent] = []
+    last_id = 0
+    for _ in range(max_pages):
+        rows = read_page(last_id)
+        held_issues |= _issues_in_progress(rows)
+        if coalesce_window > 0:
+            page, _, superseded = coalesce(rows, _latest_pending_edits(rows),
+                                           cutoff, held_issues)
+            for row in superseded:
+                row.status = SUPERSEDED
+        else:
+            page = [row for row in rows if row.issue_id not in held_issues]
+        ready += page
+        if len(rows) < limit or len(ready) >= limit:
+            break
+        last_id = rows[-1].event_id
+    return _claim(ready[:limit], timeout)
+
+
+def claim_retry_events(limit: int, timeout: float = 600.) \
+        -> List[Tuple[int, GithubEvent]]:
+    """Claim up to ``limit`` failed events that are due to be retried."""
+    rows = db.session.query(DBGithubEvent) \
+        .options(undefer('payload'), undefer('body')) \
+        .filter(DBGithubEvent.status == RETRY) \
+        .filter(DBGithubEvent.next_attempt_at <= datetime.now(UTC)) \
+        .order_by(DBGithubEvent.event_id) \
+        .limit(limit) \
+        .with_for_update(skip_locked=True) \
+        .all()
+    return _claim(rows, timeout)
+
+
+def _claim(rows: List[DBGithubEvent], timeout: float) \
+        -> List[Tuple[int, GithubEvent]]:
+    expires = datetime.now(UTC) + timedelta(seconds=timeout)
+    for row in rows:
+        row.status = PROCESSING
+        row.attempts = (row.attempts or 0) + 1
+        row.next_attempt_at = expires    # When the claim lapses.
+    claimed = [(row.event_id, _load_github_event(row)) for row in rows]
     db.session.commit()
+    return claimed
+
+
+def claim_stale_events(limit: int) -> List[int]:
+    """
+    Claim up to ``limit`` events whose claim lapsed before they were done.
+
+    This happens if the process handling them died. The events are marked
+    ``failed``, to be retried; ``next_attempt_at`` is kept until then, so
+    that they are not archived.
+    """
+    rows = db.session.query(DBGithubEvent) \
+        .filter(DBGithubEvent.status == PROCESSING) \
+        .filter(DBGithubEvent.next_attempt_at <= datetime.now(UTC)) \
+        .order_by(DBGithubEvent.event_id) \
+        .limit(limit) \
+        .with_for_update(skip_locked=True) \
+        .all()
+    for row in rows:
+        row.status = FAILED
+    event_ids = [row.event_id for row in rows]
+    db.session.commit()
+    return event_ids
+
+
+def get_attempts(event_id: int) -> int:
+    result = db.session.query(DBGithubEvent.attempts) \
+        .filter(DBGithubEvent.event_id == event_id) \
+        .first()
+    if isinstance(result, tuple):
+        return result[0] or 0
+    return 0
+
+
+def schedule_retry(event_id: int, error: str, delay: float) -> None:
+    """Mark an event for another attempt in ``delay`` seconds."""
+    db.session.query(DBGithubEvent) \
+        .filter(DBGithubEvent.event_id == event_id) \
+        .update({DBGithubEvent.status: RETRY,
+                 DBGithubEvent.next_attempt_at:
+                    datetime.now(UTC) + timedelta(seconds=delay),
+                 DBGithubEvent.last_error: error},
+                synchronize_session=False)
+    _commit()
+
+
+def dead_letter(event_id: int, error: str) -> None:
+    """Give up on an event, recording it in the dead-letter table."""
+    attempts = get_attempts(event_id)
+    db.session.query(DBGithubEvent) \
+        .filter(DBGithubEvent.event_id == event_id) \
+        .update({DBGithubEvent.status: DEAD,
+                 DBGithubEvent.next_attempt_at: None,
+                 DBGithubEvent.last_error: error},
+                synchronize_session=False)
+    db.session.merge(DBDeadLetter(event_id=event_id, attempts=attempts,
+                                  last_error=error, dead_at=datetime.now(UTC)))
+    _commit()
+
+
+def list_dead_letters(limit: int = 100) -> List[dict]:
+    rows = db.session.query(DBDeadLetter, DBGithubEvent) \
+        .join(DBGithubEvent,
+              DBGithubEvent.event_id == DBDeadLetter.event_id) \
+        .order_by(DBDeadLetter.dead_at.desc()) \
+        .limit(limit) \
+        .all()
+    return [{'event_id': letter.event_id,
+             'event_type': event.event_type,
+             'event_action': event.event_action,
+             'issue_id': event.issue_id,
+             'comment_id': event.comment_id,
+             'created': event.created,
+             'dead_at': letter.dead_at,
+             'attempts': letter.attempts,
+             'last_error': letter.last_error}
+            for letter, event in rows]
+
+
+def requeue_dead_letter(event_id: int) -> bool:
+    """Put a dead-lettered event back on the queue with a fresh budget."""
+    deleted = db.session.query(DBDeadLetter) \
+        .filter(DBDeadLetter.event_id == event_id) \
+        .delete(synchronize_session=False)
+    if not deleted:
+        return False
+    db.session.query(DBGithubEvent) \
+        .filter(DBGithubEvent.event_id == event_id) \
+        .update({DBGithubEvent.status: PENDING,
+                 DBGithubEvent.attempts: 0,
+                 DBGithubEvent.next_attempt_at: None},
+                synchronize_session=False)
+    _commit()
+    return True
+
+
+def iter_github_events(start_id: Optional[int] = None,
+                       end_id: Optional[int] = None,
+                       since: Optional[datetime] = None,
+                       until: Optional[datetime] = None,
+                       statuses: Optional[Iterable[str]] = None,
+                       page_size: int = 500) \
+        -> Iterator[Tuple[int, GithubEvent]]:
+    """
+    Stream stored events in ``event_id`` order, e.g. to replay them.
+
+    Rows are read a page at a time using keyset pagination on ``event_id``
+    (so each page is an index range scan no matter how far in we are) and a
+    server-side cursor where the driver supports one, so the table is never
+    loaded into memory at once. Bounds are inclusive, except ``until``.
+    """
+    columns = (DBGithubEvent.event_id, DBGithubEvent.event_type,
+               DBGithubEvent.event_action, DBGithubEvent.payload,
+               DBGithubEvent.body)
+    last = start_id - 1 if start_id is not None else None
+    while True:
+        query = db.session.query(*columns)
+        if last is not None:
+            query = query.filter(DBGithubEvent.event_id > last)
+        if end_id is not None:
+            query = query.filter(DBGithubEvent.event_id <= end_id)
+        if since is not None:
+            query = query.filter(DBGithubEvent.created >= since)
+        if until is not None:
+            query = query.filter(DBGithubEvent.created < until)
+        if statuses is not None:
+            query = query.filter(DBGithubEvent.status.in_(list(statuses)))
+        rows = query.order_by(DBGithubEvent.event_id) \
+            .limit(page_size) \
+            .execution_options(stream_results=True) \
+            .all()
+        for row in rows:
+            yield row.event_id, _load_github_event(row)
+        if len(rows) < page_size:
+            return
+        last = rows[-1].event_id
+
+
+def park_event(event_id: int, issue_id: int, timeout: float) -> None:
+    """
+    Hold an event until its issue is mapped, for up to ``timeout`` seconds.
+
+    The event is moved back to ``pending`` in the same transaction that
+    stores the issue's mapping (see :func:`store_issue_mapping`). In case
+    the mapping was committed while the event was being parked, it is
+    released right away.
+    """
+    db.session.query(DBGithubEvent) \
+        .filter(DBGithubEvent.event_id == event_id) \
+        .update({DBGithubEvent.status: WAITING,
+                 DBGithubEvent.next_attempt_at:
+                    datetime.now(UTC) + timedelta(seconds=timeout)},
+                synchronize_session=False)
+    _commit(lambda: waiting_counts.update(['parked']))
+    mapped = db.session.query(IssueMap.jira_issue_key) \
+        .filter(IssueMap.github_issue_id == issue_id) \
+        .first()
+    if mapped is not None:
+        released = _release_waiting_events([issue_id])
+        _commit(lambda: waiting_counts.update({'released': released}))
+
+
+def count_waiting_events() -> int:
+    count: int = db.session.query(func.count(DBGithubEvent.event_id)) \
+        .filter(DBGithubEvent.status == WAITING) \
+        .scalar()
+    return count
+
+
+def claim_expired_waiting_events(limit: int) -> List[int]:
+    """Claim up to ``limit`` events that have waited too long for an issue."""
+    rows = db.session.query(DBGithubEvent) \
+        .filter(DBGithubEvent.status == WAITING) \
+        .filter(DBGithubEvent.next_attempt_at <= datetime.now(UTC)) \
+        .order_by(DBGithubEvent.event_id) \
+        .limit(limit) \
+        .with_for_update(skip_locked=True) \
+        .all()
+    for row in rows:
+        row.status = FAILED
+    event_ids = [row.event_id for row in rows]
+    db.session.commit()
+    return event_ids
+
+
+def _release_waiting_events(issue_ids: List[int]) -> int:
+    released: int = db.session.query(DBGithubEvent) \
+        .filter(DBGithubEvent.status == WAITING) \
+        .filter(DBGithubEvent.issue_id.in_(issue_ids)) \
+        .update({DBGithubEvent.status: PENDING,
+                 DBGithubEvent.next_attempt_at: None},
+                synchronize_session=False)
+    return released
+
+
+def get_finished_events(before: datetime, limit: int) \
+        -> List[Tuple[int, str, str, datetime, str, dict]]:
+    """
+    Get the oldest finished events stored before ``before``, for archival.
+
+    Returns ``(event_id, event_type, event_action, created, status, body)``
+    tuples, where ``body`` is in the projected format.
+    """
+    rows = db.session.query(DBGithubEvent.event_id, DBGithubEvent.event_type,
+                            DBGithubEvent.event_action,
+                            DBGithubEvent.created, DBGithubEvent.status,
+                            DBGithubEvent.payload, DBGithubEvent.body) \
+        .filter(DBGithubEvent.created < before) \
+        .filter(or_(DBGithubEvent.status.in_(FINISHED),
+                    and_(DBGithubEvent.status == FAILED,
+                         DBGithubEvent.next_attempt_at.is_(None)))) \
+        .order_by(DBGithubEvent.event_id) \
+        .limit(limit) \
+        .all()
+    return [(row.event_id, row.event_type, row.event_action, row.created,
+             row.status,
+             row.payload if row.payload is not None
+             else project_github_event(row.body or {}))
+            for row in rows]
+
+
+def delete_events(event_ids: List[int]) -> int:
+    """Delete events, e.g. once they have been archived."""
+    deleted: int = db.session.query(DBGithubEvent) \
+        .filter(DBGithubEvent.event_id.in_(event_ids)) \
+        .delete(synchronize_session=False)
+    _commit()
+    return deleted
+
+
+def monthly_partitions_ddl(start: datetime, months: int) -> str:
+    """
+    Get the DDL to partition ``github_event`` by month of ``created``.
+
+    MySQL only. Partitions start with the month of ``start``; later events
+    go to ``pmax`` until :func:`add_monthly_partitions_ddl` splits it. The
+    partitioning column has to be part of the primary key.
+    """
+    partitions = ',\n'.join(
+        [_partition(month) for month in _months(start, months)]
+        + ['  PARTITION pmax VALUES LESS THAN MAXVALUE']
+    )
+    return ('ALTER TABLE github_event'
+            ' DROP PRIMARY KEY, ADD PRIMARY KEY (event_id, created)\n'
+            f'PARTITION BY RANGE (TO_DAYS(created)) (\n{partitions}\n)')
+
+
+def add_monthly_partitions_ddl(start: datetime, months: int) -> str:
+    """Get the DDL to split monthly partitions off ``pmax`` (MySQL)."""
+    partitions = ',\n'.join(
+        [_partition(month) for month in _months(start, months)]
+        + ['  PARTITION pmax VALUES LESS THAN MAXVALUE']
+    )
+    return ('ALTER TABLE github_event REORGANIZE PARTITION pmax INTO (\n'
+            f'{partitions}\n)')
+
+
+def _months(start: datetime, months: int) -> List[datetime]:
+    first = datetime(start.year, start.month, 1)
+    return [datetime(first.year + (first.month - 1 + i) // 12,
+                     (first.month - 1 + i) % 12 + 1, 1)
+            for i in range(months)]
+
+
+def _partition(month: datetime) -> str:
+    following = _months(month, 2)[1]
+    return (f'  PARTITION p{month:%Y%m}'
+            f" VALUES LESS THAN (TO_DAYS('{following:%Y-%m-%d}'))")
+
+
+def _issues_in_progress(rows: List[DBGithubEvent]) -> Set[int]:
+    """Get the issues in ``rows`` with an earlier event not yet finished."""
+    first: Dict[int, int] = {}
+    for row in rows:
+        first.setdefault(row.issue_id, row.event_id)
+    if not first:
+        return set()
+    earliest = db.session.query(DBGithubEvent.issue_id,
+                                func.min(DBGithubEvent.event_id)) \
+        .filter(DBGithubEvent.issue_id.in_(first)) \
+        .filter(DBGithubEvent.status.in_((RETRY, PROCESSING))) \
+        .group_by(DBGithubEvent.issue_id)
+    return {issue_id for issue_id, event_id in earliest
+            if event_id < first[issue_id]}
+
+
+def _latest_pending_edits(rows: List[DBGithubEvent]) -> dict:
+    """Get the newest pending edit or delete for each resource in ``rows``."""
+    issue_ids = {row.issue_id for row in rows if edit_key(row) is not None
+                 and row.event_type != 'IssueCommentEvent'}
+    comment_ids = {row.comment_id for row in rows if edit_key(row) is not None
+                   and row.event_type == 'IssueCommentEvent'}
+    if not issue_ids and not comment_ids:
+        return {}
+    newest = db.session.query(func.max(DBGithubEvent.event_id)) \
+        .filter(DBGithubEvent.status == PENDING) \
+        .filter(DBGithubEvent.event_action.in_(COALESCED_ACTIONS)) \
+        .filter(or_(
+            and_(DBGithubEvent.event_type != 'IssueCommentEvent',
+                 DBGithubEvent.issue_id.in_(issue_ids)),
+            and_(DBGithubEvent.event_type == 'IssueCommentEvent',
+                 DBGithubEvent.comment_id.in_(comment_ids))
+        )) \
+        .group_by(DBGithubEvent.event_type, DBGithubEvent.issue_id,
+                  DBGithubEvent.comment_id)
+    latest = db.session.query(DBGithubEvent) \
+        .filter(DBGithubEvent.event_id.in_(newest.subquery())) \
+        .all()
+    return {edit_key(row): row for row in latest}
+
+
+def _load_github_event(row: Any) -> GithubEvent:
+    """Rehydrate a stored event body into a :class:`.GithubEvent`."""
+    return load_github_event(row.event_type, row.event_action,
+                             row.payload if row.payload is not None
+                             else row.body)
+
+
+def load_github_event(event_type: str, event_action: str,
+                      body: dict) -> GithubEvent:
+    """Rehydrate an event body, e.g. from the database or an archive."""
+    gh_event: GithubEvent = dict(body)
+    gh_event['event_type'] = GithubEventActionType((
+        GithubEventType(event_type),
+        GithubAction(event_action)
+    ))
     return gh_event
 
 
-def store_comment_mapping(gh_comment_id: str, jira_comment_id: str) -> None:
-    db.session.add(CommentMap(github_comment_id=gh_comment_id,
-                              jira_comment_id=jira_comment_id))
+def claim_delivery(delivery_id: str, ttl: float = 300.) \
+        -> Optional[Tuple[dict, int]]:
+    """
+    Claim a webhook delivery before handling it.
+
+    The claim is committed immediately (outside of any unit of work), so
+    that concurrent redeliveries see it. A claim that has not been completed
+    within ``ttl`` seconds, e.g. because the process handling it died, is
+    taken over by the next redelivery.
+
+    Returns
+    -------
+    tuple or None
+        ``None`` if the delivery was claimed. Otherwise, the response body
+        and status code of the original delivery, or a 202 placeholder if
+        the original delivery is still being handled.
+
+    """
+    now = datetime.now(UTC)
+    db.session.add(DBDelivery(delivery_id=delivery_id, created=now))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+    else:
+        return None
+    # Take over a claim whose handler died without releasing it.
+    stale = now - timedelta(seconds=ttl)
+    taken: int = db.session.query(DBDelivery) \
+        .filter(DBDelivery.delivery_id == delivery_id) \
+        .filter(DBDelivery.status_code.is_(None)) \
+        .filter(DBDelivery.created < stale) \
+        .update({DBDelivery.created: now}, synchronize_session=False)
     db.session.commit()
+    if taken:
+        return None
+    row = db.session.query(DBDelivery).get(delivery_id)
+    if row is None or row.status_code is None:
+        return {'result': 'in progress'}, 202
+    return row.result, row.status_code
+
+
+def record_delivery(delivery_id: str, result: dict, status_code: int) -> None:
+    """Record the response to a claimed delivery."""
+    db.session.query(DBDelivery) \
+        .filter(DBDelivery.delivery_id == delivery_id) \
+        .update({DBDelivery.status_code: int(status_code),
+                 DBDelivery.result: result},
+                synchronize_session=False)
+    _commit()
 
 
-def store_issue_mapping(gh_issue_id: int, jira_issue_key: str) -> None:
+def release_delivery(delivery_id: str) -> None:
+    """Drop the claim on a delivery that could not be handled."""
+    db.session.rollback()
+    db.session.query(DBDelivery) \
+        .filter(DBDelivery.delivery_id == delivery_id) \
+        .delete(synchronize_session=False)
+    _commit()
+
+
+def delete_deliveries(before: datetime, limit: int = 1000) -> int:
+    """Delete up to ``limit`` deliveries received before ``before``."""
+    delivery_ids = [row.delivery_id for row in
+                    db.session.query(DBDelivery.delivery_id)
+                    .filter(DBDelivery.created < before)
+                    .limit(limit)]
+    if not delivery_ids:
+        return 0
+    deleted: int = db.session.query(DBDelivery) \
+        .filter(DBDelivery.delivery_id.in_(delivery_ids)) \
+        .delete(synchronize_session=False)
+    _commit()
+    return deleted
+
+
+def store_comment_mapping(gh_comment_id: str, jira_comment_id: str,
+                          content_hash: Optional[str] = None) -> None:
+    db.session.add(CommentMap(github_comment_id=gh_comment_id,
+                              jira_comment_id=jira_comment_id,
+                              content_hash=content_hash))
+    _commit(lambda: comment_ids.set(gh_comment_id, jira_comment_id))
+
+
+def store_issue_mapping(gh_issue_id: int, jira_issue_key: str,
+                        content_hash: Optional[str] = None) -> None:
     db.session.add(IssueMap(github_issue_id=gh_issue_id,
-                            jira_issue_key=jira_issue_key))
-    db.session.commit()
+                            jira_issue_key=jira_issue_key,
+                            content_hash=content_hash))
+    released = _release_waiting_events([gh_issue_id])
+
+    def on_commit() -> None:
+        issue_keys.set(gh_issue_id, jira_issue_key)
+        waiting_counts['released'] += released
+    _commit(on_commit)
+
+
+def store_issue_mappings(mappings: Iterable[Tuple[int, str, Optional[str]]]) \
+        -> None:
+    """Store many ``(issue ID, issue key, content hash)`` mappings at once."""
+    rows = [{'github_issue_id': gh_id, 'jira_issue_key': key,
+             'content_hash': content_hash}
+            for gh_id, key, content_hash in mappings]
+    if not rows:
+        return
+    db.session.execute(IssueMap.__table__.insert(), rows)
+    released = _release_waiting_events([row['github_issue_id']
+                                        for row in rows])
+
+    def on_commit() -> None:
+        for row in rows:
+            issue_keys.set(row['github_issue_id'], row['jira_issue_key'])
+        waiting_counts['released'] += released
+    _commit(on_commit)
+
+
+def store_comment_mappings(
+        mappings: Iterable[Tuple[int, str, Optional[str]]]) -> None:
+    """Store many ``(comment ID, Jira comment ID, hash)`` mappings at once."""
+    rows = [{'github_comment_id': gh_id, 'jira_comment_id': jira_id,
+             'content_hash': content_hash}
+            for gh_id, jira_id, content_hash in mappings]
+    if not rows:
+        return
+    db.session.execute(CommentMap.__table__.insert(), rows)
+
+    def fill_cache() -> None:
+        for row in rows:
+            comment_ids.set(row['github_comment_id'], row['jira_comment_id'])
+    _commit(fill_cache)
+
+
+def get_backfill_checkpoint(repository: str) -> int:
+    """Get the number of the last issue imported from ``repository``."""
+    result = db.session.query(BackfillCheckpoint.last_issue_number) \
+        .filter(BackfillCheckpoint.repository == repository) \
+        .first()
+    if isinstance(result, tuple) and result[0] is not None:
+        return int(result[0])
+    return 0
+
+
+def set_backfill_checkpoint(repository: str, last_issue_number: int) -> None:
+    db.session.merge(BackfillCheckpoint(repository=repository,
+                                        last_issue_number=last_issue_number,
+                                        updated=datetime.now(UTC)))
+    _commit()
+
+
+def load_github_etags() -> Dict[str, Tuple[str, Any]]:
+    """Get the stored GitHub pages, as URL -> ``(ETag, body)``."""
+    return {row.url: (row.etag, row.body)
+            for row in GithubETag.query.yield_per(100)}
+
+
+def store_github_etags(pages: Mapping[str, Tuple[str, Any]]) -> None:
+    """Store or replace GitHub pages, given as URL -> ``(ETag, body)``."""
+    for url, (etag, body) in pages.items():
+        db.session.merge(GithubETag(
+            url_hash=hashlib.sha256(url.encode('utf-8')).hexdigest(),
+            url=url, etag=etag, body=body
+        ))
+    _commit()
+
+
+def get_issue_content_hash(gh_issue_id: int) -> Optional[str]:
+    """Get the hash of the fields last propagated for a mapped issue."""
+    result = db.session.query(IssueMap.content_hash) \
+        .filter(IssueMap.github_issue_id == gh_issue_id) \
+        .first()
+    if isinstance(result, tuple):
+        return result[0]
+    return None
+
+
+def get_comment_content_hash(gh_comment_id: int) -> Optional[str]:
+    """Get the hash of the fields last propagated for a mapped comment."""
+    result = db.session.query(CommentMap.content_hash) \
+        .filter(CommentMap.github_comment_id == gh_comment_id) \
+        .first()
+    if isinstance(result, tuple):
+        return result[0]
+    return None
+
+
+def set_issue_content_hash(gh_issue_id: int, content_hash: str) -> None:
+    db.session.query(IssueMap) \
+        .filter(IssueMap.github_issue_id == gh_issue_id) \
+        .update({IssueMap.content_hash: content_hash},
+                synchronize_session=False)
+    _commit()
+
+
+def set_comment_content_hash(gh_comment_id: int, content_hash: str) -> None:
+    db.session.query(CommentMap) \
+        .filter(CommentMap.github_comment_id == gh_comment_id) \
+        .update({CommentMap.content_hash: content_hash},
+                synchronize_session=False)
+    _commit()
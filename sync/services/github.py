@@ -0,0 +1,80 @@
+"""Minimal client for the parts of the GitHub REST API used by backfill."""
+
+from threading import Lock
+from typing import Any, Dict, Iterator, MutableMapping, Optional, Tuple
+
+import requests
+
+DEFAULT_ENDPOINT = 'https://api.github.com'
+
+
+class GithubService:
+    """
+    Lists repository issues and comments.
+
+    Follows ``Link`` pagination, and makes conditional requests: each page's
+    ``ETag`` and body are kept in ``etags`` and the ETag is sent back as
+    ``If-None-Match``, so that a page that has not changed costs a 304 that
+    does not count against the API rate limit. For this to carry over
+    between runs, pass the stored pages as ``etags`` and store the pages from
+    :meth:`pop_updated` (see :func:`.database.store_github_etags`).
+    """
+
+    def __init__(self, token: Optional[str] = None,
+                 endpoint: str = DEFAULT_ENDPOINT,
+                 session: Optional[requests.Session] = None,
+                 etags: Optional[MutableMapping[str, Tuple[str, Any]]] = None) \
+            -> None:
+        self._endpoint = endpoint.rstrip('/')
+        self._session = session or requests.Session()
+        self._session.headers['Accept'] = 'application/vnd.github.v3+json'
+        if token is not None:
+            self._session.headers['Authorization'] = f'token {token}'
+        self._etags = etags if etags is not None else {}
+        self._updated: Dict[str, Tuple[str, Any]] = {}
+        self._lock = Lock()
+
+    def pop_updated(self) -> Dict[str, Tuple[str, Any]]:
+        """Get the pages fetched afresh since the last call."""
+        with self._lock:
+            updated, self._updated = self._updated, {}
+        return updated
+
+    def get_repository(self, full_name: str) -> dict:
+        repository: dict = self._get(f'{self._endpoint}/repos/{full_name}')[0]
+        return repository
+
+    def list_issues(self, full_name: str) -> Iterator[dict]:
+        """Yield all issues (not pull requests), oldest first."""
+        for issue in self._paginate(f'{self._endpoint}/repos/{full_name}'
+                                    '/issues?state=all&sort=created'
+                                    '&direction=asc&per_page=100'):
+            if 'pull_request' not in issue:
+                yield issue
+
+    def list_comments(self, full_name: str, number: int) -> Iterator[dict]:
+        """Yield the comments on an issue, oldest first."""
+        yield from self._paginate(f'{self._endpoint}/repos/{full_name}'
+                                  f'/issues/{number}/comments?per_page=100')
+
+    def _paginate(self, url: Optional[str]) -> Iterator[dict]:
+        while url is not None:
+            page, url = self._get(url)
+            yield from page
+
+    def _get(self, url: str) -> Tuple[Any, Optional[str]]:
+        with self._lock:
+            cached = self._etags.get(url)
+        headers = {'If-None-Match': cached[0]} if cached else {}
+        response = self._session.get(url, headers=headers)
+        if response.status_code == 304 and cached is not None:
+            body = cached[1]
+        else:
+            response.raise_for_status()
+            body = response.json()
+            if 'ETag' in response.headers:
+                with self._lock:
+                    self._etags[url] = (response.headers['ETag'], body)
+                    self._updated[url] = self._etags[url]
+        next_page = response.links.get('next', {}).get('url')
+        return body, next_page
@@ -1,7 +1,19 @@
+import json
+import time
+from contextlib import contextmanager
+from threading import Lock
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
-from flask import Flask, g, current_app
-from jira import JIRA
+from flask import Flask, current_app
+from jira import JIRA, JIRAError
+from requests import RequestException
+from requests.adapters import HTTPAdapter
 
+from .breaker import CircuitBreaker, CLOSED
+from .ratelimit import RateLimitedAdapter, RateLimited, TokenBucket, \
+    TOO_MANY_REQUESTS
+from .. import metrics
+from ..cache import LRUCache, MISSING
 from ..domain import JiraEvent, JiraEventType
 
 
@@ -9,39 +21,259 @@ class PropagationFailed(Exception):
     """Propagation of the event to Jira failed."""
 
 
+class JiraUnavailable(PropagationFailed):
+    """Jira is failing or unreachable; the event should be retried later."""
+
+
+class JiraMetadata:
+    """
+    Caches Jira metadata used to resolve names to IDs.
+
+    Project components, issue types and workflow transitions are loaded on
+    first use and refreshed after ``ttl`` seconds, so that they can be
+    configured by name without an extra Jira call per event.
+    """
+
+    def __init__(self, client: JIRA, ttl: float = 3600.) -> None:
+        self._client = client
+        self._cache = LRUCache(maxsize=256, ttl=ttl, name='jira_metadata')
+
+    def component_id(self, project: str, name: str) -> Optional[str]:
+        return self._lookup(('components', project), name,
+                            lambda: {c.name: c.id for c in
+                                     self._client.project_components(project)})
+
+    def issuetype_id(self, name: str) -> Optional[str]:
+        return self._lookup(('issuetypes',), name,
+                            lambda: {t.name: t.id for t in
+                                     self._client.issue_types()})
+
+    def transition_id(self, issue_key: str, name: str) -> Optional[str]:
+        """
+        Get the ID of a transition by its name or target status name.
+
+        Transitions are cached per project. Since the transitions available
+        depend on the issue's current status, transitions loaded for
+        ``issue_key`` are merged into what is already known.
+        """
+        key = ('transitions', issue_key.rsplit('-', 1)[0])
+        known = self._cache.get(key)
+        if known is not MISSING and name in known:
+            return known[name]
+        loaded = {} if known is MISSING else dict(known)
+        for transition in self._client.transitions(issue_key):
+            loaded.setdefault(transition['to']['name'], transition['id'])
+            loaded[transition['name']] = transition['id']
+        self._cache.set(key, loaded)
+        return loaded.get(name)
+
+    def invalidate_transitions(self, issue_key: str) -> None:
+        self._cache.invalidate(('transitions', issue_key.rsplit('-', 1)[0]))
+
+    def invalidate(self) -> None:
+        self._cache.clear()
+
+    def _lookup(self, key: tuple, name: str,
+                load: Callable[[], Dict[str, str]]) -> Optional[str]:
+        values = self._cache.get(key)
+        if values is MISSING:
+            values = load()
+            self._cache.set(key, values)
+        return values.get(name)
+
+
 class JiraService:
-    def __init__(self, endpoint: str, username: str, token: str) -> None:
+    def __init__(self, endpoint: str, username: str, token: str,
+                 pool_size: int = 10, timeout: Tuple[float, float] = (5, 30),
+                 max_retries: int = 0, metadata_ttl: float = 3600.,
+                 rate_limit: Optional[TokenBucket] = None,
+                 rate_limit_wait: float = 30.) -> None:
         self._endpoint = endpoint
         self._username = username
         self._token = token
         self._jira = self._new_connection(self._endpoint, self._username,
-                                          self._token)
+                                          self._token, pool_size, timeout,
+                                          max_retries, rate_limit,
+                                          rate_limit_wait)
+        self.metadata = JiraMetadata(self._jira, metadata_ttl)
+        self._users = 0
+        self._closing = False
+        self._users_lock = Lock()
+
+    @contextmanager
+    def in_use(self) -> Iterator['JiraService']:
+        """Use the service for a propagation; :meth:`close` waits for it."""
+        with self._users_lock:
+            self._users += 1
+        try:
+            yield self
+        finally:
+            with self._users_lock:
+                self._users -= 1
+                idle = self._closing and not self._users
+            if idle:
+                self._jira._session.close()
+
+    def close(self) -> None:
+        """
+        Close the connection pool, once the propagations using it end.
+
+        Called when the service is replaced. A call that got the service just
+        before it was replaced still works, as closed pools are reopened.
+        """
+        with self._users_lock:
+            self._closing = True
+            idle = not self._users
+        if idle:
+            self._jira._session.close()
+
+    @property
+    def credentials(self) -> Tuple[str, str, str]:
+        return self._endpoint, self._username, self._token
 
     @staticmethod
-    def _new_connection(endpoint: str, username: str, token: str) -> JIRA:
-        return JIRA(endpoint, basic_auth=(username, token))
+    def _new_connection(endpoint: str, username: str, token: str,
+                        pool_size: int, timeout: Tuple[float, float],
+                        max_retries: int,
+                        rate_limit: Optional[TokenBucket] = None,
+                        rate_limit_wait: float = 30.) -> JIRA:
+        """
+        Create a client backed by a keep-alive connection pool.
+
+        Skips the server-info request that :class:`.JIRA` makes by default,
+        so that no round trip happens until the first real operation. If
+        ``rate_limit`` is given, every request takes a token from it.
+        """
+        client = JIRA(endpoint, basic_auth=(username, token),
+                      get_server_info=False, timeout=timeout,
+                      max_retries=max_retries)
+        adapter: HTTPAdapter
+        if rate_limit is not None:
+            adapter = RateLimitedAdapter(rate_limit, rate_limit_wait,
+                                         pool_connections=1,
+                                         pool_maxsize=pool_size)
+        else:
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        client._session.mount('https://', adapter)
+        client._session.mount('http://', adapter)
+        return client
 
     def create_ticket(self, event: JiraEvent) -> JiraEvent:
-        ticket = self._jira.create_issue(**event['issue'])
+        fields = self._resolve_fields(event['issue'])
+        try:
+            ticket = self._jira.create_issue(**fields)
+        except JIRAError as e:
+            if e.status_code == 400:    # Possibly a stale component/type ID.
+                self.metadata.invalidate()
+            raise
         event['issue']['key'] = ticket.key
         return event
 
+    def create_tickets(self, events: List[JiraEvent]) -> List[JiraEvent]:
+        """
+        Create many tickets with Jira's bulk-create endpoint.
+
+        Sets the issue key on each event whose ticket was created; events
+        that Jira rejected are returned without a key.
+        """
+        results = self._jira.create_issues(
+            [self._resolve_fields(event['issue']) for event in events],
+            prefetch=False
+        )
+        for event, result in zip(events, results):
+            if result['status'] == 'Success':
+                event['issue']['key'] = result['issue'].key
+            else:
+                event['issue'].pop('key', None)
+        return events
+
+    def _resolve_fields(self, issue: dict) -> dict:
+        """Replace component and issue type names with cached IDs."""
+        fields = dict(issue)
+        if fields.get('issuetype', {}).get('name'):
+            type_id = self.metadata.issuetype_id(fields['issuetype']['name'])
+            if type_id is not None:
+                fields['issuetype'] = {'id': type_id}
+        if fields.get('components') and fields.get('project', {}).get('key'):
+            fields['components'] = [
+                self._resolve_component(fields['project']['key'], component)
+                for component in fields['components']
+            ]
+        return fields
+
+    def _resolve_component(self, project: str,
+                           component: Dict[str, str]) -> Dict[str, str]:
+        if 'name' not in component:
+            return component
+        component_id = self.metadata.component_id(project, component['name'])
+        if component_id is None:
+            return component    # Let Jira decide.
+        return {'id': component_id}
+
+    def _mutate(self, method: str, path: str,
+                payload: Optional[dict] = None) -> None:
+        """
+        Send a mutation straight to the Jira REST API.
+
+        This avoids loading the issue or comment resource first, which would
+        double the number of round trips.
+        """
+        url = self._jira._get_url(path)
+        data = json.dumps(payload) if payload is not None else None
+        try:
+            self._jira._session.request(method, url, data=data)
+        except JIRAError as e:
+            if e.status_code == 404:
+                raise PropagationFailed(f'No such resource: {path}') from e
+            raise
+
     def update_ticket(self, event: JiraEvent) -> JiraEvent:
         issue_key = event['issue'].get('key')
         if issue_key is None:
             raise PropagationFailed('Missing issue key')
-        issue = self._jira.issue(issue_key)
-        issue.update(**{k: v for k, v in event['issue'].items() if k != 'key'})
+        fields = {k: v for k, v in event['issue'].items() if k != 'key'}
+        self._mutate('PUT', f'issue/{issue_key}', {'fields': fields})
         return event
 
     def transition_ticket(self, event: JiraEvent) -> None:
         issue_key = event['issue'].get('key')
         if issue_key is None:
             raise PropagationFailed('Missing issue key')
-        issue = self._jira.issue(issue_key)
-        self._jira.transition_issue(issue, event['issue']['status']['id'])
+        status = event['issue']['status']
+        if 'id' in status:
+            self._transition(issue_key, status['id'])
+            return event
+        try:
+            self._transition(issue_key,
+                             self._resolve_transition(issue_key, status))
+        except JIRAError as e:
+            if e.status_code != 400:
+                raise
+            # The cached ID may be stale; reload and try once more.
+            self.metadata.invalidate_transitions(issue_key)
+            try:
+                self._transition(issue_key,
+                                 self._resolve_transition(issue_key, status))
+            except JIRAError as e:
+                if e.status_code != 400:
+                    raise
+                raise PropagationFailed(f'Jira rejected transition'
+                                        f' {status["name"]} for {issue_key}:'
+                                        f' {e.text}') from e
         return event
 
+    def _transition(self, issue_key: str, transition_id: str) -> None:
+        self._mutate('POST', f'issue/{issue_key}/transitions',
+                     {'transition': {'id': transition_id}})
+
+    def _resolve_transition(self, issue_key: str,
+                            status: Dict[str, str]) -> str:
+        transition_id = self.metadata.transition_id(issue_key, status['name'])
+        if transition_id is None:
+            raise PropagationFailed(f'No transition named {status["name"]}'
+                                    f' is available for {issue_key}')
+        return transition_id
+
     def create_comment(self, event: JiraEvent) -> JiraEvent:
         issue_key = event['issue'].get('key')
         if issue_key is None:
@@ -57,8 +289,8 @@ class JiraService:
         comment_id = event['comment'].get('id')
         if comment_id is None:
             raise PropagationFailed('Missing comment id')
-        comment = self._jira.comment(issue_key, comment_id)
-        comment.update(body=event['comment']['body'])
+        self._mutate('PUT', f'issue/{issue_key}/comment/{comment_id}',
+                     {'body': event['comment']['body']})
         return event
 
     def delete_comment(self, event: JiraEvent) -> JiraEvent:
@@ -68,27 +300,140 @@ class JiraService:
         comment_id = event['comment'].get('id')
         if comment_id is None:
             raise PropagationFailed('Missing comment id')
-        comment = self._jira.comment(issue_key, comment_id)
-        comment.delete()
+        self._mutate('DELETE', f'issue/{issue_key}/comment/{comment_id}')
         return event
 
 
 
+_service: Optional[JiraService] = None
+_service_lock = Lock()
+_rate_limit: Optional[TokenBucket] = None
+_breaker: Optional[CircuitBreaker] = None
+
+
+def get_breaker() -> CircuitBreaker:
+    """Get the process-wide circuit breaker for calls to Jira."""
+    global _breaker
+    if _breaker is None:
+        config = current_app.config
+        _breaker = CircuitBreaker(
+            failure_rate=config['JIRA_BREAKER_FAILURE_RATE'],
+            window=config['JIRA_BREAKER_WINDOW'],
+            min_calls=config['JIRA_BREAKER_MIN_CALLS'],
+            reset_timeout=config['JIRA_BREAKER_RESET_TIMEOUT']
+        )
+    return _breaker
+
+
+def is_available() -> bool:
+    """Whether the circuit breaker is closed, i.e. Jira looks healthy."""
+    return get_breaker().state == CLOSED
+
+
+def get_service() -> JiraService:
+    """
+    Get the process-wide :class:`.JiraService`.
+
+    The service is shared by all requests and threads in this process. It is
+    rebuilt if the endpoint or credentials in the app config have changed,
+    e.g. because Vault rotated the Jira token.
+    """
+    global _service, _rate_limit
+    config = current_app.config
+    credentials = (config['JIRA_ENDPOINT'], config['JIRA_USERNAME'],
+                   config['JIRA_TOKEN'])
+    service = _service
+    if service is not None and service.credentials == credentials:
+        return service
+    with _service_lock:
+        if _service is None or _service.credentials != credentials:
+            current_app.logger.debug('Creating new Jira connection')
+            replaced = _service
+            # The bucket outlives the service, so that the learned rate
+            # survives credential rotation.
+            if _rate_limit is None and config['JIRA_RATE_LIMIT'] > 0:
+                _rate_limit = TokenBucket(config['JIRA_RATE_LIMIT'],
+                                          config['JIRA_RATE_LIMIT_BURST'])
+            _service = JiraService(
+                *credentials,
+                pool_size=config['JIRA_POOL_SIZE'],
+                timeout=(config['JIRA_CONNECT_TIMEOUT'],
+                         config['JIRA_READ_TIMEOUT']),
+                max_retries=config['JIRA_MAX_RETRIES'],
+                metadata_ttl=config['JIRA_METADATA_TTL'],
+                rate_limit=_rate_limit,
+                rate_limit_wait=config['JIRA_RATE_LIMIT_MAX_WAIT']
+            )
+            if replaced is not None:
+                replaced.close()
+        return _service
+
+
 def propagate(jira_event: JiraEvent) -> JiraEvent:
     current_app.logger.debug('Propagate Jira event: %s',
                              jira_event['event_type'].name)
-    if 'jira' not in g:
-        config = current_app.config
-        g.jira = JiraService(config['JIRA_ENDPOINT'], config['JIRA_USERNAME'],
-                             config['JIRA_TOKEN'])
     handler = handlers.get(jira_event['event_type'])
     if handler is None:
         current_app.logger.info('Nothing to do for %s', jira_event['event_type'])
         return jira_event    # Nothing to do.
+    operation = handler.__name__
+    breaker = get_breaker()
+    if not breaker.allow():
+        metrics.child(metrics.jira_requests, operation, 'rejected').inc()
+        raise JiraUnavailable('Jira circuit breaker is open')
+    outcome = 'ok'
+    start = time.perf_counter()
+    try:
+        try:
+            service = get_service()
+        except Exception:
+            breaker.record_failure()    # Release a half-open probe.
+            raise
+        with service.in_use():
+            return _call(service, operation, jira_event, breaker)
+    except JiraUnavailable:
+        outcome = 'unavailable'
+        raise
+    except Exception:
+        outcome = 'failed'
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        metrics.child(metrics.stage_seconds, 'jira').observe(elapsed)
+        metrics.child(metrics.jira_seconds, operation).observe(elapsed)
+        metrics.child(metrics.jira_requests, operation, outcome).inc()
+
+
+def _call(service: JiraService, operation: str, jira_event: JiraEvent,
+          breaker: CircuitBreaker) -> JiraEvent:
+    """Call ``service``, recording the outcome with the ``breaker``."""
     try:
-        return getattr(g.jira, handler.__name__)(jira_event)
+        result: JiraEvent = getattr(service, operation)(jira_event)
     except KeyError as e:
+        breaker.record_success()    # Our fault, not Jira's.
         raise PropagationFailed('Missing data') from e
+    except RateLimited as e:
+        breaker.record_failure()
+        raise JiraUnavailable('Rate limited by Jira') from e
+    except JIRAError as e:
+        if e.status_code is None or e.status_code >= 500 \
+                or e.status_code == TOO_MANY_REQUESTS:
+            breaker.record_failure()
+            raise JiraUnavailable(f'Jira error: {e.status_code}') from e
+        breaker.record_success()    # Jira rejected the request.
+        raise PropagationFailed(f'Jira error: {e.status_code}:'
+                                f' {e.text}') from e
+    except RequestException as e:
+        breaker.record_failure()
+        raise JiraUnavailable('Could not reach Jira') from e
+    except PropagationFailed:
+        breaker.record_success()
+        raise
+    except Exception:
+        breaker.record_failure()
+        raise
+    breaker.record_success()
+    return result
 
 
 def init_app(app: Flask) -> None:
@@ -0,0 +1,137 @@
+"""Client-side rate limiting for requests to Jira."""
+
+import time
+from datetime import datetime, timezone
+from threading import Condition
+from typing import Any, Mapping, Optional
+
+from dateutil import parser
+from requests import PreparedRequest, Response
+from requests.adapters import HTTPAdapter
+
+TOO_MANY_REQUESTS = 429
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket with an adaptive refill rate.
+
+    Each request takes one token. The bucket refills at ``rate`` tokens per
+    second up to ``burst`` tokens. When the server says we are going too fast
+    the rate is halved (down to ``min_rate``), and each successful request
+    adds back a twentieth of ``max_rate``, so that the sustained rate settles
+    just under the server's limit.
+    """
+
+    def __init__(self, max_rate: float, burst: float,
+                 min_rate: float = 0.1) -> None:
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._paused_until = 0.
+        self._cond = Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Take a token, waiting up to ``timeout`` seconds for one.
+
+        Returns ``False`` if no token became available in time.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return True
+                wait = max(self._paused_until - now,
+                           (1 - self._tokens) / self.rate, 0.001)
+                if deadline is not None:
+                    if now >= deadline:
+                        return False
+                    wait = min(wait, deadline - now)
+                self._cond.wait(wait)
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for the next ``seconds`` seconds."""
+        with self._cond:
+            self._paused_until = max(self._paused_until,
+                                     time.monotonic() + seconds)
+            self._tokens = 0
+
+    def slow_down(self) -> None:
+        with self._cond:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self) -> None:
+        with self._cond:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+def _retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Get the delay requested by Jira, in seconds, if any."""
+    if 'Retry-After' in headers:
+        try:
+            return max(float(headers['Retry-After']), 0.)
+        except ValueError:
+            pass
+    if headers.get('X-RateLimit-Remaining') == '0' \
+            and 'X-RateLimit-Reset' in headers:
+        try:
+            reset = parser.isoparse(headers['X-RateLimit-Reset'])
+        except (ValueError, OverflowError):
+            return None
+        if reset.tzinfo is None:
+            reset = reset.replace(tzinfo=timezone.utc)
+        return max((reset - datetime.now(timezone.utc)).total_seconds(), 0.)
+    return None
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """
+    Transport adapter that paces requests with a shared :class:`TokenBucket`.
+
+    A 429 response pauses the bucket for the ``Retry-After`` (or
+    ``X-RateLimit-Reset``) interval, slows it down, and the request is sent
+    again. If no token becomes available within ``max_wait`` seconds,
+    :class:`RateLimited` is raised rather than returning the 429, which
+    jira's ``ResilientSession`` would otherwise retry, sleeping up to a
+    minute each time.
+    """
+
+    def __init__(self, bucket: TokenBucket, max_wait: float = 30.,
+                 **kwargs: Any) -> None:
+        super(RateLimitedAdapter, self).__init__(**kwargs)
+        self.bucket = bucket
+        self.max_wait = max_wait
+
+    def send(self, request: PreparedRequest, **kwargs: Any) -> Response:
+        deadline = time.monotonic() + self.max_wait
+        while True:
+            if not self.bucket.acquire(max(deadline - time.monotonic(), 0.)):
+                raise RateLimited('Timed out waiting for Jira rate limit')
+            response = super(RateLimitedAdapter, self).send(request, **kwargs)
+            delay = _retry_after(response.headers)
+            if response.status_code != TOO_MANY_REQUESTS:
+                if delay:
+                    self.bucket.pause(delay)
+                self.bucket.speed_up()
+                return response
+            self.bucket.slow_down()
+            self.bucket.pause(delay if delay is not None else 1.)
+            response.close()
+            if time.monotonic() + (delay or 0.) > deadline:
+                raise RateLimited('Jira asked us to wait too long')
+
+
+class RateLimited(IOError):
+    """No request could be sent to Jira within the allowed wait."""
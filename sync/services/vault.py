@@ -0,0 +1,122 @@
+"""
+Keeps secrets from Vault fresh, off the request path.
+
+At startup the secrets in ``VAULT_REQUESTS`` are loaded into the app config.
+A :class:`SecretRefresher` thread then checks them every
+``VAULT_REFRESH_INTERVAL`` seconds, renewing leases ``VAULT_RENEW_MARGIN``
+seconds before they expire (and fetching secrets without leases again once
+their ``minimum_ttl`` has passed). When a credential changes, the database
+engine and the Jira client are replaced, so requests never wait on Vault.
+"""
+
+from threading import Event, Thread
+from typing import Any, Dict, List, Optional
+
+from flask import Flask
+
+from arxiv.vault.manager import ConfigManager, SecretsManager
+
+from . import database, jira
+from .. import reload
+
+JIRA_CREDENTIALS = frozenset({'JIRA_ENDPOINT', 'JIRA_USERNAME', 'JIRA_TOKEN'})
+
+
+class SecretRefresher:
+    """Refreshes the secrets of an app in a background thread."""
+
+    def __init__(self, app: Flask, source: ConfigManager,
+                 interval: float = 10.) -> None:
+        self.app = app
+        self.source = source
+        self.interval = interval
+        self.secrets: Dict[str, str] = {}
+        """The secrets most recently applied to the app config."""
+        self._stopped = Event()
+        self._thread: Optional[Thread] = None
+
+    def refresh(self) -> List[str]:
+        """
+        Get any new secrets, and apply them to the app.
+
+        Returns
+        -------
+        list
+            The names of the secrets that changed.
+
+        """
+        # Shares the lock of :func:`.reload.reload_config`, which overlays
+        # these secrets, so that neither applies a stale view of the other.
+        with reload.config_lock:
+            fresh = dict(self.source.yield_secrets())
+            changes = {key: value for key, value in fresh.items()
+                       if self.app.config.get(key) != value}
+            connected = bool(self.secrets)
+            self.secrets = fresh
+            if not connected:
+                self.app.config.update(changes)
+            elif changes:
+                self._apply(dict(changes))
+        if changes:
+            self.app.logger.info('Refreshed secrets: %s',
+                                 ', '.join(sorted(changes)))
+        return sorted(changes)
+
+    def _apply(self, changes: Dict[str, Any]) -> None:
+        uri = changes.pop('SQLALCHEMY_DATABASE_URI', None)
+        self.app.config.update(changes)
+        if uri is not None:
+            database.use_database(self.app, uri)
+        if JIRA_CREDENTIALS & changes.keys():
+            with self.app.app_context():
+                jira.get_service()    # Connect now rather than in a request.
+
+    def start(self) -> None:
+        """Start refreshing in a daemon thread, if not already started."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = Thread(target=self._run, name='vault-refresher',
+                              daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                # The current secrets stay valid until their leases expire,
+                # which is at least the renewal margin away.
+                self.app.logger.exception('Could not refresh secrets')
+
+
+def init_app(app: Flask) -> None:
+    """
+    Load secrets from Vault into ``app``, if Vault is enabled.
+
+    The refresher is not started here, since the app may be created before
+    the server forks its workers; see :func:`start`.
+    """
+    if not app.config['VAULT_ENABLED']:
+        return
+    manager = ConfigManager(app.config)
+    manager.secrets = SecretsManager(
+        manager.vault, manager.requests,
+        expiry_margin=app.config['VAULT_RENEW_MARGIN']
+    )
+    refresher = SecretRefresher(app, manager,
+                                app.config['VAULT_REFRESH_INTERVAL'])
+    refresher.refresh()
+    app.extensions['vault'] = refresher
+
+
+def start(app: Flask) -> None:
+    """Start refreshing the secrets of ``app`` in this process."""
+    refresher: Optional[SecretRefresher] = app.extensions.get('vault')
+    if refresher is not None:
+        refresher.start()
@@ -0,0 +1,116 @@
+"""Background worker that drains the ``github_event`` queue into Jira."""
+
+import time
+from concurrent.futures import wait
+from typing import Optional
+
+import prometheus_client
+from flask import Flask, current_app
+
+from . import retry
+from .controllers import MissingParent, propagate_event
+from .domain import GithubEvent
+from .scheduler import LaneScheduler
+from .services import database, jira
+
+
+def drain(batch_size: int, scheduler: Optional[LaneScheduler] = None,
+          coalesce_window: float = 0., retries: bool = False) -> int:
+    """
+    Propagate a batch of queued events to Jira.
+
+    If ``retries`` is set, the batch is made of failed events that are due
+    for another attempt instead of newly queued events, and events that have
+    waited too long for their issue to be mapped, or whose claim lapsed, are
+    scheduled for retry.
+
+    If a ``scheduler`` is given, events are propagated on its lanes keyed by
+    GitHub issue ID: events for the same issue are propagated in the order
+    they were received, while different issues propagate in parallel. The
+    whole batch is finished before returning, so ordering also holds across
+    batches. See :func:`.database.claim_pending_events` for
+    ``coalesce_window``.
+
+    Returns
+    -------
+    int
+        The number of events claimed from the queue.
+
+    """
+    timeout = current_app.config['WORKER_CLAIM_TIMEOUT']
+    if retries:
+        retry.expire_waiting(batch_size)
+        retry.expire_claims(batch_size)
+        claimed = database.claim_retry_events(batch_size, timeout)
+    else:
+        claimed = database.claim_pending_events(batch_size, coalesce_window,
+                                                timeout)
+    if scheduler is None:
+        for event_id, gh_event in claimed:
+            _process(event_id, gh_event, retries)
+    else:
+        futures = [scheduler.submit(gh_event['issue']['id'], _process,
+                                    event_id, gh_event, retries)
+                   for event_id, gh_event in claimed]
+        wait(futures)
+        # Raise as the sequential path does, once the whole batch is done.
+        errors = [future.exception() for future in futures
+                  if future.exception() is not None]
+        for error in errors:
+            current_app.logger.error('Error in propagation lane',
+                                     exc_info=error)
+        if errors:
+            raise errors[0]
+    return len(claimed)
+
+
+def _process(event_id: int, gh_event: GithubEvent,
+             retrying: bool = False) -> None:
+    try:
+        with database.unit_of_work():
+            propagate_event(gh_event)
+            database.set_event_status(event_id, database.DONE)
+    except jira.JiraUnavailable as e:
+        current_app.logger.error('Jira unavailable; releasing event %s: %s',
+                                 event_id, e)
+        if retrying:
+            retry.release(event_id)
+        else:
+            database.release_event(event_id)
+    except KeyError as e:
+        current_app.logger.error('Malformed event %s: %s', event_id, e)
+        database.set_event_status(event_id, database.FAILED)
+    except MissingParent as e:
+        current_app.logger.info('Holding event %s: %s', event_id, e)
+        if not retry.park(event_id, gh_event['issue']['id']):
+            retry.record_failure(event_id, str(e))
+    except jira.PropagationFailed as e:
+        current_app.logger.error('Failed to propagate event %s: %s',
+                                 event_id, e)
+        retry.record_failure(event_id, str(e))
+    except Exception as e:
+        current_app.logger.exception('Error propagating event %s', event_id)
+        database.db.session.rollback()
+        retry.record_failure(event_id, repr(e))
+
+
+def run(app: Flask, retries: bool = False) -> None:
+    """
+    Drain the queue forever, sleeping whenever it is empty.
+
+    With ``retries``, drain failed events that are due for another attempt
+    instead, so that retries do not compete with newly received events.
+    """
+    scheduler = LaneScheduler(app.config['PROPAGATION_LANES'], app)
+    if app.config['WORKER_METRICS_PORT']:
+        prometheus_client.start_http_server(app.config['WORKER_METRICS_PORT'])
+    with app.app_context():
+        database.create_all()
+        batch_size = app.config['WORKER_BATCH_SIZE']
+        interval = app.config['WORKER_POLL_INTERVAL']
+        window = app.config['COALESCE_WINDOW']
+        while True:
+            claimed = drain(batch_size, scheduler, window, retries)
+            if claimed == 0 or not jira.is_available():
+                time.sleep(interval)
+            database.db.session.remove()
@@ -0,0 +1,97 @@
+import os
+import tempfile
+from datetime import datetime
+
+from pytz import UTC
+
+from sync.archive import archive_events, iter_archive, prune_deliveries
+from sync.services import database
+from tests.test_database import DatabaseTestCase
+
+
+class TestArchive(DatabaseTestCase):
+    """Old events are moved to archive files, which can be read back."""
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        for created, status in [(datetime(2019, 5, 31), database.DONE),
+                                (datetime(2019, 6, 1), database.DONE),
+                                (datetime(2019, 6, 2), database.RETRY),
+                                (datetime.now(UTC), database.DONE)]:
+            event_id = database.store_github_event(self.gh_event, status)
+            database.DBGithubEvent.query \
+                .filter(database.DBGithubEvent.event_id == event_id) \
+                .update({database.DBGithubEvent.created: created})
+        database.db.session.commit()
+
+    def tearDown(self):
+        super().tearDown()
+        self.directory.cleanup()
+
+    def test_archive(self):
+        """Finished events are archived by month, and deleted."""
+        self.assertEqual(archive_events(self.directory.name, days=30,
+                                        batch_size=1), 2)
+        self.assertEqual(sorted(os.listdir(self.directory.name)),
+                         ['github_event-2019-05.jsonl.gz',
+                          'github_event-2019-06.jsonl.gz'])
+        statuses = [row.status for row in database.DBGithubEvent.query
+                    .order_by(database.DBGithubEvent.event_id)]
+        self.assertEqual(statuses, [database.RETRY, database.DONE],
+                         'Unfinished and recent events are kept')
+
+        paths = sorted(os.path.join(self.directory.name, name)
+                       for name in os.listdir(self.directory.name))
+        archived = list(iter_archive(paths))
+        self.assertEqual([event_id for event_id, _ in archived], [1, 2])
+        _, gh_event = archived[0]
+        self.assertEqual(gh_event['event_type'], self.gh_event['event_type'])
+        self.assertEqual(gh_event['issue']['updated_at'],
+                         self.gh_event['issue']['updated_at'])
+
+        since = datetime(2019, 6, 1, tzinfo=UTC)
+        self.assertEqual([i for i, _ in iter_archive(paths, since=since)], [2])
+
+    def test_archive_again(self):
+        """Running again appends to the month's archive file."""
+        archive_events(self.directory.name, days=30)
+        database.DBGithubEvent.query.update({
+            database.DBGithubEvent.status: database.DONE
+        })
+        database.db.session.commit()
+        self.assertEqual(archive_events(self.directory.name, days=30), 1)
+        path = os.path.join(self.directory.name,
+                            'github_event-2019-06.jsonl.gz')
+        self.assertEqual([i for i, _ in iter_archive([path])], [2, 3])
+
+    def test_failed_pending_retry(self):
+        """Failed events are kept until they are retried or dead-lettered."""
+        old = datetime(2019, 6, 3)
+        lapsed, malformed = [
+            database.store_github_event(self.gh_event, database.PROCESSING,
+                                        claim_timeout=0)
+            for _ in range(2)
+        ]
+        database.DBGithubEvent.query \
+            .filter(database.DBGithubEvent.event_id.in_([lapsed, malformed])) \
+            .update({database.DBGithubEvent.created: old},
+                    synchronize_session=False)
+        database.db.session.commit()
+        database.set_event_status(malformed, database.FAILED)
+        self.assertEqual(database.claim_stale_events(10), [lapsed])
+
+        archive_events(self.directory.name, days=30)
+        event_ids = [row.event_id for row in database.DBGithubEvent.query]
+        self.assertIn(lapsed, event_ids, 'Still to be retried')
+        self.assertNotIn(malformed, event_ids)
+
+    def test_prune_deliveries(self):
+        """Old delivery records are deleted."""
+        database.claim_delivery('old')
+        database.claim_delivery('new')
+        database.DBDelivery.query.get('old').created = datetime(2019, 6, 1)
+        database.db.session.commit()
+        self.assertEqual(prune_deliveries(days=7, batch_size=1), 1)
+        self.assertEqual([row.delivery_id for row
+                          in database.DBDelivery.query], ['new'])
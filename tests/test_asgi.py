@@ -0,0 +1,179 @@
+import asyncio
+import json
+from collections import Counter
+from unittest import TestCase, mock
+
+import httpx
+
+from benchmarks.fake_jira import FakeJira
+from sync.asgi import create_asgi_app
+from sync.services import async_jira, database, jira
+from tests.test_database import DatabaseTestCase
+
+
+class TestAsyncServing(DatabaseTestCase):
+    """Webhooks are served from an event loop, with a non-blocking client."""
+
+    CONFIG = {'JIRA_USERNAME': 'user', 'JIRA_TOKEN': 'token',
+              'WEBHOOK_TOKEN': 'secret', 'INGEST_MODE': 'sync'}
+    IN_MEMORY = False   # The database is used from a thread pool.
+
+    def setUp(self):
+        super().setUp()
+        self.jira = FakeJira().__enter__()
+        self.app.config['JIRA_ENDPOINT'] = self.jira.endpoint
+        database.store_issue_mapping(self.data['issue']['id'], 'ARXIVNG-1')
+        self.asgi = create_asgi_app(self.app)
+
+    def tearDown(self):
+        self.jira.__exit__()
+        super().tearDown()
+
+    def _post(self, *payloads, token='secret', delivery=None):
+        async def post():
+            transport = httpx.ASGITransport(app=self.asgi)
+            headers = {'X-GitHub-Delivery': delivery} if delivery else {}
+            async with httpx.AsyncClient(transport=transport,
+                                         base_url='http://test') as client:
+                responses = await asyncio.gather(*[
+                    client.post('/issuesevent', params={'token': token},
+                                json=payload, headers=headers)
+                    for payload in payloads
+                ])
+            await self.asgi.get_jira().aclose()
+            return responses
+        return asyncio.run(post())
+
+    def _statuses(self):
+        with self.app.app_context():
+            return [event.status for event
+                    in database.DBGithubEvent.query.all()]
+
+    def test_propagates_concurrently(self):
+        """Concurrent webhooks are written to Jira and stored as done."""
+        edits = [dict(self.data, issue=dict(self.data['issue'],
+                                            body=f'Edit {i}'))
+                 for i in range(10)]
+        responses = self._post(*edits)
+        self.assertEqual([r.status_code for r in responses], [200] * 10)
+        self.assertEqual(self.jira.calls['update_issue'], 10)
+        self.assertEqual(self._statuses(), [database.DONE] * 10)
+
+    def test_serialized_per_issue(self):
+        """Events on one issue are propagated one at a time."""
+        active, peak = Counter(), Counter()
+        propagate = async_jira.propagate
+
+        async def tracked(service, breaker, j_event):
+            key = j_event['issue']['key']
+            active[key] += 1
+            peak[key] = max(peak[key], active[key])
+            try:
+                await asyncio.sleep(0.01)
+                return await propagate(service, breaker, j_event)
+            finally:
+                active[key] -= 1
+
+        edits = [dict(self.data, issue=dict(self.data['issue'],
+                                            body=f'Edit {i}'))
+                 for i in range(5)]
+        with mock.patch.object(async_jira, 'propagate', tracked):
+            self._post(*edits)
+        self.assertEqual(peak, {'ARXIVNG-1': 1})
+        self.assertEqual(self.jira.calls['update_issue'], 5)
+
+    def test_client_replaced(self):
+        """A replaced client is closed once its requests have finished."""
+        async def replace():
+            old = self.asgi.get_jira()
+            with old.in_use():
+                self.app.config['JIRA_TOKEN'] = 'rotated'
+                self.assertIsNot(self.asgi.get_jira(), old)
+                await asyncio.sleep(0)
+                self.assertFalse(old._client.is_closed, 'Still in use')
+            await asyncio.sleep(0)
+            self.assertTrue(old._client.is_closed)
+            await self.asgi.get_jira().aclose()
+        asyncio.run(replace())
+
+    def test_redelivery(self):
+        """A redelivered webhook gets the original response."""
+        first, = self._post(self.data, delivery='abc')
+        second, = self._post(self.data, delivery='abc')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(self.jira.calls['update_issue'], 1)
+
+    def test_jira_unavailable(self):
+        """Events are queued for the worker if Jira fails."""
+        self.jira.error_rate = 1.
+        response, = self._post(self.data)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'result': 'queued'})
+        self.assertEqual(self._statuses(), [database.PENDING])
+
+    def test_bad_token(self):
+        """Webhooks without the right token are refused."""
+        response, = self._post(self.data, token='wrong')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.jira.total_calls, 0)
+
+    def test_other_routes(self):
+        """Other endpoints are served by the Flask app."""
+        async def get():
+            transport = httpx.ASGITransport(app=self.asgi)
+            async with httpx.AsyncClient(transport=transport,
+                                         base_url='http://test') as client:
+                return await client.get('/status')
+        with mock.patch.object(database, 'count_waiting_events') as count:
+            response = asyncio.run(get())
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('jira', response.json())
+        self.assertIn('waiting', response.json())
+        self.assertFalse(count.called, 'Status does not query the database')
+
+
+class TestAsyncTransitions(TestCase):
+    """Transitions are resolved by name, and reloaded if Jira rejects them."""
+
+    def setUp(self):
+        self.transition_ids = ['1']
+        self.posted = []
+
+        def handle(request):
+            if request.method == 'GET':
+                return httpx.Response(200, json={'transitions': [
+                    {'id': self.transition_ids.pop(0), 'name': 'Close',
+                     'to': {'name': 'Done'}}
+                ]})
+            transition_id = json.loads(request.content)['transition']['id']
+            self.posted.append(transition_id)
+            return httpx.Response(400 if transition_id == '1' else 204)
+
+        self.service = async_jira.AsyncJiraService(
+            'http://jira.example.com', 'user', 'token',
+            transport=httpx.MockTransport(handle)
+        )
+        self.event = {'issue': {'key': 'ARXIVNG-1',
+                                'status': {'name': 'Done'}}}
+
+    def _transition(self):
+        async def transition():
+            try:
+                await self.service.transition_ticket(self.event)
+            finally:
+                await self.service.aclose()
+        asyncio.run(transition())
+
+    def test_stale_transition(self):
+        """A rejected transition ID is reloaded, and tried once more."""
+        self.transition_ids.append('2')
+        self._transition()
+        self.assertEqual(self.posted, ['1', '2'])
+
+    def test_transition_rejected(self):
+        """A transition rejected again after reloading is a failure."""
+        self.transition_ids.append('1')
+        with self.assertRaises(jira.PropagationFailed):
+            self._transition()
+        self.assertEqual(self.posted, ['1', '1'])
@@ -0,0 +1,130 @@
+from unittest import mock
+
+from sync.backfill import backfill
+from sync.services import database
+from sync.services.jira import PropagationFailed
+from tests.test_database import DatabaseTestCase
+
+
+def _issue(number, state='open'):
+    return {
+        'id': 1000 + number,
+        'number': number,
+        'title': f'Issue {number}',
+        'body': None,
+        'state': state,
+        'created_at': '2019-01-01T00:00:00Z',
+        'updated_at': '2019-01-02T00:00:00Z',
+        'html_url': f'https://github.com/foo/bar/issues/{number}',
+        'user': {'id': 1, 'login': 'foouser', 'html_url': ''}
+    }
+
+
+def _comment(comment_id):
+    return {
+        'id': comment_id,
+        'body': 'A comment',
+        'created_at': '2019-01-03T00:00:00Z',
+        'updated_at': '2019-01-03T00:00:00Z',
+        'html_url': 'https://github.com/foo/bar/issues/1#issuecomment',
+        'user': {'id': 1, 'login': 'foouser', 'html_url': ''}
+    }
+
+
+class FakeJira:
+    """Stands in for :class:`.JiraService`, numbering tickets in order."""
+
+    def __init__(self):
+        self.bulk_creates = []
+        self.comments = []
+        self.transitions = []
+        self.rejected_comments = set()
+        """Issue keys on which comments are rejected."""
+
+    def create_tickets(self, events):
+        self.bulk_creates.append(len(events))
+        for event in events:
+            event['issue']['key'] = f'ARXIVNG-{event["issue"]["summary"][6:]}'
+        return events
+
+    def create_comment(self, event):
+        if event['issue']['key'] in self.rejected_comments:
+            raise PropagationFailed('Rejected')
+        self.comments.append(event['issue']['key'])
+        event['comment']['id'] = str(len(self.comments))
+        return event
+
+    def transition_ticket(self, event):
+        self.transitions.append(event['issue']['key'])
+        return event
+
+
+class TestBackfill(DatabaseTestCase):
+    """Import existing issues and comments."""
+
+    def setUp(self):
+        super().setUp()
+        self.github = mock.MagicMock()
+        self.github.get_repository.return_value = {'id': 1, 'name': 'bar'}
+        self.github.list_issues.side_effect \
+            = lambda _: iter([_issue(1), _issue(2, 'closed'), _issue(3)])
+        self.github.list_comments.side_effect \
+            = lambda _, number: iter([_comment(number * 10)])
+        self.github.pop_updated.return_value = {}
+        self.jira = FakeJira()
+
+    def test_backfill(self):
+        """Issues are created in bulk, and mappings are stored."""
+        counts = backfill('foo/bar', self.github, self.jira, batch_size=2)
+        self.assertEqual(self.jira.bulk_creates, [2, 1])
+        self.assertEqual(counts['issues_created'], 3)
+        self.assertEqual(counts['comments_created'], 3)
+        self.assertEqual(self.jira.transitions, ['ARXIVNG-2'],
+                         'Closed issue is transitioned')
+        self.assertEqual(database.get_jira_issue_key(1002), 'ARXIVNG-2')
+        self.assertIsNotNone(database.get_jira_comment_id(20))
+        self.assertIsNotNone(database.get_issue_content_hash(1002))
+        self.assertEqual(database.get_backfill_checkpoint('foo/bar'), 3)
+
+    def test_resume(self):
+        """Issues up to the checkpoint, or already mapped, are skipped."""
+        database.set_backfill_checkpoint('foo/bar', 1)
+        database.store_issue_mapping(1002, 'ARXIVNG-2')
+        database.store_comment_mapping(20, '1')
+        counts = backfill('foo/bar', self.github, self.jira)
+        self.assertEqual(self.jira.bulk_creates, [1])
+        self.assertEqual(counts['issues_created'], 1)
+        self.assertEqual(counts['issues_skipped'], 2)
+        self.assertEqual(self.jira.comments, ['ARXIVNG-3'])
+        self.assertEqual(database.get_backfill_checkpoint('foo/bar'), 3)
+
+    def test_failures_hold_checkpoint(self):
+        """The checkpoint stops at the first failure, which is retried."""
+        self.jira.rejected_comments.add('ARXIVNG-2')
+        counts = backfill('foo/bar', self.github, self.jira, batch_size=1)
+        self.assertEqual(counts['comments_failed'], 1)
+        self.assertEqual(database.get_backfill_checkpoint('foo/bar'), 1,
+                         'Stops before the issue whose comment failed')
+        self.assertEqual(database.get_jira_issue_key(1003), 'ARXIVNG-3',
+                         'Later issues are mapped as they are created')
+        self.assertIsNotNone(database.get_jira_comment_id(30))
+
+        self.jira.rejected_comments.clear()
+        counts = backfill('foo/bar', self.github, self.jira, batch_size=1)
+        self.assertEqual(self.jira.bulk_creates, [1, 1, 1],
+                         'No ticket is created twice')
+        self.assertEqual(counts['comments_created'], 1)
+        self.assertEqual(self.jira.comments[-1], 'ARXIVNG-2')
+        self.assertEqual(self.jira.transitions, ['ARXIVNG-2'],
+                         'Transitions are not repeated')
+        self.assertEqual(database.get_backfill_checkpoint('foo/bar'), 3)
+
+    def test_stores_etags(self):
+        """Pages fetched from GitHub are stored after each batch."""
+        self.github.pop_updated.return_value = {
+            'https://api.github.com/repos/foo/bar': ('"abc"', {'id': 1})
+        }
+        backfill('foo/bar', self.github, self.jira)
+        self.assertEqual(database.load_github_etags(), {
+            'https://api.github.com/repos/foo/bar': ('"abc"', {'id': 1})
+        })
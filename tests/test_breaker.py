@@ -0,0 +1,44 @@
+from unittest import TestCase, mock
+
+from sync.services import breaker
+
+
+class TestCircuitBreaker(TestCase):
+    """Behavior of :class:`.breaker.CircuitBreaker`."""
+
+    def setUp(self):
+        self.breaker = breaker.CircuitBreaker(failure_rate=0.5, window=4,
+                                              min_calls=4, reset_timeout=30)
+
+    def test_opens_on_failure_rate(self):
+        """The breaker opens once enough recent calls have failed."""
+        self.breaker.record_success()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow(), 'Too few calls to open')
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, breaker.OPEN)
+        self.assertFalse(self.breaker.allow(), 'Fails fast while open')
+
+    @mock.patch(f'{breaker.__name__}.time')
+    def test_half_open_probe(self, mock_time):
+        """A single probe is allowed after the reset timeout."""
+        mock_time.monotonic.return_value = 100.
+        for _ in range(4):
+            self.breaker.record_failure()
+        self.assertFalse(self.breaker.allow())
+
+        mock_time.monotonic.return_value = 131.
+        self.assertEqual(self.breaker.state, breaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow(), 'Probe is allowed')
+        self.assertFalse(self.breaker.allow(), 'Only one probe at a time')
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, breaker.OPEN,
+                         'Failed probe re-opens the breaker')
+
+        mock_time.monotonic.return_value = 162.
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, breaker.CLOSED,
+                         'Successful probe closes the breaker')
+        self.assertEqual(self.breaker.status()['failures'], 0)
@@ -0,0 +1,54 @@
+from unittest import TestCase, mock
+
+from sync import cache
+from sync.services import database
+from tests.test_database import DatabaseTestCase
+
+
+class TestLRUCache(TestCase):
+    """Behavior of :class:`.cache.LRUCache`."""
+
+    def test_evicts_least_recently_used(self):
+        """The least recently used entry is evicted when full."""
+        lru = cache.LRUCache(maxsize=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIs(lru.get('b'), cache.MISSING, 'b was evicted')
+        self.assertEqual(lru.hits, 2)
+        self.assertEqual(lru.misses, 1)
+
+    @mock.patch(f'{cache.__name__}.time')
+    def test_negative_entries_expire(self, mock_time):
+        """Negative entries expire after ``negative_ttl``."""
+        mock_time.monotonic.return_value = 100.
+        lru = cache.LRUCache(ttl=60, negative_ttl=5)
+        lru.set_missing('a')
+        lru.set('b', 2)
+        self.assertIsNone(lru.get('a'), 'Negative entry is live')
+        mock_time.monotonic.return_value = 106.
+        self.assertIs(lru.get('a'), cache.MISSING, 'Negative entry expired')
+        self.assertEqual(lru.get('b'), 2, 'Positive entry is still live')
+
+
+class TestMappingCache(DatabaseTestCase):
+    """Mapping lookups are served from the cache."""
+
+    def test_store_fills_cache(self):
+        """A stored mapping is returned without querying the database."""
+        self.assertIsNone(database.get_jira_issue_key(1234))
+        database.store_issue_mapping(1234, 'ARXIVNG-1')
+        with mock.patch.object(database.db, 'session') as mock_session:
+            self.assertEqual(database.get_jira_issue_key(1234), 'ARXIVNG-1')
+            self.assertFalse(mock_session.query.called)
+
+    def test_negative_lookup(self):
+        """Unknown IDs are cached as negative entries."""
+        self.assertIsNone(database.get_jira_comment_id(5678))
+        with mock.patch.object(database.db, 'session') as mock_session:
+            self.assertIsNone(database.get_jira_comment_id(5678))
+            self.assertFalse(mock_session.query.called)
+        self.assertEqual(database.comment_ids.hits, 1)
+        self.assertEqual(database.comment_ids.misses, 1)
@@ -1,10 +1,18 @@
 
+import copy
 import json
+from datetime import datetime, timedelta
 from unittest import TestCase, mock
 
+from pytz import UTC
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
 from sync import controllers
+from sync.services import database, jira
 from sync.parse import parse_github_event
 from sync import domain
+from tests.test_database import DatabaseTestCase
 
 
 class TestIssuesEventEdited(TestCase):
@@ -23,6 +31,7 @@ class TestIssuesEventEdited(TestCase):
     def test_handle_event(self, mock_jira, mock_database):
         """Handle the Github event."""
         mock_jira.propagate.side_effect = lambda o: o
+        mock_database.has_earlier_events.return_value = False
         data, code, headers = controllers.handle_issuesevent(self.data)
 
         jira_event, = mock_jira.propagate.call_args[0]
@@ -33,4 +42,172 @@ class TestIssuesEventEdited(TestCase):
                          'Updates Jira issue')
         self.assertEqual(jira_event['issue']['key'],
                          mock_database.get_jira_issue_key.return_value,
-                         'Uses issue key retrieved from database')
\ No newline at end of file
+                         'Uses issue key retrieved from database')
+
+
+class TestRedeliveredEdit(DatabaseTestCase):
+    """The same edit is delivered twice."""
+
+    def setUp(self):
+        """Create an app with an in-memory database and a mapped issue."""
+        super().setUp()
+        database.store_issue_mapping(self.data['issue']['id'], 'ARXIVNG-1')
+
+    @mock.patch(f'{controllers.__name__}.jira')
+    def test_skips_unchanged_content(self, mock_jira):
+        """The second delivery does not write to Jira."""
+        mock_jira.propagate.side_effect = lambda o: o
+        avoided = controllers.counters['jira_writes_avoided']
+        controllers.handle_issuesevent(copy.deepcopy(self.data))
+        controllers.handle_issuesevent(copy.deepcopy(self.data))
+        self.assertEqual(mock_jira.propagate.call_count, 1,
+                         'Jira is only called once')
+        self.assertEqual(controllers.counters['jira_writes_avoided'],
+                         avoided + 1)
+
+        self.data['issue']['body'] = 'Something else entirely'
+        controllers.handle_issuesevent(copy.deepcopy(self.data))
+        self.assertEqual(mock_jira.propagate.call_count, 2,
+                         'Changed content is written')
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_same_content_edited_again(self, mock_propagate):
+        """An edit that leaves the content as it was is not written."""
+        mock_propagate.side_effect = lambda o: o
+        controllers.handle_issuesevent(copy.deepcopy(self.data))
+        self.data['issue']['updated_at'] = '2019-05-16T09:00:00Z'
+        controllers.handle_issuesevent(copy.deepcopy(self.data))
+        self.assertEqual(mock_propagate.call_count, 1)
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_stored_before_propagating(self, mock_propagate):
+        """The event is stored before Jira is called, then marked done."""
+        def propagate(j_event):
+            row = database.DBGithubEvent.query.one()
+            self.assertEqual(row.status, database.PROCESSING)
+            self.assertIsNotNone(row.next_attempt_at, 'Claim can lapse')
+            self.assertFalse(database.db.session.dirty)
+            return j_event
+        mock_propagate.side_effect = propagate
+        controllers.handle_issuesevent(copy.deepcopy(self.data))
+        self.assertTrue(mock_propagate.called)
+        row = database.DBGithubEvent.query.one()
+        self.assertEqual(row.status, database.DONE)
+        self.assertEqual(row.attempts, 1)
+
+
+class TestJiraUnavailable(DatabaseTestCase):
+    """Jira is unavailable when an event arrives in sync mode."""
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_event_is_parked(self, mock_propagate):
+        """The event is queued for the worker and the webhook gets a 202."""
+        mock_propagate.side_effect = jira.JiraUnavailable('down')
+        data, code, headers = controllers.handle_issuesevent(self.data)
+        self.assertEqual(code, 202)
+        row = database.DBGithubEvent.query.one()
+        self.assertEqual(row.status, database.PENDING)
+
+
+class TestRedelivery(DatabaseTestCase):
+    """GitHub redelivers a webhook."""
+
+    CONFIG = {'WEBHOOK_TOKEN': 'footoken'}
+
+    def setUp(self):
+        super().setUp()
+        controllers.recent_deliveries.clear()
+        database.store_issue_mapping(self.data['issue']['id'], 'ARXIVNG-1')
+
+    def _deliver(self, delivery_id):
+        return self.app.test_client().post(
+            '/issuesevent?token=footoken',
+            json=self.data,
+            headers={'X-GitHub-Delivery': delivery_id}
+        )
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_duplicate_delivery(self, mock_propagate):
+        """A redelivered webhook gets the original response."""
+        mock_propagate.side_effect = lambda o: o
+        first = self._deliver('72d3162e-cc78-11e3-81ab-4c9367dc0958')
+        controllers.recent_deliveries.clear()    # e.g. another process.
+        second = self._deliver('72d3162e-cc78-11e3-81ab-4c9367dc0958')
+        self.assertEqual(mock_propagate.call_count, 1, 'Propagated once')
+        self.assertEqual(second.status_code, first.status_code)
+        self.assertEqual(second.get_json(), first.get_json())
+        self.assertEqual(database.DBGithubEvent.query.count(), 1)
+
+        self._deliver('9e0f5b5a-cc78-11e3-81ab-4c9367dc0958')
+        self.assertEqual(database.DBGithubEvent.query.count(), 2,
+                         'A new delivery is handled')
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_recorded_with_event(self, mock_propagate):
+        """The response is stored with the outcome of the event."""
+        mock_propagate.side_effect = lambda o: o
+        commits = []
+        record = commits.append
+        event.listen(Session, 'after_commit', record)
+        try:
+            response = self._deliver('72d3162e-cc78-11e3-81ab-4c9367dc0958')
+        finally:
+            event.remove(Session, 'after_commit', record)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(commits), 3, 'Claim, start and finish')
+        delivery = database.DBDelivery.query.one()
+        self.assertEqual(delivery.status_code, 200)
+        self.assertEqual(delivery.result, response.get_json())
+
+    def test_in_progress(self):
+        """A redelivery of a delivery still being handled gets a 202."""
+        database.claim_delivery('72d3162e-cc78-11e3-81ab-4c9367dc0958')
+        response = self._deliver('72d3162e-cc78-11e3-81ab-4c9367dc0958')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(database.DBGithubEvent.query.count(), 0)
+
+    def test_stale_claim(self):
+        """A claim that was never completed lapses."""
+        delivery_id = '72d3162e-cc78-11e3-81ab-4c9367dc0958'
+        database.claim_delivery(delivery_id)
+        database.DBDelivery.query.get(delivery_id).created = \
+            datetime.now(UTC) - timedelta(hours=1)
+        database.db.session.commit()
+        with mock.patch(f'{jira.__name__}.propagate', side_effect=lambda o: o):
+            response = self._deliver(delivery_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(database.DBGithubEvent.query.count(), 1)
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_released_on_error(self, mock_propagate):
+        """A delivery that fails unexpectedly can be redelivered."""
+        delivery_id = '72d3162e-cc78-11e3-81ab-4c9367dc0958'
+        mock_propagate.side_effect = RuntimeError('Unexpected')
+        self.assertEqual(self._deliver(delivery_id).status_code, 500)
+        mock_propagate.side_effect = lambda o: o
+        self.assertEqual(self._deliver(delivery_id).status_code, 200)
+        self.assertEqual(database.DBGithubEvent.query.count(), 1)
+
+
+class TestIgnoredEvent(DatabaseTestCase):
+    """Received an event that cannot be propagated to Jira."""
+
+    def setUp(self):
+        super().setUp()
+        self.data['action'] = 'labeled'
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_ignored(self, mock_propagate):
+        """The event is accepted without database or Jira I/O."""
+        with mock.patch(f'{controllers.__name__}.database') as mock_database:
+            data, code, headers = controllers.handle_issuesevent(self.data)
+        self.assertEqual(code, 202)
+        self.assertEqual(mock_database.mock_calls, [], 'No database I/O')
+        self.assertFalse(mock_propagate.called, 'Jira is not called')
+
+    def test_audit_mode(self):
+        """Ignored events are stored if auditing is enabled."""
+        self.app.config['AUDIT_ALL_EVENTS'] = True
+        controllers.handle_issuesevent(self.data)
+        row = database.DBGithubEvent.query.one()
+        self.assertEqual(row.status, database.IGNORED)
@@ -0,0 +1,146 @@
+import copy
+import json
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, Dict
+from unittest import TestCase
+
+from sqlalchemy import event
+
+from sync import domain
+from sync.cache import MISSING
+from sync.factory import create_app
+from sync.parse import parse_github_event
+from sync.services import database
+
+
+class DatabaseTestCase(TestCase):
+    """
+    Provides an app context with a fresh database, and an example event.
+
+    ``data`` is the raw webhook payload, and ``gh_event`` the event parsed
+    from a copy of it.
+    """
+
+    EXAMPLE = 'tests/data/github/issuesevent/edited.json'
+    CONFIG: Dict[str, Any] = {}
+    """Settings applied to the app before the database is created."""
+    IN_MEMORY = True
+    """Set to ``False`` to use a file, if other threads use the database."""
+
+    def setUp(self):
+        with open(self.EXAMPLE) as f:
+            self.data = json.load(f)
+        self.gh_event = parse_github_event(domain.GithubEventType.IssuesEvent,
+                                           copy.deepcopy(self.data))
+        self.app = create_app()
+        self.app.config.update(self.CONFIG)
+        if not self.IN_MEMORY:
+            fd, self.path = tempfile.mkstemp(suffix='.db')
+            os.close(fd)
+            self.app.config['SQLALCHEMY_DATABASE_URI'] \
+                = f'sqlite:///{self.path}'
+        self.ctx = self.app.app_context()
+        self.ctx.push()
+        database.create_all()
+
+    def tearDown(self):
+        database.db.session.remove()
+        database.db.drop_all()
+        self.ctx.pop()
+        if not self.IN_MEMORY:
+            os.remove(self.path)
+
+
+class TestUnitOfWork(DatabaseTestCase):
+    """Writes in a unit of work are committed together."""
+
+    def test_single_commit(self):
+        """The event and mapping are written in one transaction."""
+        commits = []
+        event.listen(database.db.session(), 'after_commit', commits.append)
+        with database.unit_of_work():
+            database.store_github_event(self.gh_event)
+            database.store_issue_mapping(1234, 'ARXIVNG-1')
+            self.assertIs(database.issue_keys.get(1234), MISSING,
+                          'Cache is not filled before commit')
+        self.assertEqual(len(commits), 1, 'Commits once')
+        self.assertEqual(database.DBGithubEvent.query.count(), 1)
+        self.assertEqual(database.get_jira_issue_key(1234), 'ARXIVNG-1')
+
+    def test_rollback(self):
+        """Nothing is written if the unit of work fails."""
+        with self.assertRaises(RuntimeError):
+            with database.unit_of_work():
+                database.store_github_event(self.gh_event)
+                database.store_issue_mapping(1234, 'ARXIVNG-1')
+                raise RuntimeError('nope')
+        self.assertEqual(database.DBGithubEvent.query.count(), 0)
+        self.assertIsNone(database.get_jira_issue_key(1234))
+
+
+class TestBulkStore(DatabaseTestCase):
+    """Many events can be stored at once."""
+
+    def test_store_github_events(self):
+        """All events are stored with a single insert."""
+        self.assertEqual(database.store_github_events([self.gh_event] * 3), 3)
+        rows = database.DBGithubEvent.query.all()
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[0].payload['issue']['id'],
+                         self.gh_event['issue']['id'])
+
+
+class TestCompressedPayload(DatabaseTestCase):
+    """Event bodies are projected and compressed."""
+
+    def test_projected(self):
+        """Only the fields that we use are stored, and read back."""
+        database.store_github_event(self.gh_event)
+        row = database.DBGithubEvent.query.one()
+        self.assertIsNone(row.body)
+        self.assertNotIn('sender', row.payload)
+        self.assertEqual(set(row.payload['repository']), {'id', 'name'})
+        gh_event = database._load_github_event(row)
+        self.assertEqual(gh_event['event_type'], self.gh_event['event_type'])
+        self.assertEqual(gh_event['issue']['created_at'],
+                         self.gh_event['issue']['created_at'])
+
+    def test_migrate(self):
+        """Events stored uncompressed can be converted."""
+        database.db.session.execute(
+            database.DBGithubEvent.__table__.insert(),
+            [{'event_type': 'IssuesEvent', 'event_action': 'edited',
+              'body': self.gh_event, 'status': database.DONE}] * 3
+        )
+        database.db.session.commit()
+        self.assertEqual(database.compress_event_bodies(batch_size=2), 2)
+        self.assertEqual(database.compress_event_bodies(batch_size=2), 1)
+        self.assertEqual(database.compress_event_bodies(batch_size=2), 0)
+        for row in database.DBGithubEvent.query.all():
+            self.assertIsNone(row.body)
+            self.assertNotIn('sender', row.payload)
+
+    def test_add_missing_columns(self):
+        """Columns added to a model are added to an existing table."""
+        database.db.session.execute(
+            'ALTER TABLE github_event DROP COLUMN payload'
+        )
+        self.assertEqual(database.add_missing_columns(),
+                         ['github_event.payload'])
+        self.assertEqual(database.add_missing_columns(), [])
+
+
+class TestPartitions(TestCase):
+    """The MySQL monthly partition layout."""
+
+    def test_monthly_partitions(self):
+        """Partitions are bounded by the first day of the next month."""
+        ddl = database.monthly_partitions_ddl(datetime(2019, 11, 15), 3)
+        self.assertIn('ADD PRIMARY KEY (event_id, created)', ddl)
+        self.assertIn("PARTITION p201911 VALUES LESS THAN"
+                      " (TO_DAYS('2019-12-01'))", ddl)
+        self.assertIn("PARTITION p202001 VALUES LESS THAN"
+                      " (TO_DAYS('2020-02-01'))", ddl)
+        self.assertIn('PARTITION pmax VALUES LESS THAN MAXVALUE', ddl)
@@ -0,0 +1,59 @@
+from unittest import TestCase, mock
+
+from requests import Response
+
+from sync.services.github import GithubService
+
+
+def _response(status_code, body=None, etag=None, next_page=None):
+    response = mock.MagicMock(spec=Response)
+    response.status_code = status_code
+    response.json.return_value = body
+    response.headers = {'ETag': etag} if etag else {}
+    response.links = {'next': {'url': next_page}} if next_page else {}
+    return response
+
+
+class TestGithubService(TestCase):
+    """Issues and comments are listed with conditional, paginated requests."""
+
+    def setUp(self):
+        self.session = mock.MagicMock(headers={})
+        self.github = GithubService('token', 'https://api.example.com',
+                                    session=self.session)
+
+    def test_list_issues(self):
+        """Pages are followed, and pull requests left out."""
+        self.session.get.side_effect = [
+            _response(200, [{'number': 1}, {'number': 2, 'pull_request': {}}],
+                      next_page='https://api.example.com/page2'),
+            _response(200, [{'number': 3}])
+        ]
+        issues = list(self.github.list_issues('foo/bar'))
+        self.assertEqual([issue['number'] for issue in issues], [1, 3])
+        self.assertEqual(self.session.headers['Authorization'], 'token token')
+        self.assertEqual(self.session.get.call_args[0][0],
+                         'https://api.example.com/page2')
+
+    def test_not_modified(self):
+        """A page that has not changed is served from the stored pages."""
+        url = 'https://api.example.com/repos/foo/bar/issues/1/comments' \
+              '?per_page=100'
+        github = GithubService(session=self.session,
+                               endpoint='https://api.example.com',
+                               etags={url: ('"abc"', [{'id': 10}])})
+        self.session.get.return_value = _response(304)
+        self.assertEqual(list(github.list_comments('foo/bar', 1)),
+                         [{'id': 10}])
+        self.assertEqual(self.session.get.call_args[1]['headers'],
+                         {'If-None-Match': '"abc"'})
+        self.assertEqual(github.pop_updated(), {}, 'Nothing to store')
+
+    def test_pop_updated(self):
+        """Pages fetched afresh are handed out once, to be stored."""
+        self.session.get.return_value = _response(200, {'id': 1}, etag='"x"')
+        self.github.get_repository('foo/bar')
+        self.assertEqual(self.github.pop_updated(), {
+            'https://api.example.com/repos/foo/bar': ('"x"', {'id': 1})
+        })
+        self.assertEqual(self.github.pop_updated(), {})
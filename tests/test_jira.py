@@ -0,0 +1,240 @@
+import json
+from unittest import TestCase, mock
+
+from flask import Flask
+from jira import JIRAError
+
+from sync import domain
+from sync.services import jira
+
+
+class TestGetService(TestCase):
+    """The Jira client is shared across requests in a process."""
+
+    def setUp(self):
+        """Configure a minimal app."""
+        self.app = Flask(__name__)
+        self.app.config.from_pyfile('../sync/config.py')
+        self.app.config.update(JIRA_ENDPOINT='https://jira.example.com',
+                               JIRA_USERNAME='foo', JIRA_TOKEN='bar')
+        jira._service = None
+
+    @mock.patch(f'{jira.__name__}.JIRA')
+    def test_reuses_service(self, mock_JIRA):
+        """The same service is returned for consecutive requests."""
+        with self.app.app_context():
+            first = jira.get_service()
+        with self.app.app_context():
+            second = jira.get_service()
+        self.assertIs(first, second, 'Service is reused')
+        self.assertEqual(mock_JIRA.call_count, 1, 'Client is created once')
+        self.assertFalse(mock_JIRA.call_args[1]['get_server_info'],
+                         'Does not request server info')
+
+    @mock.patch(f'{jira.__name__}.JIRA')
+    def test_credentials_rotated(self, mock_JIRA):
+        """A new service is created when the credentials change."""
+        with self.app.app_context():
+            first = jira.get_service()
+            self.app.config['JIRA_TOKEN'] = 'baz'
+            second = jira.get_service()
+        self.assertIsNot(first, second, 'Service is replaced')
+        self.assertEqual(second.credentials,
+                         ('https://jira.example.com', 'foo', 'baz'))
+
+    @mock.patch(f'{jira.__name__}.JIRA')
+    def test_replaced_service_closed(self, mock_JIRA):
+        """A replaced service is closed once its calls have finished."""
+        first_client, second_client = mock.MagicMock(), mock.MagicMock()
+        mock_JIRA.side_effect = [first_client, second_client]
+        with self.app.app_context():
+            first = jira.get_service()
+            with first.in_use():
+                self.app.config['JIRA_TOKEN'] = 'baz'
+                jira.get_service()
+                self.assertFalse(first_client._session.close.called,
+                                 'Still in use')
+            first_client._session.close.assert_called_once()
+            self.assertFalse(second_client._session.close.called)
+
+
+class TestMutations(TestCase):
+    """Mutations go straight to the REST API without a prior fetch."""
+
+    def setUp(self):
+        self.service = jira.JiraService('https://jira.example.com', 'foo',
+                                        'bar')
+        self.service._jira._session = mock.MagicMock()
+        self.session = self.service._jira._session
+
+    def test_update_ticket(self):
+        """Updating a ticket sends a single PUT."""
+        self.service.update_ticket({
+            'event_type': domain.JiraEventType.issue_update,
+            'issue': {'key': 'ARXIVNG-1', 'summary': 'Foo'}
+        })
+        self.assertEqual(self.session.request.call_count, 1)
+        method, url = self.session.request.call_args[0]
+        self.assertEqual(method, 'PUT')
+        self.assertTrue(url.endswith('/rest/api/2/issue/ARXIVNG-1'))
+        self.assertEqual(json.loads(self.session.request.call_args[1]['data']),
+                         {'fields': {'summary': 'Foo'}})
+
+    def test_delete_missing_comment(self):
+        """A 404 from the mutation is a propagation failure."""
+        self.session.request.side_effect = JIRAError(status_code=404)
+        with self.assertRaises(jira.PropagationFailed):
+            self.service.delete_comment({
+                'event_type': domain.JiraEventType.comment_delete,
+                'issue': {'key': 'ARXIVNG-1'},
+                'comment': {'id': '42'}
+            })
+        method, url = self.session.request.call_args[0]
+        self.assertEqual(method, 'DELETE')
+        self.assertTrue(url.endswith('/issue/ARXIVNG-1/comment/42'))
+
+
+class TestCreateTickets(TestCase):
+    """Tickets are created in bulk, and rejected ones are reported."""
+
+    def setUp(self):
+        self.service = jira.JiraService('https://jira.example.com', 'foo',
+                                        'bar')
+        self.service._jira = mock.MagicMock()
+        self.service.metadata = mock.MagicMock()
+        self.service.metadata.issuetype_id.return_value = '3'
+
+    def _event(self, summary):
+        return {
+            'event_type': domain.JiraEventType.issue_create,
+            'issue': {'project': {'key': 'ARXIVNG'}, 'summary': summary,
+                      'issuetype': {'name': 'Task'}}
+        }
+
+    def test_create_tickets(self):
+        """Keys are set on the events whose tickets were created."""
+        self.service._jira.create_issues.return_value = [
+            {'status': 'Success', 'issue': mock.MagicMock(key='ARXIVNG-1')},
+            {'status': 'Error', 'error': 'Nope', 'issue': None}
+        ]
+        created, rejected = self.service.create_tickets(
+            [self._event('Foo'), self._event('Bar')]
+        )
+        self.assertEqual(created['issue']['key'], 'ARXIVNG-1')
+        self.assertNotIn('key', rejected['issue'])
+        fields, = self.service._jira.create_issues.call_args[0]
+        self.assertEqual(fields[0]['issuetype'], {'id': '3'},
+                         'Issue type names are resolved')
+        self.assertFalse(self.service._jira.create_issues.call_args[1]
+                         ['prefetch'], 'Created issues are not fetched')
+
+
+class TestMetadata(TestCase):
+    """Names are resolved to IDs from cached Jira metadata."""
+
+    TRANSITIONS = [{'id': '151', 'name': 'Close', 'to': {'name': 'Done'}}]
+
+    def setUp(self):
+        self.service = jira.JiraService('https://jira.example.com', 'foo',
+                                        'bar')
+        self.client = mock.MagicMock()
+        self.client.transitions.return_value = self.TRANSITIONS
+        self.service.metadata = jira.JiraMetadata(self.client)
+        self.service._jira._session = mock.MagicMock()
+        self.session = self.service._jira._session
+        self.event = {
+            'event_type': domain.JiraEventType.issue_transition,
+            'issue': {'key': 'ARXIVNG-1', 'status': {'name': 'Done'}}
+        }
+
+    def test_transition_by_name(self):
+        """Transitions are resolved once per project."""
+        self.service.transition_ticket(self.event)
+        self.event['issue']['key'] = 'ARXIVNG-2'
+        self.service.transition_ticket(self.event)
+        self.assertEqual(self.client.transitions.call_count, 1,
+                         'Transitions are loaded once')
+        payload = json.loads(self.session.request.call_args[1]['data'])
+        self.assertEqual(payload, {'transition': {'id': '151'}})
+
+    def test_stale_transition(self):
+        """A rejected transition ID is reloaded and retried."""
+        self.service.transition_ticket(self.event)
+        self.client.transitions.return_value = [
+            {'id': '171', 'name': 'Close', 'to': {'name': 'Done'}}
+        ]
+        self.session.request.side_effect = [JIRAError(status_code=400), None]
+        self.service.transition_ticket(self.event)
+        self.assertEqual(self.client.transitions.call_count, 2)
+        payload = json.loads(self.session.request.call_args[1]['data'])
+        self.assertEqual(payload, {'transition': {'id': '171'}})
+
+    def test_transition_rejected(self):
+        """A transition rejected again after reloading is a failure."""
+        self.session.request.side_effect = JIRAError(status_code=400)
+        with self.assertRaises(jira.PropagationFailed):
+            self.service.transition_ticket(self.event)
+        self.assertEqual(self.session.request.call_count, 2)
+
+    def test_component_by_name(self):
+        """Component names are resolved to IDs when creating tickets."""
+        component = mock.MagicMock(id='16000')
+        component.name = 'Search'
+        self.client.project_components.return_value = [component]
+        self.client.issue_types.return_value = []
+        self.service._jira = mock.MagicMock()
+        self.service.create_ticket({
+            'event_type': domain.JiraEventType.issue_create,
+            'issue': {'project': {'key': 'ARXIVNG'},
+                      'issuetype': {'name': 'Task'},
+                      'components': [{'name': 'Search'}]}
+        })
+        fields = self.service._jira.create_issue.call_args[1]
+        self.assertEqual(fields['components'], [{'id': '16000'}])
+        self.assertEqual(fields['issuetype'], {'name': 'Task'},
+                         'Unknown names are passed through')
+
+
+class TestPropagate(TestCase):
+    """Failures are reported to the breaker and as propagation failures."""
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.app.config.from_pyfile('../sync/config.py')
+        self.app.config.update(JIRA_ENDPOINT='https://jira.example.com',
+                               JIRA_USERNAME='foo', JIRA_TOKEN='bar',
+                               JIRA_BREAKER_MIN_CALLS=1,
+                               JIRA_BREAKER_RESET_TIMEOUT=0)
+        self.event = {'event_type': domain.JiraEventType.issue_update,
+                      'issue': {'key': 'ARXIVNG-1', 'summary': 'Foo'}}
+        jira._service = None
+        jira._breaker = None
+
+    def tearDown(self):
+        jira._service = None
+        jira._breaker = None
+
+    @mock.patch(f'{jira.__name__}.get_service')
+    def test_rejected(self, mock_get_service):
+        """A 4xx from Jira is a propagation failure, not an outage."""
+        mock_get_service.return_value.update_ticket.side_effect = \
+            JIRAError(status_code=400, text='Field cannot be set')
+        with self.app.app_context():
+            with self.assertRaises(jira.PropagationFailed):
+                jira.propagate(self.event)
+            self.assertEqual(jira.get_breaker().state, 'closed')
+
+    @mock.patch(f'{jira.__name__}.get_service')
+    def test_no_service(self, mock_get_service):
+        """A failure to build the client ends a half-open probe."""
+        mock_get_service.side_effect = RuntimeError('No endpoint')
+        with self.app.app_context():
+            breaker = jira.get_breaker()
+            breaker.record_failure()    # Opens; half-open at once.
+            with self.assertRaises(RuntimeError):
+                jira.propagate(self.event)
+            mock_get_service.side_effect = None
+            mock_get_service.return_value.update_ticket.return_value = \
+                self.event
+            jira.propagate(self.event)
+            self.assertEqual(breaker.state, 'closed', 'Next probe closes it')
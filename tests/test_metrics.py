@@ -0,0 +1,83 @@
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase, mock
+
+from prometheus_client import REGISTRY
+
+from sync import metrics
+from sync.services import jira
+from tests.test_database import DatabaseTestCase
+
+
+class TestCounts(TestCase):
+    """Ad-hoc counts are exported as Prometheus counters."""
+
+    def test_increments(self):
+        """Increases are exported; decreases are not."""
+        counts = metrics.Counts(metrics.outcomes)
+        before = REGISTRY.get_sample_value('sync_outcomes_total',
+                                           {'outcome': 'test_count'}) or 0
+        counts['test_count'] += 1
+        counts.update({'test_count': 2})
+        counts.clear()
+        counts['test_count'] += 1
+        self.assertEqual(REGISTRY.get_sample_value(
+            'sync_outcomes_total', {'outcome': 'test_count'}), before + 4)
+
+
+class TestMetricsEndpoint(DatabaseTestCase):
+    """Stage latencies and counts are exposed at ``/metrics``."""
+
+    CONFIG = {'WEBHOOK_TOKEN': 'foo'}
+
+    def setUp(self):
+        super().setUp()
+        self.client = self.app.test_client()
+
+    @mock.patch(f'{jira.__name__}.get_service')
+    def test_metrics(self, mock_get_service):
+        """Each stage of handling a webhook is timed."""
+        mock_get_service.return_value.update_ticket.side_effect = lambda e: e
+        self.client.post('/issuesevent?token=foo', json=self.data)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.get_data(as_text=True)
+        self.assertIn('sync_events_total{action="edited",'
+                      'event_type="IssuesEvent"}', body)
+        for stage in ('webhook', 'parse', 'translate', 'database', 'jira'):
+            self.assertIn(f'sync_stage_seconds_count{{stage="{stage}"}}',
+                          body)
+        self.assertIn('sync_jira_requests_total{operation="update_ticket",'
+                      'outcome="ok"}', body)
+        self.assertIn('sync_cache_requests_total{cache="issue_keys",'
+                      'result="miss"}', body)
+
+
+class TestMultiprocess(TestCase):
+    """Values recorded by several processes are added up."""
+
+    def test_aggregate(self):
+        with tempfile.TemporaryDirectory() as directory:
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory)
+            record = ('from sync import metrics;'
+                      ' metrics.child(metrics.outcomes, "x").inc()')
+            for _ in range(2):
+                subprocess.run([sys.executable, '-c', record], env=env,
+                               check=True)
+            report = ('from sync import metrics;'
+                      ' print(metrics.exposition()[0].decode())')
+            result = subprocess.run([sys.executable, '-c', report], env=env,
+                                    check=True, stdout=subprocess.PIPE)
+        self.assertIn('sync_outcomes_total{outcome="x"} 2.0',
+                      result.stdout.decode())
+
+    def test_missing_directory(self):
+        """Entry-points other than the servers create the directory."""
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'metrics')
+            env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=path)
+            subprocess.run([sys.executable, 'migrate.py'], env=env,
+                           check=True, stdout=subprocess.DEVNULL)
+            self.assertTrue(os.listdir(path), 'Database timings recorded')
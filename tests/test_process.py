@@ -30,10 +30,8 @@ class TestIssuesEventEdited(TestCase):
         self.assertEqual(jira_event['issue']['key'], issue_key,
                          'Uses provided issue key')
 
-
-
-
-
-
-
-
+    def test_content_only(self):
+        """Edits do not re-route the issue."""
+        jira_event = process.translate(self.event, issue_key='ARXIVNG-1234')
+        self.assertEqual(set(jira_event['issue']),
+                         {'key', 'summary', 'description'})
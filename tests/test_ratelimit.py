@@ -0,0 +1,78 @@
+from io import BytesIO
+from unittest import TestCase, mock
+
+from requests import Response
+from requests.adapters import HTTPAdapter
+
+from sync.services import ratelimit
+
+
+def _response(status_code, **headers):
+    response = Response()
+    response.status_code = status_code
+    response.raw = BytesIO()
+    response.headers.update(headers)
+    return response
+
+
+class TestTokenBucket(TestCase):
+    """Behavior of :class:`.ratelimit.TokenBucket`."""
+
+    def test_burst(self):
+        """Only ``burst`` requests can be made at once."""
+        bucket = ratelimit.TokenBucket(max_rate=1, burst=2)
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertTrue(bucket.acquire(timeout=0))
+        self.assertFalse(bucket.acquire(timeout=0.01))
+
+    def test_adapts_rate(self):
+        """The rate is halved on overload and recovers gradually."""
+        bucket = ratelimit.TokenBucket(max_rate=10, burst=1)
+        bucket.slow_down()
+        self.assertEqual(bucket.rate, 5)
+        bucket.speed_up()
+        self.assertEqual(bucket.rate, 5.5)
+
+    def test_pause(self):
+        """No tokens are handed out while paused."""
+        bucket = ratelimit.TokenBucket(max_rate=100, burst=10)
+        bucket.pause(60)
+        self.assertFalse(bucket.acquire(timeout=0.01))
+
+
+class TestRateLimitedAdapter(TestCase):
+    """Requests are paced, and 429s are retried after Retry-After."""
+
+    @mock.patch.object(HTTPAdapter, 'send')
+    def test_retry_after(self, mock_send):
+        """A 429 pauses the bucket and the request is sent again."""
+        mock_send.side_effect = [_response(429, **{'Retry-After': '0.05'}),
+                                 _response(200)]
+        bucket = ratelimit.TokenBucket(max_rate=100, burst=10)
+        adapter = ratelimit.RateLimitedAdapter(bucket, max_wait=5)
+        response = adapter.send(mock.MagicMock())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(mock_send.call_count, 2)
+        self.assertLess(bucket.rate, 100, 'Rate was reduced')
+
+    @mock.patch.object(HTTPAdapter, 'send')
+    def test_gives_up(self, mock_send):
+        """Jira's 429 is not returned, as the jira client would retry it."""
+        mock_send.return_value = _response(429, **{'Retry-After': '120'})
+        bucket = ratelimit.TokenBucket(max_rate=100, burst=10)
+        adapter = ratelimit.RateLimitedAdapter(bucket, max_wait=1)
+        with self.assertRaises(ratelimit.RateLimited):
+            adapter.send(mock.MagicMock())
+        self.assertEqual(mock_send.call_count, 1)
+
+    def test_rate_limit_reset(self):
+        """The reset time is parsed from an ISO 8601 timestamp."""
+        delay = ratelimit._retry_after({
+            'X-RateLimit-Remaining': '0',
+            'X-RateLimit-Reset': '2999-01-01T00:00Z'
+        })
+        self.assertGreater(delay, 0)
+        self.assertIsNone(ratelimit._retry_after({
+            'X-RateLimit-Remaining': '0',
+            'X-RateLimit-Reset': 'soon'
+        }))
@@ -0,0 +1,76 @@
+import os
+import tempfile
+from unittest import TestCase, mock
+
+from sync import domain, reload
+from sync.factory import create_app
+
+
+class TestReloadConfig(TestCase):
+    """Configuration is resolved at startup, and reloaded on demand."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.py')
+        os.close(fd)
+        self._write('')
+        self.environ = mock.patch.dict(os.environ, {'CONFIG_FILE': self.path,
+                                                    'WEBHOOK_TOKEN': 'secret'})
+        self.environ.start()
+        self.app = create_app()
+
+    def tearDown(self):
+        self.environ.stop()
+        os.remove(self.path)
+
+    def _write(self, content):
+        with open(self.path, 'w') as f:
+            f.write(content)
+
+    def test_changed_settings(self):
+        """Only settings that differ are changes."""
+        self.assertEqual(
+            reload.changed_settings({'A': 1, 'B': 2}, {'A': 1, 'B': 3,
+                                                       'C': None, 'd': 4}),
+            {'B': 3, 'C': None}
+        )
+
+    def test_applies_changes(self):
+        """Changed settings are applied, and the router is recompiled."""
+        event = {'event_type': domain.GithubEventActionType.issue_edited,
+                 'repository': {'name': 'arxiv-docs'}}
+        self.assertTrue(self.app.extensions['event_router'].accepts(event))
+
+        self._write("EVENT_DENY = 'arxiv-docs:issue_edited'\nLOGLEVEL = 10\n")
+        changed = reload.reload_config(self.app)
+        self.assertEqual(changed, ['EVENT_DENY', 'LOGLEVEL'])
+        self.assertEqual(self.app.logger.level, 10)
+        self.assertFalse(self.app.extensions['event_router'].accepts(event))
+        self.assertEqual(reload.reload_config(self.app), [],
+                         'Nothing changes the second time')
+
+    def test_admin_endpoint(self):
+        """The admin endpoint reloads; request data never reaches config."""
+        before = dict(self.app.config)
+        client = self.app.test_client()
+        response = client.post('/admin/reload?token=secret',
+                               headers={'X-Jira-Token': 'nope'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json, {'changed': []})
+        self.assertEqual(dict(self.app.config), before)
+        self.assertNotIn('HTTP_X_JIRA_TOKEN', self.app.config)
+
+    @mock.patch.object(reload, 'uwsgi')
+    def test_uwsgi_fan_out(self, mock_uwsgi):
+        """Under uWSGI, the endpoint signals every worker to reload."""
+        self.assertTrue(reload.register_uwsgi_signal(self.app))
+        signum, target, handler = mock_uwsgi.register_signal.call_args[0]
+        self.assertEqual(target, 'workers')
+
+        response = self.app.test_client().post('/admin/reload?token=secret')
+        self.assertEqual(response.status_code, 202)
+        mock_uwsgi.signal.assert_called_once_with(signum)
+
+        self._write('LOGLEVEL = 10\n')
+        handler(signum)     # As each worker does.
+        self.assertEqual(self.app.config['LOGLEVEL'], 10)
+
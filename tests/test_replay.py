@@ -0,0 +1,65 @@
+import copy
+from unittest import mock
+
+from sync import domain, replay
+from sync.parse import parse_github_event
+from sync.scheduler import LaneScheduler
+from sync.services import database, jira
+from tests.test_database import DatabaseTestCase
+
+
+def _propagate(j_event):
+    if j_event['event_type'] is domain.JiraEventType.issue_create:
+        j_event['issue']['key'] = 'ARXIVNG-1'
+    return j_event
+
+
+class TestReplay(DatabaseTestCase):
+    """Stored events can be streamed and propagated again."""
+
+    IN_MEMORY = False   # Lanes run on their own threads.
+
+    def setUp(self):
+        super().setUp()
+        opened = dict(copy.deepcopy(self.data), action='opened')
+        database.store_github_events([
+            parse_github_event(domain.GithubEventType.IssuesEvent, opened),
+            self.gh_event
+        ])
+
+    def test_keyset_pages(self):
+        """Events are streamed in order, a page at a time, within bounds."""
+        database.store_github_events(
+            [event for _, event in database.iter_github_events()] * 2
+        )
+        ids = [i for i, _ in database.iter_github_events(page_size=2)]
+        self.assertEqual(ids, [1, 2, 3, 4, 5, 6])
+        ids = [i for i, _ in database.iter_github_events(2, 4, page_size=2)]
+        self.assertEqual(ids, [2, 3, 4])
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_dry_run(self, mock_propagate):
+        """A dry run reports the Jira calls without making them."""
+        steps = list(replay.plan(database.iter_github_events()))
+        self.assertEqual([step['call'] for step in steps],
+                         ['create_ticket', 'update_ticket'])
+        self.assertFalse(mock_propagate.called, 'Jira is not called')
+        self.assertIsNone(database.get_jira_issue_key(444500041))
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_replay(self, mock_propagate):
+        """Events are propagated in order, and not applied twice."""
+        mock_propagate.side_effect = _propagate
+        scheduler = LaneScheduler(2, self.app)
+        counts = replay.replay(database.iter_github_events(), scheduler)
+        self.assertEqual(counts[replay.APPLIED], 2)
+        types = [call[0][0]['event_type']
+                 for call in mock_propagate.call_args_list]
+        self.assertEqual(types, [domain.JiraEventType.issue_create,
+                                 domain.JiraEventType.issue_update])
+        self.assertEqual(database.get_jira_issue_key(444500041), 'ARXIVNG-1')
+
+        counts = replay.replay(database.iter_github_events(), scheduler)
+        self.assertEqual(counts, {replay.ALREADY_MAPPED: 1,
+                                  replay.UNCHANGED: 1})
+        scheduler.shutdown()
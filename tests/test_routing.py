@@ -0,0 +1,46 @@
+from unittest import TestCase
+
+from sync import routing
+from sync.domain import GithubEventActionType
+from sync.process import event_translators
+
+
+def _event(repository, event_type):
+    return {'repository': {'name': repository}, 'event_type': event_type}
+
+
+class TestEventRouter(TestCase):
+    """Events are accepted or ignored using the compiled routing table."""
+
+    def test_untranslatable(self):
+        """Events without a translator are ignored."""
+        router = routing.EventRouter(event_translators)
+        self.assertTrue(router.accepts(
+            _event('arxiv-search', GithubEventActionType.issue_opened)
+        ))
+        self.assertFalse(router.accepts(
+            _event('arxiv-search', GithubEventActionType.issue_labeled)
+        ))
+
+    def test_allow_and_deny(self):
+        """Allow and deny rules are applied per repository and action."""
+        router = routing.EventRouter(
+            event_translators,
+            allow=routing.parse_rules('arxiv-search:*,*:issue_opened'),
+            deny=routing.parse_rules('arxiv-search:comment_deleted')
+        )
+        accepts = [
+            ('arxiv-search', GithubEventActionType.comment_created, True),
+            ('arxiv-search', GithubEventActionType.comment_deleted, False),
+            ('arxiv-search', GithubEventActionType.issue_labeled, False),
+            ('arxiv-browse', GithubEventActionType.issue_opened, True),
+            ('arxiv-browse', GithubEventActionType.issue_edited, False),
+        ]
+        for repository, event_type, expected in accepts:
+            self.assertEqual(router.accepts(_event(repository, event_type)),
+                             expected, f'{repository}:{event_type.name}')
+
+    def test_bad_rule(self):
+        """Unknown event names are rejected when the rules are parsed."""
+        with self.assertRaises(ValueError):
+            routing.parse_rules('arxiv-search:issue_exploded')
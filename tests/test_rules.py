@@ -0,0 +1,76 @@
+import json
+import tempfile
+from unittest import TestCase
+
+from sync import rules
+from sync.domain import GithubEventActionType
+
+
+def _event(repository, event_type, *labels):
+    return {'repository': {'name': repository},
+            'issue': {'labels': [{'name': label} for label in labels]},
+            'event_type': event_type}
+
+
+class TestRouteTable(TestCase):
+    """Routes are looked up in the compiled rules."""
+
+    DEFAULTS = {'project': 'ARXIVNG', 'issuetype': 'Task',
+                'component': None, 'assignee': None}
+
+    def setUp(self):
+        self.table = rules.RouteTable(self.DEFAULTS, [
+            {'repository': 'arxiv-search', 'component': 'Search'},
+            {'label': 'bug', 'issuetype': 'Bug'},
+            {'repository': 'arxiv-docs', 'project': 'DOCS'},
+            {'repository': 'arxiv-docs', 'label': 'bug', 'assignee': 'jdoe'},
+            {'action': 'issue_opened', 'issuetype': 'Story'},
+        ])
+
+    def test_defaults(self):
+        """An event matching no rules gets the defaults."""
+        route = self.table.lookup(
+            _event('arxiv-browse', GithubEventActionType.issue_edited)
+        )
+        self.assertEqual(route, self.DEFAULTS)
+
+    def test_specificity(self):
+        """More specific rules override less specific ones."""
+        route = self.table.lookup(
+            _event('arxiv-docs', GithubEventActionType.issue_opened, 'bug')
+        )
+        self.assertEqual(route, {'project': 'DOCS', 'issuetype': 'Bug',
+                                 'component': None, 'assignee': 'jdoe'})
+        route = self.table.lookup(
+            _event('arxiv-search', GithubEventActionType.issue_opened)
+        )
+        self.assertEqual(route['issuetype'], 'Story')
+        self.assertEqual(route['component'], 'Search')
+
+    def test_invalid_rules(self):
+        """Malformed rules are rejected when compiled."""
+        for rule in [{'repository': 'arxiv-search'},
+                     {'action': 'issue_exploded', 'project': 'FOO'},
+                     {'repository': 'arxiv-search', 'colour': 'blue'}]:
+            with self.assertRaises(rules.InvalidRules):
+                rules.RouteTable(self.DEFAULTS, [rule])
+
+
+class TestCompileRules(TestCase):
+    """Rules are compiled from the app config and rules file."""
+
+    def test_compile_rules(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({'defaults': {'project': 'SYNC'},
+                       'rules': [{'label': 'bug', 'issuetype': 'Bug'}]}, f)
+            f.flush()
+            table = rules.compile_rules({
+                'JIRA_PROJECT': 'ARXIVNG',
+                'JIRA_ISSUETYPE': 'Task',
+                'JIRA_COMPONENTS': {'arxiv-search': '16000'},
+                'ROUTING_RULES': f.name
+            })
+        route = table.lookup(_event('arxiv-search',
+                                    GithubEventActionType.issue_opened, 'bug'))
+        self.assertEqual(route, {'project': 'SYNC', 'issuetype': 'Bug',
+                                 'component': '16000', 'assignee': None})
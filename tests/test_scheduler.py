@@ -0,0 +1,58 @@
+import time
+from threading import Event
+from unittest import TestCase
+
+from prometheus_client import REGISTRY
+
+from sync.scheduler import LaneScheduler
+
+
+class TestLaneScheduler(TestCase):
+    """Work is ordered per key and parallel across keys."""
+
+    def setUp(self):
+        self.scheduler = LaneScheduler(4)
+
+    def tearDown(self):
+        self.scheduler.shutdown()
+
+    def test_same_key_is_ordered(self):
+        """Work with the same key runs in submission order."""
+        results = []
+
+        def work(i):
+            time.sleep(0.01 * (5 - i))
+            results.append(i)
+
+        futures = [self.scheduler.submit(1234, work, i) for i in range(5)]
+        for future in futures:
+            future.result()
+        self.assertEqual(results, [0, 1, 2, 3, 4])
+
+    def test_different_keys_are_parallel(self):
+        """A blocked key does not hold up work on other lanes."""
+        release = Event()
+        keys = [k for k in range(100) if self.scheduler.lane_for(k) != 0]
+        blocked = self.scheduler.submit(0, release.wait, 5)
+        other = self.scheduler.submit(keys[0], lambda: 'done')
+        self.assertEqual(other.result(timeout=1), 'done')
+        self.assertEqual(self.scheduler.depths()[0], 1, 'Lane 0 is busy')
+        release.set()
+        blocked.result()
+
+    def test_depth_gauge(self):
+        """Lane depths are exported to Prometheus."""
+        release = Event()
+        lane = str(self.scheduler.lane_for(0))
+        before = REGISTRY.get_sample_value('sync_lane_depth', {'lane': lane})
+        blocked = self.scheduler.submit(0, release.wait, 5)
+        self.assertEqual(REGISTRY.get_sample_value('sync_lane_depth',
+                                                   {'lane': lane}),
+                         (before or 0) + 1)
+        release.set()
+        blocked.result()
+        time.sleep(0.01)    # Callbacks run after the result is set.
+        self.assertEqual(REGISTRY.get_sample_value('sync_lane_depth',
+                                                   {'lane': lane}),
+                         before or 0)
+
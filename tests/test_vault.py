@@ -0,0 +1,130 @@
+import os
+import tempfile
+import time
+from collections import Counter
+from functools import partial
+from types import SimpleNamespace
+from unittest import TestCase, mock
+
+from arxiv.vault.domain import Secret, SecretRequest, now
+from arxiv.vault.manager import SecretsManager
+
+from sync import reload
+from sync.factory import create_app
+from sync.services import database, jira
+from sync.services.vault import SecretRefresher
+
+
+class FakeVault:
+    """Stands in for :class:`arxiv.vault.core.Vault`, with generic secrets."""
+
+    def __init__(self, values):
+        self.values = values
+        self.calls = Counter()
+        self.available = True
+
+    def is_authenticated(self):
+        return True
+
+    def authenticate(self, kube_token, role):
+        self.calls['authenticate'] += 1
+
+    def generic(self, path, key, mount_point='secret/'):
+        self.calls['generic'] += 1
+        if not self.available:
+            raise ConnectionError('Vault is down')
+        return Secret(self.values[key], now(), f'lease-{key}', 0, False)
+
+
+def _request(name, key):
+    return SecretRequest.factory('generic', name=name, mount_point='secret/',
+                                 path='issue-sync', key=key, minimum_ttl=0)
+
+
+class TestSecretRefresher(TestCase):
+    """Secrets are refreshed in the background, and rotated atomically."""
+
+    def setUp(self):
+        self.paths = []
+        for _ in range(2):
+            fd, path = tempfile.mkstemp(suffix='.db')
+            os.close(fd)
+            self.paths.append(path)
+        self.vault = FakeVault({'db': f'sqlite:///{self.paths[0]}',
+                                'token': 'first'})
+        manager = SecretsManager(self.vault, [
+            _request('SQLALCHEMY_DATABASE_URI', 'db'),
+            _request('JIRA_TOKEN', 'token')
+        ])
+        self.app = create_app()
+        self.app.config['JIRA_ENDPOINT'] = 'http://jira.example.com'
+        self.app.config['JIRA_USERNAME'] = 'user'
+        self.refresher = SecretRefresher(
+            self.app,
+            SimpleNamespace(yield_secrets=partial(manager.yield_secrets,
+                                                  'kube-token', 'role')),
+            interval=0.01
+        )
+        self.refresher.refresh()
+
+    def tearDown(self):
+        self.refresher.stop()
+        for path in self.paths:
+            os.remove(path)
+
+    def _rotate(self):
+        self.vault.values = {'db': f'sqlite:///{self.paths[1]}',
+                             'token': 'second'}
+
+    def test_rotates_credentials(self):
+        """New credentials replace the database engine and Jira client."""
+        with self.app.app_context():
+            database.create_all()
+            old_engine = database.db.get_engine(self.app)
+            self.assertEqual(jira.get_service().credentials[2], 'first')
+
+        self.assertEqual(self.refresher.refresh(), [], 'Nothing changed')
+        self._rotate()
+        with mock.patch.object(old_engine, 'dispose') as mock_dispose:
+            changed = self.refresher.refresh()
+        self.assertEqual(changed, ['JIRA_TOKEN', 'SQLALCHEMY_DATABASE_URI'])
+        mock_dispose.assert_called_once()
+
+        with self.app.app_context():
+            engine = database.db.get_engine(self.app)
+            self.assertIsNot(engine, old_engine)
+            self.assertEqual(engine.url.database, self.paths[1])
+            self.assertEqual(jira.get_service().credentials[2], 'second')
+
+    def test_reload_sees_new_secrets(self):
+        """Config reloaded while secrets are applied overlays the new ones."""
+        self.app.extensions['vault'] = self.refresher
+        self._rotate()
+        seen = []
+
+        def use_database(app, uri):
+            seen.append(reload.load_config(app)['JIRA_TOKEN'])
+        with mock.patch.object(database, 'use_database', use_database):
+            self.refresher.refresh()
+        self.assertEqual(seen, ['second'])
+        self.assertTrue(reload.config_lock.acquire(blocking=False),
+                        'Lock is released')
+        reload.config_lock.release()
+
+    def test_refreshes_in_background(self):
+        """The refresher thread applies changes, and survives failures."""
+        self.vault.available = False
+        self.refresher.start()
+        calls = self.vault.calls['generic']
+        while self.vault.calls['generic'] == calls:
+            time.sleep(0.01)
+        self.assertEqual(self.app.config['JIRA_TOKEN'], 'first',
+                         'Secrets are kept while Vault is down')
+
+        self._rotate()
+        self.vault.available = True
+        deadline = time.monotonic() + 5
+        while self.app.config['JIRA_TOKEN'] != 'second' \
+                and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.app.config['JIRA_TOKEN'], 'second')
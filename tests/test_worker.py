@@ -0,0 +1,285 @@
+import copy
+from datetime import datetime
+from unittest import TestCase, mock
+
+from sync import controllers, worker, domain, retry
+from sync.scheduler import LaneScheduler
+from sync.services import database, jira
+from tests.test_database import DatabaseTestCase
+
+
+class TestAsyncIngest(DatabaseTestCase):
+    """Events are queued by the webhook and propagated by the worker."""
+
+    CONFIG = {'INGEST_MODE': 'async'}
+
+    @mock.patch(f'{controllers.__name__}.jira')
+    def test_enqueue_and_drain(self, mock_jira):
+        """The webhook returns 202 and the worker propagates the event."""
+        mock_jira.propagate.side_effect = lambda o: o
+        data, code, headers = controllers.handle_issuesevent(self.data)
+        self.assertEqual(code, 202, 'Event is accepted')
+        self.assertFalse(mock_jira.propagate.called, 'Jira is not called')
+
+        row = database.DBGithubEvent.query.one()
+        self.assertEqual(row.status, database.PENDING)
+
+        self.assertEqual(worker.drain(10), 1, 'One event is claimed')
+        jira_event, = mock_jira.propagate.call_args[0]
+        self.assertEqual(jira_event['event_type'],
+                         domain.JiraEventType.issue_update)
+
+        row = database.DBGithubEvent.query.one()
+        self.assertEqual(row.status, database.DONE)
+        self.assertEqual(row.attempts, 1)
+        self.assertEqual(worker.drain(10), 0, 'Queue is empty')
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_failed_propagation(self, mock_propagate):
+        """A failed propagation is retried, then dead-lettered."""
+        self.app.config.update(RETRY_MAX_ATTEMPTS=2, RETRY_BASE_DELAY=0)
+        mock_propagate.side_effect = jira.PropagationFailed('nope')
+        controllers.handle_issuesevent(self.data)
+        worker.drain(10)
+        row = database.DBGithubEvent.query.one()
+        self.assertEqual(row.status, database.RETRY)
+        self.assertEqual(row.last_error, 'nope')
+
+        self.assertEqual(worker.drain(10), 0, 'Not a new event')
+        self.assertEqual(worker.drain(10, retries=True), 1, 'Retried')
+        row = database.DBGithubEvent.query.one()
+        self.assertEqual(row.status, database.DEAD)
+        letter, = database.list_dead_letters()
+        self.assertEqual(letter['attempts'], 2)
+
+        mock_propagate.side_effect = lambda o: o
+        self.assertTrue(database.requeue_dead_letter(row.event_id))
+        self.assertEqual(worker.drain(10), 1, 'Requeued event is propagated')
+        self.assertEqual(database.DBGithubEvent.query.one().status,
+                         database.DONE)
+        self.assertEqual(database.list_dead_letters(), [])
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_jira_unavailable(self, mock_propagate):
+        """Events are returned to the queue while Jira is unavailable."""
+        mock_propagate.side_effect = jira.JiraUnavailable('down')
+        controllers.handle_issuesevent(self.data)
+        worker.drain(10)
+        row = database.DBGithubEvent.query.one()
+        self.assertEqual(row.status, database.PENDING)
+        self.assertEqual(row.attempts, 0, 'Attempt is not counted')
+
+    @mock.patch(f'{worker.__name__}._process')
+    def test_lane_error(self, mock_process):
+        """Errors on the lanes are raised once the batch is done."""
+        mock_process.side_effect = RuntimeError('Database is gone')
+        controllers.handle_issuesevent(copy.deepcopy(self.data))
+        scheduler = LaneScheduler(2, self.app)
+        try:
+            with self.assertRaises(RuntimeError):
+                worker.drain(10, scheduler)
+        finally:
+            scheduler.shutdown()
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_unexpected_error(self, mock_propagate):
+        """An unexpected error schedules a retry."""
+        mock_propagate.side_effect = RuntimeError('Surprise')
+        controllers.handle_issuesevent(self.data)
+        worker.drain(10)
+        row = database.DBGithubEvent.query.one()
+        self.assertEqual(row.status, database.RETRY)
+        self.assertIn('Surprise', row.last_error)
+
+    def test_lapsed_claim(self):
+        """Events left processing by a dead worker are retried."""
+        controllers.handle_issuesevent(copy.deepcopy(self.data))
+        database.claim_pending_events(10, timeout=-1)    # ...and die.
+        self.assertEqual(retry.expire_claims(10), 1)
+        row = database.DBGithubEvent.query.one()
+        self.assertEqual(row.status, database.RETRY)
+
+        other = copy.deepcopy(self.data)
+        other['issue']['id'] += 1
+        controllers.handle_issuesevent(other)
+        self.assertEqual(len(database.claim_pending_events(10)), 1)
+        self.assertEqual(retry.expire_claims(10), 0, 'Claim is current')
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_retry_released(self, mock_propagate):
+        """A retry is put off while Jira is unavailable, and not counted."""
+        self.app.config.update(RETRY_BASE_DELAY=0)
+        mock_propagate.side_effect = jira.PropagationFailed('nope')
+        controllers.handle_issuesevent(copy.deepcopy(self.data))
+        worker.drain(10)
+        self.app.config.update(RETRY_BASE_DELAY=60)
+        mock_propagate.side_effect = jira.JiraUnavailable('down')
+        self.assertEqual(worker.drain(10, retries=True), 1)
+        row = database.DBGithubEvent.query.one()
+        self.assertEqual(row.status, database.RETRY)
+        self.assertEqual(row.attempts, 1, 'Attempt is not counted')
+        self.assertEqual(worker.drain(10, retries=True), 0, 'Not yet due')
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_deferred_behind_retry(self, mock_propagate):
+        """New events on an issue wait for its retries."""
+        mock_propagate.side_effect = jira.PropagationFailed('nope')
+        controllers.handle_issuesevent(copy.deepcopy(self.data))
+        worker.drain(10)
+        mock_propagate.side_effect = lambda o: o
+        controllers.handle_issuesevent(copy.deepcopy(self.data))
+        self.assertEqual(worker.drain(10), 0, 'Held behind the retry')
+
+        database.schedule_retry(1, 'nope', 0)    # Now due.
+        self.assertEqual(worker.drain(10, retries=True), 1)
+        self.assertEqual(worker.drain(10), 1, 'Released by the retry')
+
+
+class TestSyncIngest(DatabaseTestCase):
+    """Webhooks propagate events themselves, unless the issue is busy."""
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_held_behind_retry(self, mock_propagate):
+        """A newer edit is not overwritten by the retry of an older one."""
+        summaries = []
+
+        def propagate(j_event):
+            summaries.append(j_event['issue']['summary'])
+            if len(summaries) == 1:
+                raise jira.PropagationFailed('nope')
+            return j_event
+        mock_propagate.side_effect = propagate
+        for title in ('old', 'new'):
+            data = copy.deepcopy(self.data)
+            data['issue']['title'] = title
+            controllers.handle_issuesevent(data)
+        self.assertEqual(summaries, ['old'], 'New edit waits for the retry')
+        statuses = [row.status for row in database.DBGithubEvent.query
+                    .order_by(database.DBGithubEvent.event_id)]
+        self.assertEqual(statuses, [database.RETRY, database.PENDING])
+
+        database.schedule_retry(1, 'nope', 0)    # Now due.
+        self.assertEqual(worker.drain(10, retries=True), 1)
+        self.assertEqual(worker.drain(10), 1)
+        self.assertEqual(summaries, ['old', 'old', 'new'])
+
+
+class TestCoalesceEdits(DatabaseTestCase):
+    """Bursts of queued edits are collapsed into the latest one."""
+
+    CONFIG = {'INGEST_MODE': 'async'}
+
+    def setUp(self):
+        super().setUp()
+        for title in ('one', 'two', 'three'):
+            data = copy.deepcopy(self.data)
+            data['issue']['title'] = title
+            controllers.handle_issuesevent(data)
+
+    @mock.patch(f'{controllers.__name__}.jira')
+    def test_debounce(self, mock_jira):
+        """Edits are held while the issue is still being edited."""
+        self.assertEqual(worker.drain(10, coalesce_window=60), 0)
+        self.assertFalse(mock_jira.propagate.called)
+
+        database.DBGithubEvent.query.update({
+            database.DBGithubEvent.created: datetime(2019, 1, 1)
+        })
+        database.db.session.commit()
+        self.assertEqual(worker.drain(10, coalesce_window=60), 1)
+        jira_event, = mock_jira.propagate.call_args[0]
+        self.assertEqual(jira_event['issue']['summary'], 'three',
+                         'Only the latest edit is propagated')
+        statuses = [row.status for row in database.DBGithubEvent.query
+                    .order_by(database.DBGithubEvent.event_id)]
+        self.assertEqual(statuses[:2], [database.SUPERSEDED] * 2)
+
+    def _enqueue(self, action, issue_id=None):
+        data = copy.deepcopy(self.data)
+        data['action'] = action
+        if issue_id is not None:
+            data['issue']['id'] = issue_id
+        controllers.handle_issuesevent(data)
+
+    def _claimed_actions(self, limit):
+        return [(event['issue']['id'], event['action']) for _, event
+                in database.claim_pending_events(limit, coalesce_window=60)]
+
+    def test_order_kept(self):
+        """Events behind a held edit of the same issue are held too."""
+        self._enqueue('closed')
+        self.assertEqual(self._claimed_actions(10), [])
+
+    def test_held_rows_skipped(self):
+        """Held edits at the head of the queue do not use up the batch."""
+        self._enqueue('closed', issue_id=1)
+        self._enqueue('closed', issue_id=2)
+        self.assertEqual(self._claimed_actions(1), [(1, 'closed')])
+        self.assertEqual(self._claimed_actions(1), [(2, 'closed')])
+
+
+class TestWaitForIssue(DatabaseTestCase):
+    """Comments that arrive before their issue is mapped are held."""
+
+    CONFIG = {'INGEST_MODE': 'async'}
+
+    def setUp(self):
+        super().setUp()
+        self.data['action'] = 'created'
+        self.data['comment'] = {
+            'id': 1234,
+            'body': 'A comment',
+            'created_at': '2019-06-01T00:00:00Z',
+            'updated_at': '2019-06-01T00:00:00Z',
+            'html_url': 'https://github.com/foo/bar/issues/1#issuecomment',
+            'user': {'id': 1, 'login': 'foouser', 'html_url': ''}
+        }
+        self.issue_id = self.data['issue']['id']
+        database.waiting_counts.clear()
+        controllers.handle_issuecommentevent(self.data)
+
+    def _status(self):
+        return database.DBGithubEvent.query.one().status
+
+    @mock.patch(f'{jira.__name__}.propagate')
+    def test_released_by_mapping(self, mock_propagate):
+        """A held comment is queued again once its issue is mapped."""
+        mock_propagate.side_effect = lambda o: dict(o, comment={'id': '1'})
+        worker.drain(10)
+        self.assertEqual(self._status(), database.WAITING)
+        self.assertFalse(mock_propagate.called, 'Jira is not called')
+
+        database.store_issue_mapping(self.issue_id, 'ARXIVNG-1')
+        self.assertEqual(self._status(), database.PENDING)
+        self.assertEqual(worker.drain(10), 1)
+        self.assertEqual(self._status(), database.DONE)
+        jira_event, = mock_propagate.call_args[0]
+        self.assertEqual(jira_event['issue']['key'], 'ARXIVNG-1')
+        self.assertEqual(database.waiting_counts,
+                         {'parked': 1, 'released': 1})
+
+    def test_full(self):
+        """Comments are retried with backoff when too many are held."""
+        self.app.config['WAITING_MAX_EVENTS'] = 0
+        worker.drain(10)
+        self.assertEqual(self._status(), database.RETRY)
+        self.assertEqual(database.waiting_counts['overflowed'], 1)
+
+    def test_timeout(self):
+        """Comments that wait too long are retried with backoff."""
+        self.app.config['WAITING_TIMEOUT'] = 0
+        worker.drain(10)
+        self.assertEqual(self._status(), database.WAITING)
+        worker.drain(10, retries=True)
+        self.assertEqual(self._status(), database.RETRY)
+        self.assertEqual(database.waiting_counts['expired'], 1)
+
+
+class TestBackoff(TestCase):
+    """Retry delays grow exponentially, with jitter."""
+
+    def test_backoff(self):
+        for attempts, low, high in [(1, 5, 10), (3, 20, 40), (10, 50, 100)]:
+            delay = retry.backoff(attempts, base=10, cap=100)
+            self.assertGreaterEqual(delay, low)
+            self.assertLessEqual(delay, high)
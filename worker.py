@@ -0,0 +1,27 @@
+"""
+Queue worker entry-point.
+
+``python worker.py`` propagates newly queued events (see ``INGEST_MODE``;
+in either mode some events are queued); ``python worker.py --retries``
+retries failed events with backoff.
+``SIGHUP`` reloads the configuration.
+"""
+
+import argparse
+
+from sync.factory import create_app
+from sync.services import vault
+from sync import reload, worker
+
+
+__flask_app__ = create_app()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--retries', action='store_true',
+                        help='retry failed events instead of new ones')
+    args = parser.parse_args()
+    reload.install_signal_handler(__flask_app__)
+    vault.start(__flask_app__)
+    worker.run(__flask_app__, retries=args.retries)
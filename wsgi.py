@@ -1,17 +1,31 @@
-"""Web Server Gateway Interface entry-point."""
+"""
+Web Server Gateway Interface entry-point.
+
+Configuration is resolved once, in :func:`.create_app`. To pick up changes,
+gracefully reload the workers (``SIGHUP`` to the uWSGI master), or reload
+every worker in place with ``POST /admin/reload`` (see :mod:`sync.reload`).
+"""
 
 from sync.factory import create_app
-import os
+from sync.services import vault
+from sync import metrics, reload
+
+try:
+    from uwsgidecorators import postfork
+except ImportError:     # Not running under uWSGI.
+    postfork = None
 
 
+# This module is loaded once in the uWSGI master, before workers are forked.
+metrics.reset_multiprocess_directory()
 __flask_app__ = create_app()
+reload.register_uwsgi_signal(__flask_app__)
 
+# Threads do not survive the fork, so each worker starts its own refresher.
+if postfork is not None:
+    postfork(lambda: vault.start(__flask_app__))
+else:
+    vault.start(__flask_app__)
 
-def application(environ, start_response):
-    """WSGI application factory."""
-    for key, value in environ.items():
-        if key == 'SERVER_NAME':    # This will only confuse Flask.
-            continue
-        os.environ[key] = str(value)
-        __flask_app__.config[key] = value
-    return __flask_app__(environ, start_response)
+application = __flask_app__
+"""WSGI application."""